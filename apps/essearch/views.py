@@ -152,8 +152,10 @@ def sync_data(request):
                     cursor.execute("""
                         SELECT ft.full_text
                         FROM full_text_1 ft
-                        JOIN pages p ON ft.full_text_id = p.full_text_id_list
+                        JOIN page_fulltext pf ON pf.full_text_id = ft.full_text_id
+                        JOIN pages p ON p.page_id = pf.page_id
                         WHERE p.doc_id = %s
+                        ORDER BY p.page_number, p.page_type, pf.ordinal
                     """, (doc_id,))
 
                     full_text_rows = cursor.fetchall()
@@ -335,8 +337,10 @@ def sync_incremental_data(request):
                         cursor.execute("""
                             SELECT ft.full_text
                             FROM full_text_1 ft
-                            JOIN pages p ON ft.full_text_id = p.full_text_id_list
+                            JOIN page_fulltext pf ON pf.full_text_id = ft.full_text_id
+                            JOIN pages p ON p.page_id = pf.page_id
                             WHERE p.doc_id = %s
+                            ORDER BY p.page_number, p.page_type, pf.ordinal
                         """, (doc_id,))
 
                         full_text_rows = cursor.fetchall()
@@ -932,7 +936,9 @@ def variant_search(query, filters=None):
 
                 # 获取page_id和title_id
                 cursor.execute("""
-                    SELECT p.page_id, p.title_id, p.page_type, p.full_text_id_list
+                    SELECT p.page_id, p.title_id, p.page_type,
+                           (SELECT pf.full_text_id FROM page_fulltext pf
+                            WHERE pf.page_id = p.page_id ORDER BY pf.ordinal LIMIT 1) AS full_text_id
                     FROM pages p
                     WHERE p.doc_id = %s AND p.page_number = %s
                     LIMIT 1
@@ -1111,16 +1117,13 @@ def api_sync_data(request):
             success = sync_incremental_data(request)
 
         if success:
-            conn = connect_db()
-            with conn.cursor() as cursor:
+            with connect_db() as conn, conn.cursor() as cursor:
                 cursor.execute("SELECT COUNT(*) FROM documents")
                 mysql_count = cursor.fetchone()[0]
 
                 es_stats = es.count(index=INDEX_NAME)
                 es_count = es_stats["count"]
 
-            conn.close()
-
             return JsonResponse({
                 "success": True,
                 "message": f"数据同步成功，MySQL有{mysql_count}个文档，ES索引有{es_count}个文档",
@@ -1162,7 +1165,7 @@ def get_database_info(request):
 
             cursor.execute("""
                 SELECT COUNT(*) FROM pages p
-                WHERE p.full_text_id_list IS NULL
+                WHERE NOT EXISTS (SELECT 1 FROM page_fulltext pf WHERE pf.page_id = p.page_id)
             """)
             info["pages_without_fulltext"] = cursor.fetchone()[0]
 
@@ -1247,11 +1250,9 @@ def index_all(request):
         es_stats = es.count(index=INDEX_NAME)
         es_count = es_stats["count"]
 
-        conn = connect_db()
-        with conn.cursor() as cursor:
+        with connect_db() as conn, conn.cursor() as cursor:
             cursor.execute("SELECT COUNT(*) FROM documents")
             mysql_count = cursor.fetchone()[0]
-        conn.close()
 
         return JsonResponse({
             "success": True,
@@ -1377,8 +1378,10 @@ def sync_single_document(request, doc_id):
                 cursor.execute("""
                     SELECT ft.full_text
                     FROM full_text_1 ft
-                    JOIN pages p ON ft.full_text_id = p.full_text_id_list
+                    JOIN page_fulltext pf ON pf.full_text_id = ft.full_text_id
+                    JOIN pages p ON p.page_id = pf.page_id
                     WHERE p.doc_id = %s
+                    ORDER BY p.page_number, p.page_type, pf.ordinal
                 """, (doc_id,))
 
                 full_text_rows = cursor.fetchall()
@@ -124,6 +124,7 @@ class Title(models.Model):
         on_delete=models.CASCADE,
         db_column='doc_id'  
     )
+    first_full_text_id = models.PositiveIntegerField('子树首段全文ID', null=True, blank=True)
 
     class Meta:
         db_table = 'titles'
@@ -165,3 +166,14 @@ class Page(models.Model):
     class Meta:
         db_table = 'pages'
         verbose_name = '页码信息'
+
+class PageFulltext(models.Model):
+    page_fulltext_id = models.AutoField(primary_key=True)
+    page = models.ForeignKey(Page, on_delete=models.CASCADE, db_column='page_id', related_name='fulltext_links')
+    full_text = models.ForeignKey(FullText1, on_delete=models.CASCADE, db_column='full_text_id', related_name='page_links')
+    ordinal = models.PositiveSmallIntegerField('页内顺序')
+
+    class Meta:
+        db_table = 'page_fulltext'
+        verbose_name = '页面全文关联'
+        unique_together = [('page', 'full_text')]
@@ -1,11 +1,12 @@
 from django.http import JsonResponse
 from django.views import View
-from .models import Doc, Title, FullText1, Page, Author, DALink
+from .models import Doc, Title, FullText1, Page, PageFulltext, Author, DALink
 from django.db.models import Count, Q
 import json
 from django.shortcuts import get_object_or_404
 import re
 from django.conf import settings
+from collections import defaultdict
 
 
 class DocListView(View):
@@ -191,9 +192,15 @@ class PageContentView(View):
         pages = Page.objects.filter(doc_id=doc_id).order_by("page_number", "page_type")
         page_data = []
 
+        # 一次查询取出本书所有页面的全文（通过 page_fulltext 关联表）
+        texts_by_page = defaultdict(list)
+        links = (PageFulltext.objects.filter(page__doc_id=doc_id)
+                 .select_related("full_text").order_by("full_text__full_text_order"))
+        for link in links:
+            texts_by_page[link.page_id].append(link.full_text)
+
         for page in pages:
-            full_text_ids = page.full_text_id_list.split(',')
-            full_texts = FullText1.objects.filter(full_text_id__in=full_text_ids).order_by("full_text_order")
+            full_texts = texts_by_page.get(page.page_id, [])
 
             page_data.append({
                 "page_number": page.page_number,
@@ -11,6 +11,8 @@ from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 import logging
+from utils import title_hierarchy
+from apps.search import cache as search_cache
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +45,8 @@ class ResourceView(View):
                     return self.insert_data(resource_type, data)
                 elif action == 'update':
                     return self.update_data(resource_type, data)
+                elif action == 'delete':
+                    return self.delete_data(resource_type, data)
                 else:
                     return JsonResponse({'status': 'error', 'message': '不支持的操作'}, status=400)
                 
@@ -112,17 +116,18 @@ class ResourceView(View):
             
             # 根据资源类型确定表名和字段
             if resource_type == 'document':
-                return self.insert_document_data(data)
+                response = self.insert_document_data(data)
             elif resource_type == 'author':
-                return self.insert_author_data(data)
+                response = self.insert_author_data(data)
             elif resource_type == 'document_author':
-                return self.insert_document_author_data(data)
+                response = self.insert_document_author_data(data)
             elif resource_type == 'title':
-                return self.insert_title_data(data)
+                response = self.insert_title_data(data)
             elif resource_type == 'fulltext':
-                return self.process_fulltext_data(data)
+                response = self.process_fulltext_data(data)
             else:
                 return JsonResponse({'status': 'error', 'message': '不支持的资源类型'}, status=400)
+            return self.invalidate_search_cache(response)
         except Exception as e:
             logger.error(f"插入数据错误: {str(e)}")
             logger.error(f"错误类型: {type(e)}")
@@ -137,21 +142,43 @@ class ResourceView(View):
         try:
             # 根据资源类型确定表名和字段
             if resource_type == 'document':
-                return self.update_document_data(data)
+                response = self.update_document_data(data)
             elif resource_type == 'author':
-                return self.update_author_data(data)
+                response = self.update_author_data(data)
             elif resource_type == 'document_author':
-                return self.update_document_author_data(data)
+                response = self.update_document_author_data(data)
             elif resource_type == 'title':
-                return self.update_title_data(data)
+                response = self.update_title_data(data)
             elif resource_type == 'page':
-                return self.update_page_data(data)
+                response = self.update_page_data(data)
             else:
                 return JsonResponse({'status': 'error', 'message': '不支持的资源类型'}, status=400)
+            return self.invalidate_search_cache(response)
         except Exception as e:
             logger.error(f"更新数据错误: {str(e)}")
             return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
     
+    def delete_data(self, resource_type, data):
+        """删除数据"""
+        try:
+            if resource_type == 'title':
+                response = self.delete_title_data(data)
+            else:
+                return JsonResponse({'status': 'error', 'message': '不支持的资源类型'}, status=400)
+            return self.invalidate_search_cache(response)
+        except Exception as e:
+            logger.error(f"删除数据错误: {str(e)}")
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+    def invalidate_search_cache(self, response):
+        """写入成功（含全文处理）后使检索结果缓存失效；缓存失效失败不影响写入结果"""
+        if response.status_code < 400:
+            try:
+                search_cache.invalidate_search_cache()
+            except Exception as e:
+                logger.error(f"检索缓存失效失败: {str(e)}")
+        return response
+    
     # 文献相关方法
     def insert_document_data(self, data):
         """插入文献数据"""
@@ -402,9 +429,11 @@ class ResourceView(View):
         try:
             with connection.cursor() as cursor:
                 cursor.execute(sql, values)
+                inserted_id = cursor.lastrowid
+                self.refresh_title_hierarchy(cursor, title_ids=[inserted_id])
                 return JsonResponse({
                     'status': 'success',
-                    'inserted_id': cursor.lastrowid
+                    'inserted_id': inserted_id
                 })
         except Exception as e:
             logger.error(f"插入标题数据错误: {str(e)}")
@@ -428,15 +457,49 @@ class ResourceView(View):
         
         try:
             with connection.cursor() as cursor:
+                # 记录更新前所属文献：改挂 parent_id 或 doc_id 后，原祖先链也要刷新
+                old_doc_ids = title_hierarchy.doc_ids_of(cursor, [title_id])
+
                 cursor.execute(sql, values)
+                updated_rows = cursor.rowcount
+                self.refresh_title_hierarchy(cursor, doc_ids=old_doc_ids, title_ids=[title_id])
                 return JsonResponse({
                     'status': 'success',
-                    'updated_rows': cursor.rowcount
+                    'updated_rows': updated_rows
                 })
         except Exception as e:
             logger.error(f"更新标题数据错误: {str(e)}")
             return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
     
+    def delete_title_data(self, data):
+        """删除标题数据"""
+        title_id = data.get('title_id')
+        if not title_id:
+            return JsonResponse({'status': 'error', 'message': '缺少title_id'}, status=400)
+
+        try:
+            with connection.cursor() as cursor:
+                # 删除后标题已查不到所属文献，先记下来，删除后重建原祖先链
+                old_doc_ids = title_hierarchy.doc_ids_of(cursor, [title_id])
+
+                cursor.execute("DELETE FROM titles WHERE title_id = %s", (title_id,))
+                deleted_rows = cursor.rowcount
+                self.refresh_title_hierarchy(cursor, doc_ids=old_doc_ids)
+                return JsonResponse({
+                    'status': 'success',
+                    'deleted_rows': deleted_rows
+                })
+        except Exception as e:
+            logger.error(f"删除标题数据错误: {str(e)}")
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+    def refresh_title_hierarchy(self, cursor, doc_ids=(), title_ids=()):
+        """刷新 first_full_text_id；属于派生数据，失败时只记录日志，可用回填脚本修复"""
+        try:
+            title_hierarchy.refresh_titles(cursor, title_ids, doc_ids=doc_ids)
+        except Exception as e:
+            logger.error(f"刷新标题层级失败: {str(e)}")
+    
     # 页码相关方法
     def update_page_data(self, data):
         """更新页码数据"""
@@ -457,9 +520,12 @@ class ResourceView(View):
         try:
             with connection.cursor() as cursor:
                 cursor.execute(sql, values)
+                updated_rows = cursor.rowcount
+                if 'full_text_id_list' in fields:
+                    self.replace_page_fulltext(cursor, page_id, data['full_text_id_list'])
                 return JsonResponse({
                     'status': 'success',
-                    'updated_rows': cursor.rowcount
+                    'updated_rows': updated_rows
                 })
         except Exception as e:
             logger.error(f"更新页码数据错误: {str(e)}")
@@ -562,6 +628,10 @@ class ResourceView(View):
                     logger.info("开始插入页码信息")
                     self.insert_pages(cursor, title_id)
                     
+                    # 步骤5: 刷新标题层级（子树首段全文）
+                    logger.info("开始刷新标题层级")
+                    self.refresh_title_hierarchy(cursor, title_ids=[title_id] + [item.get('title_id') for item in result])
+                    
                     # 记录处理后的数据数量
                     cursor.execute("SELECT COUNT(*) FROM full_text_1")
                     after_fulltext_count = cursor.fetchone()[0]
@@ -797,12 +867,28 @@ class ResourceView(View):
             
             logger.info(f"doc_id {row[0]}, page_number {row[2]}, page_type {row[3]}, title_id {row[1]}, 包含 full_text_id: {row[4]}")
         
-        # 插入到 Pages 表中
+        # 插入到 Pages 表中（full_text_id_list 仅为兼容保留，读取走 page_fulltext）
         insert_query = '''
         INSERT INTO pages
         (doc_id, full_text_id_list, page_number, page_type, page_image, create_time, title_id)
         VALUES (%s, %s, %s, %s, %s, %s, %s)
         '''
         
-        cursor.executemany(insert_query, pages_data)
-        logger.info(f"{len(pages_data)} 条数据已插入 pages 表。") 
\ No newline at end of file
+        links_count = 0
+        for page in pages_data:
+            cursor.execute(insert_query, page)
+            links_count += self.replace_page_fulltext(cursor, cursor.lastrowid, page[1])
+        logger.info(f"{len(pages_data)} 条数据已插入 pages 表。")
+        logger.info(f"{links_count} 条数据已插入 page_fulltext 表。")
+    
+    def replace_page_fulltext(self, cursor, page_id, full_text_id_list):
+        """按逗号分隔的全文 ID 重写页面与全文的关联，返回关联条数"""
+        full_text_ids = [int(x) for x in str(full_text_id_list or '').split(',') if x.strip().isdigit()]
+        full_text_ids = list(dict.fromkeys(full_text_ids))  # 去重并保留首次出现的顺序，(page_id, full_text_id) 唯一
+        cursor.execute("DELETE FROM page_fulltext WHERE page_id = %s", (page_id,))
+        if full_text_ids:
+            cursor.executemany('''
+            INSERT INTO page_fulltext (page_id, full_text_id, ordinal)
+            VALUES (%s, %s, %s)
+            ''', [(page_id, full_text_id, ordinal) for ordinal, full_text_id in enumerate(full_text_ids, 1)])
+        return len(full_text_ids) 
\ No newline at end of file
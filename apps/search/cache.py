@@ -0,0 +1,193 @@
+"""
+检索结果缓存
+
+缓存键由规范化后的检索条件组成：关键词经 normalize_keyword 处理、末尾的过滤条件排序、
+补齐默认的 search_option，再加上分页参数。这样"天 地"与"天  地"、过滤条件顺序不同的请求命中同一条缓存。
+
+失效采用"代数"方案：每个缓存键都带当前代数，ResourceView 写入数据后把代数加一，
+旧代数下的结果不再被读取，随后按 LRU/TTL 自然淘汰，不需要逐条删除。
+
+后端可选（settings.SEARCH_CACHE['BACKEND']）：
+- django（默认）：Django 缓存框架，代数保存在缓存中。CACHES 中 ALIAS 指定的缓存必须是
+  Redis/Memcached 等跨进程共享的缓存；解析到进程内的 LocMemCache（未配置 CACHES 时的默认值）
+  或 DummyCache 时记录警告并关闭缓存，以免各工作进程的代数互不相通而返回旧结果
+- local：进程内 LRU + TTL，代数只在本进程生效，只适用于单进程部署（如 runserver），
+  多个工作进程时其他进程写入数据后本进程仍会返回旧结果
+"""
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .query_compiler import normalize_conditions
+
+DEFAULT_CACHE_CONFIG = {
+    'BACKEND': 'django',  # django / local（仅单进程）/ none
+    'ALIAS': 'default',   # BACKEND 为 django 时使用的缓存别名
+    'TTL': 300,           # 缓存秒数
+    'MAX_ENTRIES': 512,   # local 后端最多缓存的结果数
+}
+
+GENERATION_KEY = 'leishu:search:generation'
+
+# 只在本进程内生效的 Django 缓存后端，不能承载跨进程的代数
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCacheBackend:
+    """进程内 LRU + TTL 缓存"""
+    def __init__(self, ttl=300, max_entries=512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (过期时间, value)
+        self._generation = 1
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def generation(self):
+        return self._generation
+
+    def bump_generation(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()  # 本进程内旧结果直接释放
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCacheBackend:
+    """基于 Django 缓存框架的后端，代数存放在缓存里；缓存本身须为共享缓存，见 create_search_cache"""
+    def __init__(self, alias='default', ttl=300):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, timeout=self.ttl)
+
+    def generation(self):
+        return self.cache.get_or_set(GENERATION_KEY, 1, timeout=None)
+
+    def bump_generation(self):
+        try:
+            self.cache.incr(GENERATION_KEY)
+        except ValueError:  # 代数尚未写入
+            self.cache.set(GENERATION_KEY, 2, timeout=None)
+
+
+class SearchResultCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, conditions, **params):
+        """缓存键：代数 + 规范化条件 + 其他影响结果的参数（分页等）"""
+        payload = json.dumps([normalize_conditions(conditions), sorted(params.items())],
+                             ensure_ascii=False, default=str)
+        digest = hashlib.md5(payload.encode('utf-8')).hexdigest()
+        return f"leishu:search:{self.backend.generation()}:{digest}"
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return copy.deepcopy(value)  # 调用方可以放心修改
+
+    def set(self, key, value):
+        self.backend.set(key, copy.deepcopy(value))
+
+    def invalidate(self):
+        """数据变更后调用，使之前缓存的所有结果失效"""
+        self.backend.bump_generation()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class NullCache(SearchResultCache):
+    """关闭缓存时使用"""
+    def __init__(self):
+        super().__init__(backend=None)
+
+    def make_key(self, conditions, **params):
+        return None
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def invalidate(self):
+        pass
+
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+
+def create_search_cache(config):
+    """按合并后的配置创建检索缓存；django 后端解析到进程内缓存时关闭缓存"""
+    backend = config['BACKEND']
+    if backend == 'django':
+        cache_backend = settings.CACHES.get(config['ALIAS'], {}).get('BACKEND')
+        if cache_backend in PROCESS_LOCAL_CACHE_BACKENDS:
+            logger.warning(f"CACHES['{config['ALIAS']}'] 为进程内缓存 {cache_backend}，各工作进程的失效代数无法共享，"
+                           f"检索结果缓存已关闭；请将其配置为 Redis/Memcached 等共享缓存")
+            return NullCache()
+        return SearchResultCache(DjangoCacheBackend(config['ALIAS'], config['TTL']))
+    if backend == 'local':
+        return SearchResultCache(LocalCacheBackend(config['TTL'], config['MAX_ENTRIES']))
+    return NullCache()
+
+
+def get_search_cache():
+    """按 settings.SEARCH_CACHE 创建进程级检索缓存"""
+    global _search_cache
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                config = dict(DEFAULT_CACHE_CONFIG)
+                config.update(getattr(settings, 'SEARCH_CACHE', {}))
+                _search_cache = create_search_cache(config)
+    return _search_cache
+
+
+def invalidate_search_cache():
+    """供数据写入方调用的失效钩子"""
+    get_search_cache().invalidate()
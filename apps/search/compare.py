@@ -0,0 +1,203 @@
+"""
+对比阅读的批量取数
+
+get_compare_texts 过去对每个文本项先做一次多表连接定位页面，再按页面的 full_text_id_list 查一次全文，
+比较 10 段就要 20 多次往返。这里按批处理：
+- 一次查询（UNION ALL 两种定位方式）找到一批文本项对应的全部页面
+- 一次查询（经 page_fulltext 关联表）取出这些页面的全部全文
+- 在内存中按文本项组装返回数据
+文本项数量有上限；超过 STREAM_THRESHOLD 时按批流式输出，不必等全部组装完成。
+"""
+import json
+
+MAX_COMPARE_ITEMS = 100  # 单次请求最多处理的文本项
+STREAM_THRESHOLD = 20  # 超过该数量时流式输出
+BATCH_SIZE = 20  # 流式输出时每批处理的文本项
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def _key_value(value):
+    """定位键中的取值：去掉空白，整数形式的字符串或浮点数转为整数（"3"、" 3"、3 视为同一页）"""
+    if isinstance(value, str):
+        value = value.strip()
+        return int(value) if value.isdigit() else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def item_lookup_key(item):
+    """
+    文本项的定位方式（与原逻辑一致）：
+    - 有 title_id、page_number、page_type 时按页面精确定位
+    - 否则按 fulltext_id 找到所在页面
+    - 都没有时无法定位，返回 None
+    """
+    title_id, page_number, page_type = item.get('title_id'), item.get('page_number'), item.get('page_type')
+    if title_id and page_number and page_type:
+        return "p", _key_value(title_id), _key_value(page_number), _key_value(page_type)
+    if item.get('fulltext_id'):
+        return "f", _key_value(item['fulltext_id'])
+    return None
+
+
+def row_lookup_key(row):
+    """页面行的定位键，与 item_lookup_key 做同样的规范化"""
+    if row['lookup_kind'] == "p":
+        return "p", _key_value(row['lookup_id']), _key_value(row['page_number']), _key_value(row['page_type'])
+    return "f", _key_value(row['lookup_id'])
+
+
+PAGE_COLUMNS = """
+    p.page_id, p.page_number, p.page_type, p.doc_id,
+    d.doc_title, d.dynasty, d.doc_specific_category, d.doc_theme, t.title_name,
+    (SELECT a.author_name FROM document_author_links dal
+     JOIN authors a ON a.author_id = dal.author_id
+     WHERE dal.doc_id = d.doc_id ORDER BY dal.da_id LIMIT 1) AS author_name
+"""
+
+
+def fetch_pages(cursor, items):
+    """一次查询定位一批文本项的页面，返回 {定位键: 页面行}"""
+    page_keys, fulltext_ids = [], []
+    for item in items:
+        key = item_lookup_key(item)
+        if key is None:
+            continue
+        if key[0] == "p":
+            page_keys.append(key[1:])
+        else:
+            fulltext_ids.append(key[1])
+
+    selects, params = [], []
+    if page_keys:
+        page_keys = list(dict.fromkeys(page_keys))
+        selects.append(f"""
+            SELECT 'p' AS lookup_kind, p.title_id AS lookup_id, {PAGE_COLUMNS}
+            FROM pages p
+            JOIN documents d ON d.doc_id = p.doc_id
+            LEFT JOIN titles t ON t.title_id = p.title_id
+            WHERE (p.title_id, p.page_number, p.page_type) IN ({", ".join(["(%s, %s, %s)"] * len(page_keys))})
+        """)
+        params += [value for key in page_keys for value in key]
+    if fulltext_ids:
+        fulltext_ids = list(dict.fromkeys(fulltext_ids))
+        selects.append(f"""
+            SELECT 'f' AS lookup_kind, ft.full_text_id AS lookup_id, {PAGE_COLUMNS}
+            FROM full_text_1 ft
+            JOIN pages p ON p.doc_id = ft.doc_id AND p.page_number = ft.page_number AND p.page_type = ft.page_type
+            JOIN documents d ON d.doc_id = ft.doc_id
+            LEFT JOIN titles t ON t.title_id = ft.title_id
+            WHERE ft.full_text_id IN ({_placeholders(fulltext_ids)})
+        """)
+        params += fulltext_ids
+    if not selects:
+        return {}
+
+    cursor.execute("\nUNION ALL\n".join(selects) + "\nORDER BY page_id", tuple(params))
+    pages = {}
+    for row in cursor.fetchall():
+        pages.setdefault(row_lookup_key(row), row)  # 同一定位键匹配多个页面时取第一个
+    return pages
+
+
+def fetch_full_texts(cursor, pages):
+    """一次查询取出这些页面的全部全文，返回 {page_id: [全文行, ...]}（按 full_text_order 排序）"""
+    page_ids = sorted({page['page_id'] for page in pages})
+    texts = {page_id: [] for page_id in page_ids}
+    if not page_ids:
+        return texts
+
+    cursor.execute(f"""
+        SELECT pf.page_id, ft.full_text_id, ft.full_text, ft.text_type, ft.full_text_order,
+               ft.related_id, t.title_name
+        FROM page_fulltext pf
+        JOIN full_text_1 ft ON ft.full_text_id = pf.full_text_id
+        LEFT JOIN titles t ON ft.title_id = t.title_id
+        WHERE pf.page_id IN ({_placeholders(page_ids)})
+        ORDER BY ft.full_text_order
+    """, tuple(page_ids))
+    for row in cursor.fetchall():
+        texts[row['page_id']].append(row)
+    return texts
+
+
+def build_payload(item, page, full_texts):
+    return {
+        'page_id': page['page_id'],
+        'doc_id': page['doc_id'],
+        'title_id': item.get('title_id'),
+        'page_number': page['page_number'],
+        'page_type': page['page_type'],
+        'doc_title': page['doc_title'],
+        'dynasty': page['dynasty'],
+        'author_name': page['author_name'],
+        'doc_specific_category': page['doc_specific_category'],
+        'doc_theme': page['doc_theme'],
+        'title_name': page['title_name'],
+        'full_texts': [{
+            'text': text['full_text'],
+            'text_type': text['text_type'],
+            'text_id': text['full_text_id'],
+            'related_id': text['related_id'],
+            'title_name': text['title_name']
+        } for text in full_texts]
+    }
+
+
+def resolve_batch(cursor, items):
+    """处理一批文本项，按原顺序返回能定位到的文本；找不到页面的文本项跳过"""
+    pages = fetch_pages(cursor, items)
+    full_texts = fetch_full_texts(cursor, pages.values())
+    texts = []
+    for item in items:
+        page = pages.get(item_lookup_key(item))
+        if page is None:
+            print(f"未找到文本项对应的页面: {item}")
+            continue
+        texts.append(build_payload(item, page, full_texts[page['page_id']]))
+    return texts
+
+
+def iter_batches(cursor, items, batch_size=BATCH_SIZE):
+    for start in range(0, len(items), batch_size):
+        yield resolve_batch(cursor, items[start:start + batch_size])
+
+
+class ClosingStream:
+    """
+    StreamingHttpResponse 的内容：响应关闭时 Django 会调用 close()，
+    即使客户端断开、生成器从未开始迭代，也能关闭生成器并归还连接
+    """
+    def __init__(self, chunks, conn):
+        self.chunks = chunks
+        self.conn = conn
+
+    def __iter__(self):
+        return self.chunks
+
+    def close(self):
+        self.chunks.close()
+        self.conn.close()
+
+
+def stream_compare_json(conn, items, truncated=False):
+    """
+    流式输出与非流式相同结构的 JSON：{"success": true, "truncated": ..., "texts": [...]}。
+    返回的 ClosingStream 在响应关闭时归还连接。
+    """
+    return ClosingStream(_compare_chunks(conn, items, truncated), conn)
+
+
+def _compare_chunks(conn, items, truncated):
+    yield '{"success": true, "truncated": %s, "texts": [' % json.dumps(truncated)
+    first = True
+    with conn.cursor() as cursor:
+        for texts in iter_batches(cursor, items):
+            for text in texts:
+                yield ("" if first else ",") + json.dumps(text, ensure_ascii=False, default=str)
+                first = False
+    yield ']}'
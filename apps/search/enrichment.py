@@ -0,0 +1,181 @@
+"""
+检索结果批量补全
+
+enrich_results_with_missing_info 过去对每一行调用 fetch_extra_fields，每行 3~6 次查询，
+100 条结果就是几百次往返。这里先收集整个结果集的 doc_id / title_id，
+再用固定数量的集合查询（IN 列表 + 窗口函数）一次性解析：
+- title_name：每个 doc 的第一个标题，多于一个加"等"
+- author_name / author_org：每个 doc 的第一个作者，多于一个加"等"
+- full_text：title_id 子树中最近的全文（取前100字，见 titles.first_full_text_id），找不到回退到 doc_id
+- page_id：通过 (doc_id, page_number, page_type) 找到对应页面
+无论结果多少条，查询次数都不超过 5 次。
+"""
+import pymysql
+
+PREVIEW_LENGTH = 100  # 预览文本长度
+PREVIEW_SUFFIX = "···"
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def _with_etc(name, count):
+    """超过一个时添加"等"，与原 LIMIT 2 的语义一致"""
+    if name is not None and count > 1:
+        return name + " 等"
+    return name
+
+
+def _to_preview(text):
+    return text + PREVIEW_SUFFIX if text else None
+
+
+def fetch_titles_by_doc(cursor, doc_ids):
+    """每个 doc 取第一个标题和标题总数"""
+    if not doc_ids:
+        return {}
+    cursor.execute(f"""
+        SELECT doc_id, title_name, cnt
+        FROM (
+            SELECT doc_id, title_name,
+                   ROW_NUMBER() OVER (PARTITION BY doc_id ORDER BY title_id) AS rn,
+                   COUNT(*) OVER (PARTITION BY doc_id) AS cnt
+            FROM titles
+            WHERE doc_id IN ({_placeholders(doc_ids)})
+        ) x
+        WHERE rn = 1
+    """, tuple(doc_ids))
+    return {row["doc_id"]: _with_etc(row["title_name"], row["cnt"]) for row in cursor.fetchall()}
+
+
+def fetch_authors_by_doc(cursor, doc_ids):
+    """每个 doc 取第一个作者（及其机构）和作者总数"""
+    if not doc_ids:
+        return {}
+    cursor.execute(f"""
+        SELECT doc_id, author_name, author_org, cnt
+        FROM (
+            SELECT dal.doc_id, a.author_name, a.author_org,
+                   ROW_NUMBER() OVER (PARTITION BY dal.doc_id ORDER BY dal.da_id) AS rn,
+                   COUNT(*) OVER (PARTITION BY dal.doc_id) AS cnt
+            FROM document_author_links dal
+            JOIN authors a ON a.author_id = dal.author_id
+            WHERE dal.doc_id IN ({_placeholders(doc_ids)})
+        ) x
+        WHERE rn = 1
+    """, tuple(doc_ids))
+    return {
+        row["doc_id"]: (_with_etc(row["author_name"], row["cnt"]), row["author_org"])
+        for row in cursor.fetchall()
+    }
+
+
+def fetch_nearest_text_by_title(cursor, title_ids):
+    """
+    对每个起始 title_id，取深度优先（先自身，再按 title_id 顺序遍历子标题）
+    遇到的第一段全文。titles.first_full_text_id 由 utils.title_hierarchy 预先计算，
+    这里只需一次按主键的连接查询。
+    """
+    if not title_ids:
+        return {}
+    cursor.execute(f"""
+        SELECT t.title_id AS root_id, LEFT(f.full_text, %s) AS preview, f.page_number, f.page_type
+        FROM titles t
+        JOIN full_text_1 f ON f.full_text_id = t.first_full_text_id
+        WHERE t.title_id IN ({_placeholders(title_ids)})
+    """, (PREVIEW_LENGTH,) + tuple(title_ids))
+    return {row["root_id"]: row for row in cursor.fetchall()}
+
+
+def fetch_first_text_by_doc(cursor, doc_ids):
+    """每个 doc 取 full_text_order 最小的一段全文"""
+    if not doc_ids:
+        return {}
+    cursor.execute(f"""
+        SELECT doc_id, preview, page_number, page_type
+        FROM (
+            SELECT doc_id, LEFT(full_text, %s) AS preview, page_number, page_type,
+                   ROW_NUMBER() OVER (PARTITION BY doc_id ORDER BY full_text_order) AS rn
+            FROM full_text_1
+            WHERE doc_id IN ({_placeholders(doc_ids)})
+        ) x
+        WHERE rn = 1
+    """, (PREVIEW_LENGTH,) + tuple(doc_ids))
+    return {row["doc_id"]: row for row in cursor.fetchall()}
+
+
+def fetch_page_ids(cursor, page_keys):
+    """批量把 (doc_id, page_number, page_type) 解析为 page_id"""
+    page_keys = [key for key in page_keys if key[1]]  # 页码为空（0）时原逻辑不查询
+    if not page_keys:
+        return {}
+    doc_ids = sorted({key[0] for key in page_keys})
+    tuples = ", ".join(["(%s, %s, %s)"] * len(page_keys))
+    params = tuple(doc_ids) + tuple(value for key in page_keys for value in key)
+    cursor.execute(f"""
+        SELECT doc_id, page_number, page_type, MIN(page_id) AS page_id
+        FROM pages
+        WHERE doc_id IN ({_placeholders(doc_ids)})
+          AND (doc_id, page_number, page_type) IN ({tuples})
+        GROUP BY doc_id, page_number, page_type
+    """, params)
+    return {
+        (row["doc_id"], row["page_number"], row["page_type"]): row["page_id"]
+        for row in cursor.fetchall()
+    }
+
+
+def bulk_fetch_extra_fields(conn, keys):
+    """
+    批量补全代表字段。
+    :param keys: 可迭代的 (doc_id, title_id) 二元组，title_id 可为 None
+    :return: {(doc_id, title_id): {title_name, author_name, author_org, full_text, page_id}}
+    """
+    keys = list(dict.fromkeys(keys))  # 去重并保持顺序
+    if not keys:
+        return {}
+
+    doc_ids = sorted({doc_id for doc_id, _ in keys if doc_id is not None})
+    title_ids = sorted({title_id for _, title_id in keys if title_id})
+
+    with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+        titles = fetch_titles_by_doc(cursor, doc_ids)
+        authors = fetch_authors_by_doc(cursor, doc_ids)
+        nearest = fetch_nearest_text_by_title(cursor, title_ids)
+
+        # 只有 title_id 找不到全文的 doc 才需要回退
+        fallback_doc_ids = sorted({
+            doc_id for doc_id, title_id in keys
+            if doc_id is not None and not (title_id and title_id in nearest)
+        })
+        first_texts = fetch_first_text_by_doc(cursor, fallback_doc_ids)
+
+        text_rows = {}
+        for doc_id, title_id in keys:
+            if title_id and title_id in nearest:
+                text_rows[(doc_id, title_id)] = nearest[title_id]
+            else:
+                text_rows[(doc_id, title_id)] = first_texts.get(doc_id)
+
+        page_keys = {
+            (doc_id, row["page_number"], row["page_type"])
+            for (doc_id, _), row in text_rows.items() if row
+        }
+        page_ids = fetch_page_ids(cursor, page_keys)
+
+    enriched = {}
+    for doc_id, title_id in keys:
+        author_name, author_org = authors.get(doc_id, (None, None))
+        text_row = text_rows[(doc_id, title_id)]
+        page_id = None
+        if text_row:
+            page_id = page_ids.get((doc_id, text_row["page_number"], text_row["page_type"]))
+        enriched[(doc_id, title_id)] = {
+            "title_name": titles.get(doc_id),
+            "author_name": author_name,
+            "author_org": author_org,
+            "full_text": _to_preview(text_row["preview"]) if text_row else None,
+            "page_id": page_id,
+        }
+    return enriched
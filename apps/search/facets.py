@@ -0,0 +1,63 @@
+"""
+检索结果分面计数
+
+对整个命中集合（不只是当前页）统计分类、具体类别、体例、朝代各取值的命中数，
+前端据此显示计数并直接选择过滤条件。分面的键与请求中 filters 的键一致。
+"""
+from collections import defaultdict
+
+from .query_compiler import compile_facet_keys, compile_facets, execute_compiled
+from .ranking import result_key
+
+# (filters 中的键, 检索条件列名)
+FACET_FIELDS = [
+    ("category_type", "category_type"),
+    ("specific_category", "doc_specific_category"),
+    ("document_type", "doc_style"),
+    ("dynasty", "dynasty"),
+]
+
+
+def append_filter_conditions(conditions, filters):
+    """把请求中的 filters 追加为 AND 过滤条件"""
+    for filter_key, column in FACET_FIELDS:
+        if filters and filters.get(filter_key):
+            conditions.append({"column": column, "keyword": filters[filter_key], "logic": "AND"})
+    return conditions
+
+
+def summarize_facets(rows):
+    """
+    :param rows: 带有各分面列和 cnt 的分组行（或 cnt 为 1 的结果行）
+    :return: {filter_key: [{"value": 取值, "count": 命中数}, ...]}，按命中数降序
+    """
+    counts = {filter_key: defaultdict(int) for filter_key, _ in FACET_FIELDS}
+    for row in rows:
+        for filter_key, column in FACET_FIELDS:
+            value = row.get(column)
+            if value is not None and value != "":
+                counts[filter_key][value] += row.get("cnt", 1)
+    return {
+        filter_key: [{"value": value, "count": count}
+                     for value, count in sorted(values.items(), key=lambda item: (-item[1], str(item[0])))]
+        for filter_key, values in counts.items()
+    }
+
+
+def fetch_facets(cursor, *condition_sets):
+    """
+    一次分组聚合查询统计全部命中的分面计数（cursor 需为字典游标）。
+    传入多组条件时（如全字段检索的元数据分支和全文分支）两个分支可能命中同一条结果，
+    各分支取出去重后的命中，按与 merge_top_k 相同的 (doc_id, title_id) 合并后再计数。
+    """
+    facet_columns = [column for _, column in FACET_FIELDS]
+    if len(condition_sets) == 1:
+        execute_compiled(cursor, compile_facets(condition_sets[0], facet_columns), prepared=False)
+        return summarize_facets(cursor.fetchall())
+
+    hits = {}
+    for conditions in condition_sets:
+        execute_compiled(cursor, compile_facet_keys(conditions, facet_columns), prepared=False)
+        for row in cursor.fetchall():
+            hits.setdefault(result_key(row), row)
+    return summarize_facets(hits.values())
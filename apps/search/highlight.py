@@ -0,0 +1,146 @@
+"""
+检索结果高亮
+
+每个请求只构建一次匹配器：按字段收集检索词，同一组检索词编译成一个正则
+（多个短语按长度降序组成交替式，正则引擎一次扫描即可找出所有短语，起到多模式自动机的作用），
+编译结果按检索词集合缓存，跨请求复用。每行结果的各字段一次遍历完成高亮。
+
+- 精确检索按整个检索词（短语）高亮，NOT 之后的排除词不高亮
+- 模糊检索在短语之外再高亮其中的单个汉字
+- 过长的 full_text 只扫描到第 MAX_FRAGMENTS 处命中为止，输出命中附近的片段
+"""
+import re
+from functools import lru_cache
+
+from .query_compiler import normalize_keyword
+
+HIGHLIGHT_FIELDS = ["doc_title", "author_name", "author_org", "title_name", "full_text"]
+HIGHLIGHT_TEMPLATE = '<span class="highlight">{}</span>'
+
+WINDOW_FIELDS = {"full_text"}  # 需要截取片段的字段
+WINDOW_THRESHOLD = 300  # 超过该长度才截取片段
+WINDOW_CONTEXT = 50  # 命中前后各保留的字符数
+MAX_FRAGMENTS = 3  # 最多保留的片段数
+FRAGMENT_SEPARATOR = "···"
+
+CJK_CHAR = re.compile(r'[\u4e00-\u9fff]')
+
+
+def keyword_terms(keyword, fuzzy=False):
+    """
+    从关键词中取出需要高亮的词：去掉逻辑运算符和 NOT 之后的排除词；
+    模糊检索额外加入单个汉字
+    """
+    terms = set()
+    exclude_next = False
+    for token in normalize_keyword(keyword).split():
+        upper = token.upper()
+        if upper in ("AND", "OR"):
+            continue
+        if upper == "NOT":
+            exclude_next = True
+            continue
+        if not exclude_next:
+            terms.add(token)
+        exclude_next = False
+    if fuzzy:
+        terms.update(CJK_CHAR.findall("".join(terms)))
+    return terms
+
+
+@lru_cache(maxsize=256)
+def compile_terms(terms):
+    """
+    :param terms: frozenset，检索词集合
+    相邻的命中合并成一个高亮区间；长词在前，保证优先匹配整个短语
+    """
+    if not terms:
+        return None
+    alternatives = "|".join(re.escape(term) for term in sorted(terms, key=lambda t: (-len(t), t)))
+    return re.compile(f"(?:{alternatives})+", re.IGNORECASE)
+
+
+class Highlighter:
+    """一次请求使用的高亮器：字段 → 已编译的匹配器"""
+    def __init__(self, field_terms, fields=HIGHLIGHT_FIELDS):
+        self.fields = fields
+        self.matchers = {}
+        for field, terms in field_terms.items():
+            matcher = compile_terms(frozenset(terms))
+            if matcher is not None:
+                self.matchers[field] = matcher
+
+    @classmethod
+    def from_conditions(cls, conditions):
+        """按检索条件构建；all_fields 的检索词作用于所有字段"""
+        field_terms = {}
+        all_terms = set()
+        for cond in conditions:
+            column = cond.get("column")
+            terms = keyword_terms(cond.get("keyword", ""), fuzzy=cond.get("search_option") == "模糊")
+            if column == "all_fields":
+                all_terms.update(terms)
+            elif column in HIGHLIGHT_FIELDS:
+                field_terms.setdefault(column, set()).update(terms)
+        if all_terms:
+            for field in HIGHLIGHT_FIELDS:
+                field_terms.setdefault(field, set()).update(all_terms)
+        return cls(field_terms)
+
+    @classmethod
+    def from_chars(cls, text, fields=("sentence",)):
+        """按文本中的汉字逐字高亮（异文检索的查询句子很少整句出现）"""
+        chars = set(CJK_CHAR.findall(text or ""))
+        return cls({field: chars for field in fields}, fields=fields)
+
+    def highlight(self, text, field):
+        matcher = self.matchers.get(field)
+        if not text or matcher is None or not isinstance(text, str):
+            return text
+        if field in WINDOW_FIELDS and len(text) > WINDOW_THRESHOLD:
+            return self._highlight_windows(text, matcher)
+        return matcher.sub(lambda m: HIGHLIGHT_TEMPLATE.format(m.group(0)), text)
+
+    def highlight_row(self, row):
+        """返回高亮后的新行，原行不变"""
+        highlighted = dict(row)
+        for field in self.fields:
+            if field in self.matchers and row.get(field):
+                highlighted[field] = self.highlight(row[field], field)
+        return highlighted
+
+    def _highlight_windows(self, text, matcher):
+        """只取前 MAX_FRAGMENTS 处命中，输出命中前后 WINDOW_CONTEXT 字的片段；无命中时截取开头"""
+        spans = []
+        for match in matcher.finditer(text):
+            spans.append(match.span())
+            if len(spans) >= MAX_FRAGMENTS:
+                break
+        if not spans:
+            return text[:WINDOW_THRESHOLD] + FRAGMENT_SEPARATOR
+
+        # 合并重叠的窗口
+        windows = []
+        for start, end in spans:
+            window_start, window_end = max(0, start - WINDOW_CONTEXT), min(len(text), end + WINDOW_CONTEXT)
+            if windows and window_start <= windows[-1][1]:
+                windows[-1][1] = window_end
+                windows[-1][2].append((start, end))
+            else:
+                windows.append([window_start, window_end, [(start, end)]])
+
+        parts = []
+        for window_start, window_end, window_spans in windows:
+            fragment, cursor = [], window_start
+            for start, end in window_spans:
+                fragment.append(text[cursor:start])
+                fragment.append(HIGHLIGHT_TEMPLATE.format(text[start:end]))
+                cursor = end
+            tail = text[cursor:window_end]
+            # 窗口内位于最后一个记录命中之后的命中（超出 MAX_FRAGMENTS）也一并高亮
+            fragment.append(matcher.sub(lambda m: HIGHLIGHT_TEMPLATE.format(m.group(0)), tail))
+            parts.append("".join(fragment))
+
+        prefix = FRAGMENT_SEPARATOR if windows[0][0] > 0 else ""
+        suffix = FRAGMENT_SEPARATOR if windows[-1][1] < len(text) else ""
+        return prefix + FRAGMENT_SEPARATOR.join(parts) + suffix
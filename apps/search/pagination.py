@@ -0,0 +1,96 @@
+"""
+检索结果的键集分页与总数估算
+
+分页不用 OFFSET：每页多取一行判断是否还有下一页，把本页最后一行的 (相关度, 排序键) 编码进
+after 游标，下一页用 (相关度, 排序键) < (游标值) 接着上一页继续，不需要跳过前面的行。
+
+总数只在第一页计算并随游标带到后续页：
+- 命中不超过 TOTAL_EXACT_CAP 行时给出精确值（有上限的 COUNT）
+- 超过时用全文索引的单表命中数估算（见 query_compiler.compile_fts_estimates）
+"""
+import base64
+import hashlib
+import json
+
+from .query_compiler import (RELEVANCE_COLUMN, compile_count, compile_fts_estimates, execute_compiled,
+                             normalize_conditions, parse_conditions, sort_key_columns)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 100
+TOTAL_EXACT_CAP = 1000  # 精确计数的上限
+
+
+class InvalidCursor(ValueError):
+    """分页游标无法解析或与检索条件不匹配"""
+
+
+def conditions_digest(conditions):
+    """检索条件（规范化后，含关键词）的摘要，游标只能用于生成它的那组条件"""
+    payload = repr(normalize_conditions(conditions))
+    return hashlib.md5(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def row_sort_key(row, conditions):
+    """从结果行中取出 [相关度, 排序键...]（与 compile_search 的 ORDER BY 对应）"""
+    _, joins, _ = parse_conditions(conditions)
+    return [row[RELEVANCE_COLUMN]] + [row[key] for _, key in sort_key_columns(joins)]
+
+
+def encode_cursor(conditions, key, total, total_exact):
+    payload = {"k": key, "c": conditions_digest(conditions), "t": total, "e": total_exact}
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, conditions):
+    """:return: {"key": [...], "total": int, "total_exact": bool}"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        key, digest = payload["k"], payload["c"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidCursor(f"无效的分页游标: {e}")
+    _, joins, _ = parse_conditions(conditions)
+    if digest != conditions_digest(conditions) or not isinstance(key, list) \
+            or len(key) != len(sort_key_columns(joins)) + 1:
+        raise InvalidCursor("分页游标与检索条件不匹配")
+    return {"key": key, "total": payload.get("t"), "total_exact": payload.get("e", False)}
+
+
+def parse_page_size(value):
+    try:
+        page_size = int(value) if value is not None else DEFAULT_PAGE_SIZE
+    except (TypeError, ValueError):
+        page_size = DEFAULT_PAGE_SIZE
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def estimate_total(cursor, conditions, cap=TOTAL_EXACT_CAP):
+    """
+    :return: (total, exact)
+    命中行数不超过 cap 时精确计数；否则各 AND 块取全文谓词单表命中数的最小值求和作为估算，
+    估算值不会小于已确认的 cap。
+    """
+    execute_compiled(cursor, compile_count(conditions, cap + 1), prepared=False)
+    counted = _first_value(cursor.fetchone())
+    if counted <= cap:
+        return counted, True
+
+    estimate = 0
+    for block_queries in compile_fts_estimates(conditions):
+        if not block_queries:  # 只有过滤条件的块无法用全文索引估算
+            return cap, False
+        block_counts = []
+        for query in block_queries:
+            cursor.execute(query.sql, query.params)
+            block_counts.append(_first_value(cursor.fetchone()))
+        estimate += min(block_counts)
+    return max(estimate, cap), False
+
+
+def _first_value(row):
+    if row is None:
+        return 0
+    if isinstance(row, dict):
+        return next(iter(row.values()))
+    return row[0]
@@ -0,0 +1,517 @@
+"""
+检索条件 → 参数化 SQL 编译器
+
+条件列表先解析成语法树：OR 分隔的若干 AND 块，每块若干谓词（过滤条件或 MATCH 全文匹配）。
+关键词、LIMIT、OFFSET 一律以占位符传入，SQL 文本只取决于条件的"形状"
+（列、逻辑、检索模式、OR 分组数），同形状的查询复用缓存的 SQL 文本；
+需要时还可以用服务端预处理语句（PREPARE/EXECUTE）执行，同一连接上同形状只准备一次。
+"""
+import re
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+
+from .enrichment import PREVIEW_LENGTH, PREVIEW_SUFFIX
+
+DEFAULT_LIMIT = 100
+
+# 过滤条件：精确等值
+FILTER_COLUMNS = {
+    "category_type": "d.category_type",
+    "doc_specific_category": "d.doc_specific_category",
+    "doc_style": "d.doc_style",
+    "dynasty": "d.dynasty",
+}
+
+# 检索条件：全文索引 MATCH ... AGAINST
+MATCH_COLUMNS = {
+    "doc_title": "d.doc_title",
+    "full_text": "f.full_text",
+    "author_name": "a.author_name",
+    "author_org": "a.author_org",
+    "title_name": "t.title_name",
+}
+
+# 结果列：只取响应需要的列（不取 doc_image 等大字段），全文在 SQL 中截成预览
+RESULT_COLUMNS = {
+    "d": ["d.doc_id", "d.doc_title", "d.category_type", "d.doc_specific_category", "d.doc_style",
+          "d.doc_theme", "d.dynasty", "d.compilation_time", "d.printing_time", "d.publication_time",
+          "d.doc_type", "d.completeness", "d.source"],
+    "a": ["dal.da_id", "dal.role", "a.author_id", "a.author_name", "a.author_org"],
+    "t": ["t.title_id", "t.title_name", "t.title_level"],
+    "f": ["f.full_text_id", f"CONCAT(LEFT(f.full_text, {PREVIEW_LENGTH}), '{PREVIEW_SUFFIX}') AS full_text",
+          "f.text_type", "f.page_number", "f.page_type"],
+}
+
+# 字段权重：综合相关度 = Σ 权重 × 该字段的 MATCH 得分，可用 settings.SEARCH_FIELD_WEIGHTS 覆盖
+DEFAULT_FIELD_WEIGHTS = {
+    "doc_title": 3.0,
+    "title_name": 3.0,
+    "author_name": 2.0,
+    "author_org": 1.5,
+    "full_text": 1.0,
+}
+RELEVANCE_COLUMN = "relevance"
+
+BOOLEAN_MODE = "IN BOOLEAN MODE"
+NATURAL_MODE = "IN NATURAL LANGUAGE MODE"
+
+# 谓词：kind 为 filter / match；values 为绑定参数（match 时每个 OR 分组一个布尔表达式）
+Predicate = namedtuple("Predicate", ["column", "kind", "mode", "values"])
+
+# 编译结果：sql 使用 %s 占位符，shape 为缓存键
+CompiledQuery = namedtuple("CompiledQuery", ["sql", "params", "shape"])
+
+
+def normalize_keyword(keyword: str) -> str:
+    keyword = keyword.replace("。", " ")  #5月4日崔元皙添加
+    keyword = keyword.replace("(", "").replace(")", "")  # 去除括号
+    keyword = re.sub(r'(?i)(AND|OR|NOT)', r' \1 ', keyword)  # 在逻辑运算符两侧插入空格
+    keyword = re.sub(r'\s+', ' ', keyword)  # 删除多余空格
+    return keyword.strip()
+
+
+def normalize_conditions(conditions):
+    """
+    规范化检索条件：
+    - 检索条件保持顺序（逻辑与顺序有关），关键词标准化，逻辑转大写，补齐默认检索选项
+    - 末尾连续的 AND 过滤条件与顺序无关，排序后放在最后
+    """
+    conditions = list(conditions)
+    split = len(conditions)
+    while split > 1 and conditions[split - 1]["column"] in FILTER_COLUMNS \
+            and conditions[split - 1].get("logic", "").upper() == "AND":
+        split -= 1
+
+    def canonical(cond, is_filter):
+        keyword = cond.get("keyword", "")
+        keyword = keyword.strip() if is_filter else normalize_keyword(keyword)
+        return (
+            cond["column"],
+            cond.get("logic", "").upper().strip(),
+            keyword,
+            "精确" if is_filter else cond.get("search_option", "精确"),
+        )
+
+    searches = [canonical(cond, False) for cond in conditions[:split]]
+    filters = sorted(canonical(cond, True) for cond in conditions[split:])
+    return tuple(searches) + tuple(filters)
+
+
+def keyword_to_boolean_groups(keyword: str) -> tuple:
+    """
+    把用户关键词转换为 MySQL 布尔模式表达式，按 OR 分组：
+    "A B NOT C OR D" → ("+A +B -C", "+D")
+    """
+    keyword = normalize_keyword(keyword)  # 标准化关键词
+    or_groups = re.split(r'\s+OR\s+', keyword, flags=re.IGNORECASE)  # 按 OR 分组
+    expressions = []
+
+    for group in or_groups:
+        boolean_terms = []  # 存放布尔关键词
+        prev = ""  # 跟踪前一个逻辑运算符
+        for token in group.split():
+            upper = token.upper()
+            if upper == "AND":
+                prev = "AND"  # 标记为 AND（此实现中实际未用）
+            elif upper == "NOT":
+                prev = "NOT"  # 标记为 NOT，用于下一个词前加负号
+            else:
+                boolean_terms.append(f"-{token}" if prev == "NOT" else f"+{token}")  # NOT 表示必须不包含，默认必须包含
+                prev = ""  # 重置逻辑标记
+        expressions.append(" ".join(boolean_terms))
+
+    return tuple(expressions)
+
+
+def parse_predicate(cond):
+    """单个条件 → 谓词，未知列返回 None"""
+    col = cond["column"]
+    keyword = cond.get("keyword", "")
+    mode = NATURAL_MODE if cond.get("search_option", "精确") == "模糊" else BOOLEAN_MODE
+
+    # 绑定与 normalize_conditions 相同的规范化关键词，缓存键相同的检索执行的也是同一条查询
+    if col in FILTER_COLUMNS:
+        return Predicate(col, "filter", None, (keyword.strip(),))
+    if col == "doc_title":
+        return Predicate(col, "match", mode, (normalize_keyword(keyword),))  # 标题不拆布尔分组
+    if col in MATCH_COLUMNS:
+        return Predicate(col, "match", mode, keyword_to_boolean_groups(keyword))
+    return None  # 忽略未知列
+
+
+def split_logic_blocks(conditions):
+    """按 OR 切分为 AND 块"""
+    blocks = []  # 存放 OR 分组块
+    current_block = []  # 当前分组
+
+    for cond in conditions:
+        if cond.get('logic', '').upper() == "OR" and current_block:
+            blocks.append(current_block)  # 遇到 OR，结束当前分组
+            current_block = [cond]  # 开始新分组
+        else:
+            current_block.append(cond)  # 否则加入当前分组
+
+    if current_block:
+        blocks.append(current_block)  # 加入最后一组
+
+    return blocks
+
+
+def get_and_clusters(conditions):
+    """与 split_logic_blocks 类似，但第一个条件之后遇到非 AND 即开新块（用于判断 title/full_text 同块）"""
+    clusters = []  # 存放 AND 逻辑块集合
+    current_cluster = []  # 当前逻辑块
+
+    for i, cond in enumerate(conditions):
+        if i == 0 or cond.get("logic", "").upper().strip() == "AND":
+            current_cluster.append(cond["column"])  # 连续 AND 加入同一块
+        else:
+            if current_cluster:
+                clusters.append(set(current_cluster))  # 新块开始前保存旧块
+            current_cluster = [cond["column"]]  # 新块
+    if current_cluster:
+        clusters.append(set(current_cluster))  # 添加最后一块
+    return clusters
+
+
+def parse_conditions(conditions):
+    """
+    条件列表 → 语法树
+    :return: (blocks, joins, needs_title_id_match)
+             blocks 为谓词元组的元组，joins 为需要连接的表别名
+    """
+    blocks = []
+    for block in split_logic_blocks(conditions):
+        predicates = tuple(p for p in (parse_predicate(cond) for cond in block) if p is not None)
+        if predicates:  # 只有当有子句时才保留
+            blocks.append(predicates)
+
+    used_columns = {cond["column"] for cond in conditions}  # 获取用到的所有列
+    joins = []
+    if {"author_name", "author_org"} & used_columns:
+        joins.append("a")
+    if "title_name" in used_columns:
+        joins.append("t")
+    if "full_text" in used_columns:
+        joins.append("f")
+
+    # title_name 和 full_text 在同一个 AND 块中时，需要额外关联 title_id
+    needs_title_id_match = any({"full_text", "title_name"}.issubset(cluster) for cluster in get_and_clusters(conditions))
+    return tuple(blocks), tuple(joins), needs_title_id_match
+
+
+def field_weights():
+    weights = dict(DEFAULT_FIELD_WEIGHTS)
+    weights.update(getattr(settings, "SEARCH_FIELD_WEIGHTS", {}))
+    return weights
+
+
+def predicate_shape(predicate):
+    return (predicate.column, predicate.kind, predicate.mode, len(predicate.values))
+
+
+def query_shape(blocks, joins, needs_title_id_match, keyset=False):
+    return (
+        tuple(tuple(predicate_shape(p) for p in block) for block in blocks),
+        joins,
+        needs_title_id_match,
+        keyset,
+        tuple(sorted(field_weights().items())),
+    )
+
+
+def sort_key_columns(joins):
+    """
+    结果行在相关度之后的排序键：各连接表的主键，保证顺序确定、可做键集分页。
+    返回 [(SQL 列, 结果字典中的键)]
+    """
+    columns = [("d.doc_id", "doc_id")]
+    if "a" in joins:
+        columns.append(("dal.da_id", "da_id"))
+    if "t" in joins:
+        columns.append(("t.title_id", "title_id"))
+    if "f" in joins:
+        columns.append(("f.full_text_id", "full_text_id"))
+    return columns
+
+
+def _render_predicate(shape, placeholder):
+    column, kind, mode, n_values = shape
+    if kind == "filter":
+        return f"{FILTER_COLUMNS[column]} = {placeholder}"
+    sql_column = MATCH_COLUMNS[column]
+    if column == "doc_title":
+        return f"MATCH({sql_column}) AGAINST({placeholder} {mode})"  # 标题全文搜索
+    match_clauses = [f"(MATCH({sql_column}) AGAINST({placeholder} {mode}))" for _ in range(n_values)]
+    return f"({' OR '.join(match_clauses)})"  # 使用 OR 连接各组匹配语句并整体加括号
+
+
+def plan_projection(joins):
+    """
+    按连接的表选出结果列。各表按主键连接，(doc_id, da_id, title_id, full_text_id) 唯一确定一行，
+    不需要对整行 DISTINCT。title_id 优先取标题表，只连接全文表时取全文所属标题。
+    """
+    columns = list(RESULT_COLUMNS["d"])
+    for alias in ("a", "t", "f"):
+        if alias in joins:
+            columns += RESULT_COLUMNS[alias]
+    if "f" in joins and "t" not in joins:
+        columns.append("f.title_id")
+    return columns
+
+
+def _score_columns(block_shapes, placeholder):
+    """各字段的 MATCH 得分表达式 [(字段, 表达式)]，字段按首次出现的顺序，参数顺序与 score_params 一致"""
+    parts = OrderedDict()
+    for block in block_shapes:
+        for column, kind, mode, n_values in block:
+            if kind == "match":
+                match = f"MATCH({MATCH_COLUMNS[column]}) AGAINST({placeholder} {mode})"
+                parts.setdefault(column, []).extend([match] * n_values)
+    return [(column, " + ".join(matches)) for column, matches in parts.items()]
+
+
+def _relevance_expr(score_columns, weights):
+    """综合相关度：字段得分按权重加权求和；只有过滤条件时为 0"""
+    weights = dict(weights)
+    terms = [f"{float(weights.get(column, 1.0))!r} * ({expr})" for column, expr in score_columns]
+    return " + ".join(terms) if terms else "0"
+
+
+def score_params(blocks):
+    """得分表达式的参数：按字段分组，与 _score_columns 的顺序一致"""
+    grouped = OrderedDict()
+    for block in blocks:
+        for predicate in block:
+            if predicate.kind == "match":
+                grouped.setdefault(predicate.column, []).extend(predicate.values)
+    return [value for values in grouped.values() for value in values]
+
+
+def _render_from_where(shape, placeholder):
+    """FROM/JOIN/WHERE 部分（不含键集条件），返回 (select_fields, from_where)"""
+    block_shapes, joins, needs_title_id_match = shape[:3]
+
+    select_fields = plan_projection(joins)
+    join_clauses = []
+    if "a" in joins:
+        join_clauses.append("inner join document_author_links dal ON dal.doc_id = d.doc_id")  # 连接作者关联表
+        join_clauses.append("inner join authors a ON a.author_id = dal.author_id")  # 连接作者表
+    if "t" in joins:
+        join_clauses.append("inner join titles t ON t.doc_id = d.doc_id")  # 连接期刊信息表
+    if "f" in joins:
+        join_clauses.append("inner join full_text_1 f ON f.doc_id = d.doc_id")  # 连接全文表
+
+    block_clauses = []
+    for block in block_shapes:
+        sub_clauses = [f"({_render_predicate(p, placeholder)})" for p in block]  # 用括号包裹每个子句
+        block_clauses.append(" AND ".join(sub_clauses))  # 同一分组内使用 AND 连接
+    where_clause = " OR ".join(f"({block})" for block in block_clauses) if block_clauses else "1=1"
+
+    if needs_title_id_match:
+        where_clause += " AND f.title_id = t.title_id"
+
+    from_where = "FROM documents d"
+    if join_clauses:
+        from_where += "\n" + "\n".join(join_clauses)
+    from_where += f"\nWHERE ({where_clause})"
+    return select_fields, from_where
+
+
+@lru_cache(maxsize=512)
+def render_sql(shape, placeholder="%s"):
+    """
+    按形状生成 SQL 文本，相同形状只生成一次。
+    选出各字段得分 score_<字段> 与加权综合相关度 relevance，按相关度降序取前 LIMIT 行
+    （MySQL 对 ORDER BY ... LIMIT 使用有界优先队列排序，不需要对全部命中排序）。
+    """
+    select_fields, from_where = _render_from_where(shape, placeholder)
+    score_columns = _score_columns(shape[0], placeholder)
+    relevance = _relevance_expr(score_columns, shape[4])
+    select_fields += [f"({expr}) AS score_{column}" for column, expr in score_columns]
+    select_fields.append(f"{relevance} AS {RELEVANCE_COLUMN}")
+    key_columns = [col for col, _ in sort_key_columns(shape[1])]
+
+    sql = f"SELECT {', '.join(select_fields)}\n{from_where}"
+    if shape[3]:  # 键集分页：从上一页最后一行的 (相关度, 排序键) 之后开始
+        sql += (f"\n  AND ({relevance}, {', '.join(key_columns)})"
+                f" < ({', '.join([placeholder] * (len(key_columns) + 1))})")
+    sql += f"\nORDER BY {RELEVANCE_COLUMN} DESC, {', '.join(col + ' DESC' for col in key_columns)}"
+    sql += f"\nLIMIT {placeholder} OFFSET {placeholder}"
+    return sql
+
+
+@lru_cache(maxsize=512)
+def render_count_sql(shape, placeholder="%s"):
+    """有上限的精确计数：最多数到 LIMIT 行，超出后改用估算"""
+    _, from_where = _render_from_where(shape, placeholder)
+    return f"SELECT COUNT(*) AS total FROM (\nSELECT 1\n{from_where}\nLIMIT {placeholder}\n) x"
+
+
+@lru_cache(maxsize=512)
+def render_facet_sql(shape, facet_columns, placeholder="%s"):
+    """分面计数：一次分组聚合得到各分面字段取值组合的命中行数，再在 Python 中按字段汇总"""
+    _, from_where = _render_from_where(shape, placeholder)
+    columns = ", ".join(FILTER_COLUMNS[column] for column in facet_columns)
+    return f"SELECT {columns}, COUNT(*) AS cnt\n{from_where}\nGROUP BY {columns}"
+
+
+@lru_cache(maxsize=512)
+def render_facet_key_sql(shape, facet_columns, placeholder="%s"):
+    """
+    按结果键 (doc_id, title_id) 去重的命中及其分面字段，供多个分支合并后再计数。
+    title_id 的取法与 plan_projection 一致，和检索结果的去重键相同。
+    """
+    _, from_where = _render_from_where(shape, placeholder)
+    joins = shape[1]
+    title_column = "t.title_id" if "t" in joins else "f.title_id" if "f" in joins else "NULL"
+    columns = ", ".join(FILTER_COLUMNS[column] for column in facet_columns)
+    return f"SELECT DISTINCT d.doc_id, {title_column} AS title_id, {columns}\n{from_where}"
+
+
+def bind_params(blocks, limit=None, offset=None, after=None, scored=False):
+    """
+    按与 render_sql 相同的遍历顺序收集参数：
+    [字段得分, 综合相关度]（scored 时）→ WHERE 条件 → [相关度, 键集游标]（after 时）→ LIMIT → OFFSET
+    """
+    params = score_params(blocks) * 2 if scored else []
+    params += [value for block in blocks for predicate in block for value in predicate.values]
+    if after:
+        params += score_params(blocks) + list(after)
+    if limit is not None:
+        params.append(int(limit))
+    if offset is not None:
+        params.append(int(offset))
+    return tuple(params)
+
+
+def compile_search(conditions, limit=DEFAULT_LIMIT, offset=0, after=None):
+    """
+    编译检索条件为参数化查询，结果按加权相关度降序。
+    :param after: 上一页最后一行的 [相关度, 排序键...]（见 pagination.row_sort_key），用于键集分页
+    """
+    blocks, joins, needs_title_id_match = parse_conditions(conditions)
+    if after is not None and len(after) != len(sort_key_columns(joins)) + 1:
+        raise ValueError("分页游标与检索条件不匹配")
+    shape = query_shape(blocks, joins, needs_title_id_match, keyset=after is not None)
+    return CompiledQuery(render_sql(shape), bind_params(blocks, limit, offset, after, scored=True), shape)
+
+
+def compile_count(conditions, cap):
+    """编译有上限的计数查询，最多数到 cap 行"""
+    blocks, joins, needs_title_id_match = parse_conditions(conditions)
+    shape = query_shape(blocks, joins, needs_title_id_match)
+    return CompiledQuery(render_count_sql(shape), bind_params(blocks, limit=cap), ("count",) + shape)
+
+
+def compile_facets(conditions, facet_columns):
+    """编译分面计数查询，facet_columns 为 FILTER_COLUMNS 中的列名"""
+    blocks, joins, needs_title_id_match = parse_conditions(conditions)
+    shape = query_shape(blocks, joins, needs_title_id_match)
+    facet_columns = tuple(facet_columns)
+    return CompiledQuery(render_facet_sql(shape, facet_columns), bind_params(blocks),
+                         ("facets", facet_columns) + shape)
+
+
+def compile_facet_keys(conditions, facet_columns):
+    """编译按 (doc_id, title_id) 去重的命中查询，多个分支的分面先合并命中再计数"""
+    blocks, joins, needs_title_id_match = parse_conditions(conditions)
+    shape = query_shape(blocks, joins, needs_title_id_match)
+    facet_columns = tuple(facet_columns)
+    return CompiledQuery(render_facet_key_sql(shape, facet_columns), bind_params(blocks),
+                         ("facet_keys", facet_columns) + shape)
+
+
+# 估算时每个谓词对应的单表计数（只走全文索引，不做连接）
+ESTIMATE_TABLES = {
+    "doc_title": ("documents", "doc_title"),
+    "full_text": ("full_text_1", "full_text"),
+    "author_name": ("authors", "author_name"),
+    "author_org": ("authors", "author_org"),
+    "title_name": ("titles", "title_name"),
+}
+
+
+def compile_fts_estimates(conditions):
+    """
+    结果数估算：每个 AND 块取其中各全文谓词单表命中数的最小值，各块求和。
+    单表 MATCH 计数只读全文索引，代价与结果页无关；过滤条件不参与（结果为上界）。
+    :return: [[CompiledQuery, ...] 每个 AND 块的计数查询]
+    """
+    blocks, _, _ = parse_conditions(conditions)
+    estimates = []
+    for block in blocks:
+        block_queries = []
+        for predicate in block:
+            if predicate.kind != "match":
+                continue
+            table, column = ESTIMATE_TABLES[predicate.column]
+            matches = " OR ".join([f"MATCH({column}) AGAINST(%s {predicate.mode})"] * len(predicate.values))
+            sql = f"SELECT COUNT(*) AS total FROM {table} WHERE {matches}"
+            block_queries.append(CompiledQuery(sql, tuple(predicate.values), ("estimate",) + predicate_shape(predicate)))
+        estimates.append(block_queries)
+    return estimates
+
+
+class PreparedStatementCache:
+    """
+    服务端预处理语句缓存。预处理语句属于会话，这里按底层连接记录已准备的形状；
+    连接池复用连接时，同形状查询只需 SET + EXECUTE。
+    每个连接最多保留 max_per_connection 条，超出按 LRU 释放。
+    """
+    def __init__(self, max_per_connection=64):
+        self.max_per_connection = max_per_connection
+        self._prepared = weakref.WeakKeyDictionary()  # 底层连接 -> OrderedDict(语句名 -> True)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def statement_name(shape):
+        return "leishu_q_" + hashlib.md5(repr(shape).encode("utf-8")).hexdigest()[:16]
+
+    def execute(self, cursor, compiled):
+        raw = cursor.connection
+        name = self.statement_name(compiled.shape)
+        with self._lock:
+            statements = self._prepared.setdefault(raw, OrderedDict())
+            is_prepared = name in statements
+            if is_prepared:
+                statements.move_to_end(name)
+            evicted = []
+            if not is_prepared:
+                statements[name] = True
+                while len(statements) > self.max_per_connection:
+                    evicted.append(statements.popitem(last=False)[0])
+
+        try:
+            for old_name in evicted:
+                cursor.execute(f"DEALLOCATE PREPARE {old_name}")
+            if not is_prepared:
+                cursor.execute(f"PREPARE {name} FROM %s", (render_sql(compiled.shape, "?"),))
+            variables = [f"@{name}_{i}" for i in range(len(compiled.params))]
+            if variables:
+                cursor.execute("SET " + ", ".join(f"{var} = %s" for var in variables), compiled.params)
+                cursor.execute(f"EXECUTE {name} USING {', '.join(variables)}")
+            else:
+                cursor.execute(f"EXECUTE {name}")
+        except Exception:
+            with self._lock:
+                self._prepared.get(raw, {}).pop(name, None)  # 连接断开等情况下下次重新准备
+            raise
+
+
+prepared_statements = PreparedStatementCache()
+
+
+def execute_compiled(cursor, compiled, prepared=None):
+    """执行编译后的查询，prepared 为 None 时由 settings.SEARCH_PREPARED_STATEMENTS 决定"""
+    if prepared is None:
+        prepared = getattr(settings, "SEARCH_PREPARED_STATEMENTS", False)
+    if prepared:
+        prepared_statements.execute(cursor, compiled)
+    else:
+        cursor.execute(compiled.sql, compiled.params)
@@ -0,0 +1,30 @@
+"""
+检索结果排序与合并
+
+多个检索分支（如全字段检索的元数据分支和全文分支）各自返回结果后，
+按 SQL 计算的加权相关度（relevance 列，见 query_compiler.render_sql）合并，
+以 (doc_id, title_id) 去重，取前 k 条。
+"""
+import heapq
+
+from .query_compiler import RELEVANCE_COLUMN
+
+
+def result_key(row):
+    return row.get("doc_id"), row.get("title_id")
+
+
+def merge_top_k(branches, k):
+    """
+    :param branches: 各分支的结果列表（带 relevance 列），靠前的分支在同分时优先
+    :return: 去重后按相关度降序的前 k 条
+    """
+    best = {}  # key -> ((相关度, -分支序号, -行序号), row)
+    for branch_index, rows in enumerate(branches):
+        for row_index, row in enumerate(rows):
+            ranked = (float(row.get(RELEVANCE_COLUMN) or 0), -branch_index, -row_index)
+            key = result_key(row)
+            if key not in best or ranked > best[key][0]:
+                best[key] = (ranked, row)
+    top = heapq.nlargest(k, best.values(), key=lambda item: item[0])
+    return [row for _, row in top]
@@ -0,0 +1,280 @@
+"""
+异文检索（向量相似检索）
+
+过滤条件：翻译成 Milvus 布尔表达式随 ANN 检索下推，直接返回过滤范围内的前 k 条，
+而不是检索 50 条候选后再逐条过滤（过滤条件较严时可能一条不剩）。
+字段见 utils/vector_schema.py 中的 METADATA_FIELDS；集合尚未按新结构重建时
+（settings.MILVUS_CONFIG['FILTER_PUSHDOWN'] 为 False）仍在检索后用 matches_filters 过滤。
+
+多窗口检索（mode=multi_window）：不再按标点数只选一个集合、拒绝四个以上标点的查询。
+- 查询不超过 4 句：整句编码一次，并行检索句数相同及相邻窗口大小的集合
+- 更长的查询：切成 4 句的重叠窗口（最多 MAX_QUERY_WINDOWS 个），一次编码全部窗口，一次多向量检索
+- 每个结果列表内做 min-max 归一化并乘以集合权重，按 fulltext_id 汇总各查询窗口的得分
+
+检索参数取自 settings.MILVUS_CONFIG['INDEX_PROFILE'] 对应的索引方案；量化索引（IVF_SQ8 / IVF_PQ）
+多取 rerank 倍候选并返回原始向量，用精确内积重排后再截取（见 ann_search）。
+
+结果折叠：1~4 句滑动窗口使同一段落产生大量几乎相同的命中。collapse_hits 把同一全文中
+句子相互重叠的窗口归为一组，只保留得分最高的窗口，每段全文最多保留 MAX_PER_FULLTEXT 组；
+diverse_search 在折叠（及过滤）后不足所需条数时加大候选数重新检索，直到凑满或没有更多结果。
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+import json
+import logging
+
+from utils.milvus_client import LocalHit, milvus_config
+from utils.vector_schema import COLLECTIONS, INDEX_PROFILES, MAX_WINDOW, segment_sentences, sliding_windows
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FIELDS = ["fulltext_id", "sentence"]
+CANDIDATE_LIMIT = 50  # 每个查询向量在每个集合中取的候选数
+MAX_CANDIDATE_LIMIT = 800  # 自适应扩大候选数的上限
+MAX_PER_FULLTEXT = 1  # 折叠后每段全文最多保留的（互不重叠的）命中数
+MAX_QUERY_WINDOWS = 8  # 长查询最多切出的窗口数，控制检索耗时
+SEARCH_TIMEOUT = 5  # 单个集合检索的超时秒数（传给 Milvus），超时的集合结果丢弃
+MAX_CONCURRENT_SEARCHES = 4  # 每个工作进程同时进行的多窗口检索数
+
+# 各集合并行检索的线程池：每个检索最多同时占用每个集合一个线程
+window_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SEARCHES * len(COLLECTIONS),
+                                     thread_name_prefix="vector-search")
+
+# (filters 中的键, 集合中的标量字段)
+VECTOR_FILTER_FIELDS = [
+    ("category_type", "category_type"),
+    ("specific_category", "doc_specific_category"),
+    ("document_type", "doc_style"),
+    ("compilation_time", "compilation_time"),
+]
+
+
+class UnsatisfiableFilter(Exception):
+    """过滤条件不可能匹配任何文本（如分类不是整数）"""
+
+
+def _string_literal(value):
+    return json.dumps(str(value), ensure_ascii=False)
+
+
+def build_filter_expr(filters):
+    """
+    把请求中的 filters 翻译为 Milvus 布尔表达式，语义与 views.matches_filters 一致：
+    分类、具体类别、体例精确匹配，编纂时间按包含匹配。
+    :return: 表达式字符串；没有过滤条件时返回 None
+    """
+    clauses = []
+    for filter_key, field in VECTOR_FILTER_FIELDS:
+        value = (filters or {}).get(filter_key)
+        if not value:
+            continue
+        if filter_key == "category_type":
+            try:
+                clauses.append(f"{field} == {int(str(value).strip())}")
+            except ValueError:
+                raise UnsatisfiableFilter(f"分类必须为整数: {value}")
+        elif filter_key == "compilation_time":
+            clauses.append(f"{field} like {_string_literal('%' + str(value) + '%')}")
+        else:
+            clauses.append(f"{field} == {_string_literal(value)}")
+    return " and ".join(clauses) if clauses else None
+
+
+def collection_for_query(query_text):
+    """单集合模式：按句数选择窗口大小相同的集合，超过 4 句时返回 None"""
+    return COLLECTIONS.get(len(segment_sentences(query_text)) or 1)
+
+
+def _spread(items, limit):
+    """从 items 中均匀取出最多 limit 个（保留首尾）"""
+    if len(items) <= limit:
+        return items
+    step = (len(items) - 1) / (limit - 1)
+    return [items[round(i * step)] for i in range(limit)]
+
+
+def plan_windows(query_text, max_windows=MAX_QUERY_WINDOWS):
+    """
+    :return: (待编码的文本列表, {集合名: (查询文本下标列表, 集合权重)})
+    窗口大小与查询句数越接近，集合权重越高。
+    """
+    sentences = segment_sentences(query_text) or [query_text]
+    count = len(sentences)
+    if count <= MAX_WINDOW:
+        sizes = [size for size in (count - 1, count, count + 1) if size in COLLECTIONS]
+        return [query_text], {COLLECTIONS[size]: ([0], 1.0 / (1 + abs(size - count))) for size in sizes}
+    windows = _spread(sliding_windows(sentences, MAX_WINDOW), max_windows)
+    return windows, {COLLECTIONS[MAX_WINDOW]: (list(range(len(windows))), 1.0)}
+
+
+def normalize_scores(distances):
+    """结果列表内 min-max 归一化到 [0, 1]，只有一个值（或全部相同）时都记为 1"""
+    if not distances:
+        return []
+    low, high = min(distances), max(distances)
+    if high == low:
+        return [1.0] * len(distances)
+    return [(distance - low) / (high - low) for distance in distances]
+
+
+def hit_candidate(hit, collection_name):
+    return {
+        "collection_name": collection_name,
+        "fulltext_id": hit.entity.get("fulltext_id"),
+        "sentence": hit.entity.get("sentence"),
+        "similarity": hit.distance,
+    }
+
+
+def search_profile():
+    return INDEX_PROFILES[milvus_config()['INDEX_PROFILE']]
+
+
+def rerank_hits(hits, query_vector, limit):
+    """用命中返回的原始向量精确计算相似度（向量已归一化，内积即余弦），取前 limit 个"""
+    import numpy as np
+
+    if not hits:
+        return []
+    matrix = np.asarray([hit.entity.get("embedding") for hit in hits], dtype=np.float32)
+    scores = matrix @ np.asarray(query_vector, dtype=np.float32)
+    order = np.argsort(-scores, kind="stable")[:limit]
+    return [LocalHit(hits[i].id, float(scores[i]), {field: hits[i].entity.get(field) for field in OUTPUT_FIELDS})
+            for i in order]
+
+
+def ann_search(milvus, collection_name, vectors, limit, expr=None, profile=None, timeout=None):
+    """
+    按索引方案检索：HNSW 的 ef 不能小于 topk，随 limit 调大；量化索引多取候选后重排。
+    :param timeout: 检索超时秒数，由 Milvus 客户端执行
+    :return: 每个查询向量一个命中列表
+    """
+    profile = profile or search_profile()
+    fetch = limit * profile["rerank"] if profile["rerank"] else limit
+    params = dict(profile["search_params"])
+    if "ef" in params["params"]:
+        params["params"] = dict(params["params"], ef=max(params["params"]["ef"], fetch))
+    output_fields = OUTPUT_FIELDS + ["embedding"] if profile["rerank"] else OUTPUT_FIELDS
+    kwargs = {} if timeout is None else {"timeout": timeout}
+    results = milvus.search(collection_name, vectors, "embedding", params, limit=fetch, expr=expr,
+                            output_fields=output_fields, **kwargs)
+    if not profile["rerank"]:
+        return results
+    return [rerank_hits(hits, vector, limit) for hits, vector in zip(results, vectors)]
+
+
+def single_collection_search(milvus, query_vector, collection_name, expr=None, limit=CANDIDATE_LIMIT):
+    """单集合检索，候选的 score 即相似度"""
+    results = ann_search(milvus, collection_name, [query_vector], limit, expr=expr)
+    candidates = [hit_candidate(hit, collection_name) for hit in results[0]]
+    for candidate in candidates:
+        candidate["score"] = candidate["similarity"]
+    return candidates
+
+
+def merge_window_results(searches, window_count):
+    """
+    :param searches: [(集合名, 集合权重, [每个查询窗口的命中列表, ...], 查询窗口下标列表)]
+    :return: 按 fulltext_id 汇总的候选，score = Σ 各查询窗口的最高加权归一化得分 / 查询窗口数；
+             sentence、similarity 取原始相似度最高的命中
+    """
+    best_per_window = {}  # (fulltext_id, 查询窗口下标) -> 加权归一化得分
+    best_hit = {}  # fulltext_id -> 候选
+    for collection_name, weight, hit_lists, window_indexes in searches:
+        for window_index, hits in zip(window_indexes, hit_lists):
+            for hit, norm in zip(hits, normalize_scores([hit.distance for hit in hits])):
+                candidate = hit_candidate(hit, collection_name)
+                fulltext_id = candidate["fulltext_id"]
+                key = (fulltext_id, window_index)
+                best_per_window[key] = max(best_per_window.get(key, 0.0), weight * norm)
+                if fulltext_id not in best_hit or candidate["similarity"] > best_hit[fulltext_id]["similarity"]:
+                    best_hit[fulltext_id] = candidate
+
+    totals, matched = {}, {}
+    for (fulltext_id, _), score in best_per_window.items():
+        totals[fulltext_id] = totals.get(fulltext_id, 0.0) + score
+        matched[fulltext_id] = matched.get(fulltext_id, 0) + 1
+    merged = []
+    for fulltext_id, candidate in best_hit.items():
+        candidate["score"] = totals[fulltext_id] / window_count
+        candidate["matched_windows"] = matched[fulltext_id]
+        merged.append(candidate)
+    merged.sort(key=lambda candidate: (candidate["score"], candidate["similarity"]), reverse=True)
+    return merged
+
+
+def multi_window_search(milvus, encode, query_text, expr=None, limit=CANDIDATE_LIMIT, timeout=SEARCH_TIMEOUT,
+                        stats=None):
+    """
+    多窗口检索：一次编码，各集合并行检索后合并。
+    :param encode: 文本列表 -> 归一化向量矩阵（如 EmbeddingService.encode）
+    :param stats: 传入字典时写入 exhausted（各命中列表都不足 limit 条，即已没有更多结果）
+    """
+    texts, plan = plan_windows(query_text)
+    vectors = encode(texts)
+    profile = search_profile()
+    futures = {}
+    for collection_name, (window_indexes, weight) in plan.items():
+        future = window_executor.submit(ann_search, milvus, collection_name,
+                                        [vectors[i].tolist() for i in window_indexes], limit, expr, profile, timeout)
+        futures[future] = (collection_name, weight, window_indexes)
+
+    # 超时由 Milvus 调用自身执行，线程不会一直占用；这里再留一点余量兜底
+    done, not_done = wait(futures, timeout=None if timeout is None else timeout + 1)
+    for future in not_done:
+        future.cancel()
+        logger.warning(f"集合 {futures[future][0]} 检索超时（{timeout} 秒），结果已丢弃")
+    searches = []
+    for future in done:
+        collection_name, weight, window_indexes = futures[future]
+        try:
+            searches.append((collection_name, weight, future.result(), window_indexes))
+        except Exception as e:
+            logger.warning(f"集合 {collection_name} 检索失败: {e}")
+    if not searches and futures:
+        raise RuntimeError("所有集合检索均失败或超时")
+    if stats is not None:
+        stats["exhausted"] = all(len(hits) < limit for _, _, hit_lists, _ in searches for hits in hit_lists)
+    return merge_window_results(searches, len(texts))
+
+
+def collapse_hits(candidates, max_per_fulltext=MAX_PER_FULLTEXT):
+    """
+    折叠重复命中：同一 fulltext_id 下句子有重叠的窗口归为一组，保留得分最高的窗口。
+    :param candidates: 候选列表（含 fulltext_id、sentence、score）
+    :return: 按得分降序的代表候选，collapsed 为该组折叠掉的命中数
+    """
+    groups = {}  # fulltext_id -> [(句子集合, 代表候选)]
+    for candidate in sorted(candidates, key=lambda c: (c["score"], c["similarity"]), reverse=True):
+        sentences = set(segment_sentences(candidate["sentence"] or "")) or {candidate["sentence"]}
+        spans = groups.setdefault(candidate["fulltext_id"], [])
+        for span_sentences, best in spans:
+            if span_sentences & sentences:
+                span_sentences |= sentences
+                best["collapsed"] += 1
+                break
+        else:
+            spans.append((sentences, dict(candidate, collapsed=0)))
+
+    collapsed = []
+    for spans in groups.values():
+        collapsed += [best for _, best in spans[:max_per_fulltext]]
+    collapsed.sort(key=lambda c: (c["score"], c["similarity"]), reverse=True)
+    return collapsed
+
+
+def diverse_search(search, want, limit=CANDIDATE_LIMIT, max_limit=MAX_CANDIDATE_LIMIT, keep=None,
+                   max_per_fulltext=MAX_PER_FULLTEXT):
+    """
+    自适应多取候选：折叠（及 keep 过滤）后不足 want 条时按缺口比例扩大候选数重新检索。
+    :param search: limit -> (候选列表, 是否已没有更多结果)，每个查询向量在每个集合中取 limit 个
+    :param keep: 折叠后的候选列表 -> 保留的候选列表（如检索后过滤），None 表示全部保留
+    :return: (折叠后的候选列表, 最后一次的候选数)
+    """
+    while True:
+        candidates, exhausted = search(limit)
+        results = collapse_hits(candidates, max_per_fulltext)
+        if keep is not None:
+            results = keep(results)
+        if len(results) >= want or exhausted or limit >= max_limit:
+            return results, limit
+        limit = min(max_limit, limit * max(2, -(-want * 2 // max(len(results), 1))))
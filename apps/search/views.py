@@ -1,50 +1,68 @@
 import json
 import re
+import time
 import pymysql
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.db import connection
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from utils.database import connect_db
+from utils.embedding import get_embedding_service
+from utils.milvus_client import get_milvus_manager, milvus_config
+from .cache import get_search_cache
+from .compare import MAX_COMPARE_ITEMS, STREAM_THRESHOLD, resolve_batch, stream_compare_json
+from .enrichment import bulk_fetch_extra_fields
+from .facets import append_filter_conditions, fetch_facets, summarize_facets
+from .highlight import Highlighter
+from .ranking import merge_top_k
+from .similar import (UnsatisfiableFilter, build_filter_expr, collection_for_query, diverse_search,
+                      multi_window_search, single_collection_search)
+from .query_compiler import DEFAULT_LIMIT, CompiledQuery, compile_search, execute_compiled
+from .pagination import (DEFAULT_PAGE_SIZE, InvalidCursor, decode_cursor, encode_cursor, estimate_total,
+                         parse_page_size, row_sort_key)
+
+ALL_FIELDS_TOP_K = 10  # 全字段检索合并后返回的条数（两个分支各取 5 条）
+
+# 检索分支并发执行的线程池，每个分支在池内线程上借用自己的连接。
+# 提交分支的请求线程等待结果时不持有连接池的连接，否则连接池耗尽时
+# 请求线程和分支线程会互相等待直到 PoolTimeout；同时借出的连接数不超过
+# max_workers + 并发的其他请求数，须小于连接池 max_size（utils.database.DEFAULT_POOL_CONFIG）
+fanout_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="search-fanout")
 
 def get_mysql_connection():
     return connect_db(cursorclass=pymysql.cursors.DictCursor)  # 使用字典游标返回结果
 
-def build_final_sql(search_conditions, conn=None):
+def build_final_sql(search_conditions, limit=DEFAULT_LIMIT, after=None):
     if any(cond["column"] == "all_fields" for cond in search_conditions):
-        if conn is None:
-            raise ValueError("MySQL connection required for all_fields_search.")  # all_fields 搜索需要数据库连接
-        return all_fields_search(search_conditions, conn)  # 返回全字段搜索结果
+        return all_fields_search(search_conditions)  # 返回全字段搜索结果（分支自行借用连接）
     else:
-        sql = advanced_search_build_sql(search_conditions)  # 构建标准 SQL 查询
-        return sql
+        return advanced_search_build_sql(search_conditions, limit=limit, after=after)  # 构建标准参数化查询
 
 def enrich_results_with_missing_info(conn, results):
     """
-    根据 doc_id 和 title_id，补全缺失字段（title_name, author_name, author_org, full_text）。
-    针对不同情况智能选择补全逻辑：
-    1. title 和 full_text 都使用 → 使用 title_id 精确获取 full_text
-    2. 只有 title 使用 → 用 title_id 找到相关 full_text
-    3. 只有 full_text 使用 → 用 title_id 找到相关 title_name
-    4. 都没有 → 用 doc_id 获取默认 full_text 和 title_name
+    根据 doc_id 和 title_id，补全缺失字段（title_name, author_name, author_org, full_text, page_id）。
+    先收集整个结果集需要补全的 (doc_id, title_id)，再交给 bulk_fetch_extra_fields
+    用固定数量的集合查询一次性解析，查询次数与结果条数无关。
     """
     must_fields = ["title_name", "author_name", "author_org", "full_text", "page_id"]  # 所有需要补全的字段
-    enriched_results = []  # 存储最终结果列表
 
+    # 收集需要补全的行
+    pending = []
     for row in results:
-        doc_id = row["doc_id"]  # 获取文档 ID
-        title_id = row.get("title_id")  # 获取可选的 title_id
         missing_fields = [field for field in must_fields if field not in row]  # 检查缺失字段
-
         if missing_fields:
-            extra_data = fetch_extra_fields(conn, doc_id, title_id)  # 获取补全数据
-            for key in missing_fields:
-                row[key] = extra_data.get(key)  # 逐项填充缺失字段
+            pending.append((row, missing_fields))
+
+    extra_by_key = bulk_fetch_extra_fields(conn, [(row["doc_id"], row.get("title_id")) for row, _ in pending])
 
-        enriched_results.append(row)  # 加入最终结果列表
+    for row, missing_fields in pending:
+        extra_data = extra_by_key.get((row["doc_id"], row.get("title_id")), {})
+        for key in missing_fields:
+            row[key] = extra_data.get(key)  # 逐项填充缺失字段
 
-    return enriched_results  # 返回补全后的所有结果
+    return list(results)  # 返回补全后的所有结果
 
 def fetch_extra_fields(conn, doc_id, title_id=None):
     """
@@ -53,195 +71,71 @@ def fetch_extra_fields(conn, doc_id, title_id=None):
     - author_name / author_org：最多两个，自动加"等"
     - full_text：从 title_id 开始查找最近的 full_text，不行则回退到 doc_id
     - page_id：通过page_number和doc_id获取对应的page_id
+    单条查询版本，内部复用批量补全逻辑。
     """
-    enriched = {}
+    return bulk_fetch_extra_fields(conn, [(doc_id, title_id)]).get((doc_id, title_id), {})
 
-    def get_nearest_text_by_title_id(cursor, title_id):
-        cursor.execute("""
-            SELECT full_text, page_number, page_type
-            FROM full_text_1
-            WHERE title_id = %s
-            ORDER BY full_text_order ASC
-            LIMIT 1
-        """, (title_id,))
-        row = cursor.fetchone()
-        if row and row["full_text"]:
-            # 获取page_id
-            page_number = row.get("page_number")
-            page_type = row.get("page_type")
-            if page_number:
-                cursor.execute("""
-                    SELECT page_id
-                    FROM pages
-                    WHERE doc_id = %s AND page_number = %s AND page_type = %s
-                    LIMIT 1
-                """, (doc_id, page_number, page_type))
-                page_row = cursor.fetchone()
-                enriched["page_id"] = page_row["page_id"] if page_row else None
-
-            return row["full_text"][:100] + "···"  # 截取前100字作为预览文本
-
-        # 递归向下查找子标题的全文
-        cursor.execute("SELECT title_id FROM titles WHERE parent_id = %s", (title_id,))
-        children = cursor.fetchall()
-        for child in children:
-            text = get_nearest_text_by_title_id(cursor, child["title_id"])
-            if text:
-                return text
-        return None  # 没有找到可用的全文
-
-    with conn.cursor() as cursor:
-        # 获取标题（title_name）
-        cursor.execute("SELECT title_name FROM titles WHERE doc_id = %s LIMIT 2", (doc_id,))
-        rows = cursor.fetchall()
-        if rows:
-            title = rows[0]["title_name"]
-            if len(rows) > 1:
-                title += " 等"  # 超过一个标题则添加"等"
-            enriched["title_name"] = title
-        else:
-            enriched["title_name"] = None
-
-        # 获取作者信息（最多两个）
-        cursor.execute("""
-            SELECT a.author_name, a.author_org
-            FROM authors a
-            JOIN document_author_links dal ON dal.author_id = a.author_id
-            WHERE dal.doc_id = %s
-            LIMIT 2
-        """, (doc_id,))
-        rows = cursor.fetchall()
-        if rows:
-            name = rows[0]["author_name"]
-            if len(rows) > 1:
-                name += " 等"  # 超过一个作者则添加"等"
-            enriched["author_name"] = name
-            enriched["author_org"] = rows[0]["author_org"]
-        else:
-            enriched["author_name"] = None
-            enriched["author_org"] = None
-
-        # 获取全文（full_text）：优先根据 title_id 查找，若无则 fallback 到 doc_id
-        if title_id:
-            text = get_nearest_text_by_title_id(cursor, title_id)
-            if text:
-                enriched["full_text"] = text
-            else:
-                cursor.execute("""
-                    SELECT full_text, page_number, page_type
-                    FROM full_text_1
-                    WHERE doc_id = %s
-                    ORDER BY full_text_order ASC
-                    LIMIT 1
-                """, (doc_id,))
-                row = cursor.fetchone()
-                enriched["full_text"] = row["full_text"][:100] + "···" if row and row["full_text"] else None
-
-                # 获取page_id
-                if row and row.get("page_number"):
-                    cursor.execute("""
-                        SELECT page_id
-                        FROM pages
-                        WHERE doc_id = %s AND page_number = %s AND page_type = %s
-                        LIMIT 1
-                    """, (doc_id, row["page_number"], row["page_type"]))
-                    page_row = cursor.fetchone()
-                    enriched["page_id"] = page_row["page_id"] if page_row else None
-        else:
-            cursor.execute("""
-                SELECT full_text, page_number, page_type
-                FROM full_text_1
-                WHERE doc_id = %s
-                ORDER BY full_text_order ASC
-                LIMIT 1
-            """, (doc_id,))
-            row = cursor.fetchone()
-            enriched["full_text"] = row["full_text"][:100] + "···" if row and row["full_text"] else None
-
-            # 获取page_id
-            if row and row.get("page_number"):
-                cursor.execute("""
-                    SELECT page_id
-                    FROM pages
-                    WHERE doc_id = %s AND page_number = %s AND page_type = %s
-                    LIMIT 1
-                """, (doc_id, row["page_number"], row["page_type"]))
-                page_row = cursor.fetchone()
-                enriched["page_id"] = page_row["page_id"] if page_row else None
-
-    return enriched
-
-def extract_chinese_chars_per_field(conditions):
-    result = {}
-    for cond in conditions:
-        col = cond.get("column")
-        keyword = cond.get("keyword", "")
-        chars = re.findall(r'[\u4e00-\u9fff]', keyword)
-        if col and chars:
-            if col not in result:
-                result[col] = set()
-            result[col].update(chars)
-    return {k: list(v) for k, v in result.items()}
-
-# def highlight_text(text, chars):
-#     if not text or not chars:
-#         return text
-#     try:
-#         for ch in chars:
-#             pattern = re.compile(f'({re.escape(ch)})', re.IGNORECASE)
-#             text = pattern.sub(r'<span class="highlight">\1</span>', text)
-#         return text
-#     except Exception as e:
-#         print(f"高亮处理出错: {str(e)}")
-#         return text
-
-# 修改后的高亮函数
-def highlight_text(text, chars):
-    if not text or not chars:
-        return text
-    try:
-        # 将字符列表转换为正则表达式模式，匹配连续的字符
-        pattern_str = ''.join(re.escape(ch) for ch in chars)
-        pattern = re.compile(f'([{pattern_str}]+)', re.IGNORECASE)
-        def repl(match):
-            return f'<span class="highlight">{match.group(1)}</span>'
-        return pattern.sub(repl, text)
-    except Exception as e:
-        print(f"高亮处理出错: {str(e)}")
-        return text
+def perform_search(conditions, page_size=DEFAULT_PAGE_SIZE, after=None, with_facets=False):
+    """
+    执行检索并分页。
+    :param after: 上一页返回的 next_cursor；为空时返回第一页并计算总数
+    :param with_facets: 第一页同时返回整个命中集合的分面计数（后续页沿用第一页的分面）
+    :raises InvalidCursor: 游标无法解析或与检索条件不匹配
+    """
+    cursor_state = decode_cursor(after, conditions) if after else None
 
+    # 结果缓存：键为规范化条件 + 分页参数，数据写入后整体失效
+    search_cache = get_search_cache()
+    cache_key = search_cache.make_key(conditions, page_size=page_size, after=after, facets=with_facets)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # 全字段检索在借用本请求的连接之前完成，等待分支结果时不占用连接
+    sql_or_results = build_final_sql(conditions, limit=page_size + 1,  # 多取一行判断是否还有下一页
+                                     after=cursor_state["key"] if cursor_state else None) # 前端只需调用它即可
+    print(sql_or_results)
 
-def perform_search(conditions):
     conn = get_mysql_connection()
     cursor = conn.cursor()
 
     try:
-        sql_or_results = build_final_sql(conditions, conn) # 前端只需调用它即可
-        print(sql_or_results)
-        if isinstance(sql_or_results, str):
-            cursor.execute(sql_or_results)
-            results = cursor.fetchall()
+        next_cursor = None
+        facets = None
+        if isinstance(sql_or_results, CompiledQuery):
+            execute_compiled(cursor, sql_or_results)
+            results = list(cursor.fetchall())
+            has_more = len(results) > page_size
+            results = results[:page_size]
+
+            # 总数只在第一页计算，之后随游标传递
+            if cursor_state:
+                total, total_exact = cursor_state["total"], cursor_state["total_exact"]
+            elif has_more:
+                total, total_exact = estimate_total(cursor, conditions)
+            else:
+                total, total_exact = len(results), True
+
+            if has_more:
+                next_cursor = encode_cursor(conditions, row_sort_key(results[-1], conditions), total, total_exact)
+            if with_facets and not cursor_state:
+                # 命中不多时直接由本页结果汇总，否则一次分组聚合统计全部命中
+                facets = fetch_facets(cursor, conditions) if has_more else summarize_facets(results)
             final_results = enrich_results_with_missing_info(conn, results)
         else:
             final_results = sql_or_results  # already enriched from all_fields_search
-
-         # 为结果添加高亮
-        if any(cond.get("column") == "all_fields" for cond in conditions):
-            all_text = ''.join(cond.get("keyword", "") for cond in conditions)
-            highlight_chars = list(set(re.findall(r'[\u4e00-\u9fff]', all_text)))
-            highlight_dict = {field: highlight_chars for field in ["doc_title", "author_name", "author_org", "title_name", "full_text"]}
-        else:
-            highlight_dict = extract_chinese_chars_per_field(conditions)
-
-        highlighted_results = []
-        for result in final_results:
-            highlighted_result = result.copy()
-            for field in ["doc_title", "author_name", "author_org", "title_name", "full_text"]:
-                if result.get(field) and field in highlight_dict:
-                    highlighted_result[field] = highlight_text(result[field], highlight_dict[field])
-            highlighted_results.append(highlighted_result)
-
-
+            # 全字段检索只返回合并后的前 ALL_FIELDS_TOP_K 条、没有下一页；
+            # 总数为两个分支命中数之和（两分支可能重叠，只是上界）
+            _, meta_conditions, fulltext_conditions = all_fields_branches(conditions)
+            total = sum(estimate_total(cursor, branch)[0] for branch in (meta_conditions, fulltext_conditions))
+            total, total_exact = max(total, len(final_results)), False
+            if with_facets:
+                # 与高级检索一致，分面统计两个分支的全部命中（重叠的命中只计一次），而不只是合并后的前几条
+                facets = fetch_facets(cursor, meta_conditions, fulltext_conditions)
+
+        # 为结果添加高亮：匹配器每个请求只构建一次
+        highlighter = Highlighter.from_conditions(conditions)
+        highlighted_results = [highlighter.highlight_row(result) for result in final_results]
 
         # 打印结果
         print(f"搜索结果 ({len(highlighted_results)} 条):")
@@ -253,23 +147,25 @@ def perform_search(conditions):
             print(f"  期刊名: {result.get('title_name', '无')}")
             print(f"  内容摘要: {result.get('full_text', '无')}")
 
-        return {
-            'total': len(highlighted_results),
+        search_results = {
+            'total': total,
+            'total_exact': total_exact,
+            'next_cursor': next_cursor,
             'results': highlighted_results
         }
+        if facets is not None:
+            search_results['facets'] = facets
+        search_cache.set(cache_key, search_results)
+        return search_results
 
     finally:
         conn.close()
 
-def all_fields_search(original_conditions: list, conn) -> list:
+def all_fields_branches(original_conditions: list):
     """
-    负责处理 all_fields 搜索逻辑：
-    - 对元数据字段（4个）使用 OR 搜索
-    - 对 full_text 单独进行搜索
-    - 分别限制为 LIMIT 5 并执行高级搜索
-    - enrich 后合并结果
+    把 all_fields 条件拆成两个分支的检索条件
+    :return: (keyword, 元数据分支条件, 全文分支条件)，两个分支都带上原有的过滤条件
     """
-
     # 1️⃣ 提取用户 keyword 和搜索选项以及过滤条件
     main_condition = next((cond for cond in original_conditions if cond["column"] == "all_fields"), None)
     if not main_condition:
@@ -306,194 +202,56 @@ def all_fields_search(original_conditions: list, conn) -> list:
     for cond in filter_conditions:
         fulltext_condition.append({"column": cond["column"], "keyword": cond["keyword"], "logic": "AND", "search_option": "精确"})
 
-    # 4️⃣ 生成 SQL 查询语句
-    sql_meta = advanced_search_build_sql(meta_conditions).replace("LIMIT 100", "LIMIT 5")  # 限制行数为 5
-    if search_option == "模糊":
-        sql_meta = sql_meta.replace("IN BOOLEAN MODE", "IN NATURAL LANGUAGE MODE")  # 模糊搜索切换模式
-
-    sql_full = advanced_search_build_sql(fulltext_condition).replace("LIMIT 100", "LIMIT 5")
-    if search_option == "模糊":
-        sql_full = sql_full.replace("IN BOOLEAN MODE", "IN NATURAL LANGUAGE MODE")
+    return keyword, meta_conditions, fulltext_condition
 
-    # 输出调试信息，显示SQL语句
-    print(f"元数据查询SQL: {sql_meta}")
-    print(f"全文查询SQL: {sql_full}")
-
-    # 5️⃣ 执行查询并进行字段补全（enrich）
-    cursor = conn.cursor()
-    cursor.execute(sql_meta)
-    result_meta = cursor.fetchall()
-    print(f"元数据查询结果数: {len(result_meta)}")
-    enriched_meta = enrich_results_with_missing_info(conn, result_meta)
+def all_fields_search(original_conditions: list) -> list:
+    """
+    负责处理 all_fields 搜索逻辑：
+    - 对元数据字段（4个）使用 OR 搜索
+    - 对 full_text 单独进行搜索
+    - 分别限制为 LIMIT 5，两个分支都提交到 fanout_executor，在各自借用的连接上并发执行并补全字段
+    - 按相关度合并、以 (doc_id, title_id) 去重后取前 ALL_FIELDS_TOP_K 条
+    调用方不要在持有连接池连接的同时调用，见 fanout_executor 的说明
+    """
 
-    cursor.execute(sql_full)
-    result_full = cursor.fetchall()
-    print(f"全文查询结果数: {len(result_full)}")
-    enriched_full = enrich_results_with_missing_info(conn, result_full)
+    _, meta_conditions, fulltext_condition = all_fields_branches(original_conditions)
 
-    cursor.close()
+    # 4️⃣ 生成 SQL 查询语句
+    # 每个条件自带 search_option，模糊搜索由编译器切换为自然语言模式
+    sql_meta = advanced_search_build_sql(meta_conditions, limit=5)  # 限制行数为 5
+    sql_full = advanced_search_build_sql(fulltext_condition, limit=5)
 
-    # 6️⃣ 合并两部分结果并返回
-    all_results = enriched_meta + enriched_full
+    # 输出调试信息，显示SQL语句
+    print(f"元数据查询SQL: {sql_meta.sql} 参数: {sql_meta.params}")
+    print(f"全文查询SQL: {sql_full.sql} 参数: {sql_full.params}")
+
+    # 5️⃣ 两个分支并发执行查询并进行字段补全（enrich），耗时取两者中较长的一个
+    meta_future = fanout_executor.submit(run_search_branch, sql_meta)
+    full_future = fanout_executor.submit(run_search_branch, sql_full)
+    enriched_meta = meta_future.result()
+    enriched_full = full_future.result()
+    print(f"元数据查询结果数: {len(enriched_meta)}")
+    print(f"全文查询结果数: {len(enriched_full)}")
+
+    # 6️⃣ 按相关度合并两部分结果并去重
+    all_results = merge_top_k([enriched_meta, enriched_full], ALL_FIELDS_TOP_K)
     print(f"合并后结果数: {len(all_results)}")
     return all_results
 
-def advanced_search_build_sql(conditions):
-    from_clause = "FROM documents d"  # 主表
-    joins = []  # 存放需要的 JOIN 语句
-    select_fields = ["d.*"]  # 查询字段初始包含主表所有字段
-    used_columns = {cond["column"] for cond in conditions}  # 获取用到的所有列
-
-    if {"author_name", "author_org"} & used_columns:
-        joins.append("inner join document_author_links dal ON dal.doc_id = d.doc_id")  # 连接作者关联表
-        joins.append("inner join authors a ON a.author_id = dal.author_id")  # 连接作者表
-        select_fields.append("a.*")  # 包含作者信息
-        select_fields.append("dal.*")  # 包含关联信息
-
-    if "title_name" in used_columns:
-        joins.append("inner join titles t ON t.doc_id = d.doc_id")  # 连接期刊信息表
-        select_fields.append("t.*")  # 包含期刊信息字段
-
-    if "full_text" in used_columns:
-        joins.append("inner join full_text_1 f ON f.doc_id = d.doc_id")  # 连接全文表
-        select_fields.append("f.*")  # 包含全文字段
-
-    where_clause = build_sql_from_conditions(conditions)  # 构建 WHERE 子句
-
-    # === 检查 title_name 和 full_text 是否在同一个 AND 逻辑块中 ===
-    def get_and_clusters(conditions):
-        clusters = []  # 存放 AND 逻辑块集合
-        current_cluster = []  # 当前逻辑块
-
-        for i, cond in enumerate(conditions):
-            if i == 0 or cond["logic"].upper().strip() == "AND":
-                current_cluster.append(cond["column"])  # 连续 AND 加入同一块
-            else:
-                if current_cluster:
-                    clusters.append(set(current_cluster))  # 新块开始前保存旧块
-                current_cluster = [cond["column"]]  # 新块
-        if current_cluster:
-            clusters.append(set(current_cluster))  # 添加最后一块
-        return clusters
-
-    clusters = get_and_clusters(conditions)
-    needs_title_id_match = any({"full_text", "title_name"}.issubset(cluster) for cluster in clusters)  # 判断是否需额外关联 title_id
-
-    if needs_title_id_match:
-        extra_condition = "f.title_id = t.title_id"  # 添加额外条件
-        if where_clause:
-            where_clause += f" AND {extra_condition}"  # 拼接到已有 WHERE 子句
-        else:
-            where_clause = extra_condition  # 单独作为 WHERE 子句
-
-    # === 拼接最终 SQL 查询语句 ===
-    sql = f"SELECT DISTINCT {', '.join(select_fields)}\n{from_clause}"
-    if joins:
-        sql += "\n" + "\n".join(joins)
-    if where_clause:
-        sql += "\nWHERE " + where_clause
-    sql += "\nLIMIT 100;"  # 限制返回行数
-
-    return sql
-
-def build_sql_from_conditions(conditions):
-    def split_logic_blocks(conditions):
-        blocks = []  # 存放 OR 分组块
-        current_block = []  # 当前分组
-
-        for cond in conditions:
-            if cond['logic'].upper() == "OR" and current_block:
-                blocks.append(current_block)  # 遇到 OR，结束当前分组
-                current_block = [cond]  # 开始新分组
-            else:
-                current_block.append(cond)  # 否则加入当前分组
-
-        if current_block:
-            blocks.append(current_block)  # 加入最后一组
-
-        return blocks
-
-    blocks = split_logic_blocks(conditions)  # 分组条件
-    block_clauses = []  # 存放每组的 SQL 子句
-
-    for block in blocks:
-        sub_clauses = []  # 存放当前分组的每个条件的子句
-        for cond in block:
-            col = cond["column"]  # 获取列名
-            keyword = cond["keyword"]  # 获取关键词
-            search_option = cond.get("search_option", "精确")  # 默认精确搜索
-
-            # 处理过滤条件
-            if col == "category_type":
-                clause = f"d.category_type = '{keyword}'"
-            elif col == "doc_specific_category":
-                clause = f"d.doc_specific_category = '{keyword}'"
-            elif col == "doc_style":
-                clause = f"d.doc_style = '{keyword}'"
-            # 处理搜索条件
-            elif col == "doc_title":
-                clause = f"MATCH(d.{col}) AGAINST('{keyword}' IN BOOLEAN MODE)"  # 标题全文搜索
-                if search_option == '模糊':
-                    clause = clause.replace("IN BOOLEAN MODE", "IN NATURAL LANGUAGE MODE")
-            elif col == "full_text":
-                clause = parse_keyword_to_match(keyword, "f.full_text", search_option)  # 正文全文搜索
-            elif col == "author_name":
-                clause = parse_keyword_to_match(keyword, "a.author_name", search_option)  # 作者名搜索
-            elif col == "author_org":
-                clause = parse_keyword_to_match(keyword, "a.author_org", search_option)  # 作者机构搜索
-            elif col == "title_name":
-                clause = parse_keyword_to_match(keyword, "t.title_name", search_option)  # 期刊名搜索
-            else:
-                continue  # 忽略未知列
-
-            sub_clauses.append(f"({clause})")  # 用括号包裹每个子句
-
-        if sub_clauses:  # 只有当有子句时才添加到block_clauses
-            block_clauses.append(" AND ".join(sub_clauses))  # 同一分组内使用 AND 连接
-
-    if not block_clauses:  # 如果没有任何条件
-        return "1=1"  # 返回永真条件
-
-    return " OR ".join(f"({block})" for block in block_clauses)  # 各分组之间使用 OR 连接并加括号
-
-def parse_keyword_to_match(keyword: str, column: str, search_option: str = "精确") -> str:
-    keyword = normalize_keyword(keyword)  # 标准化关键词
-    or_groups = re.split(r'\s+OR\s+', keyword, flags=re.IGNORECASE)  # 按 OR 分组
-    match_clauses = []  # 存放每组生成的匹配语句
-
-    for group in or_groups:
-        tokens = group.split()  # 分词
-        boolean_terms = []  # 存放布尔关键词
-        prev = ""  # 跟踪前一个逻辑运算符
-
-        for token in tokens:
-            upper = token.upper()
-            if upper == "AND":
-                prev = "AND"  # 标记为 AND（此实现中实际未用）
-            elif upper == "NOT":
-                prev = "NOT"  # 标记为 NOT，用于下一个词前加负号
-            else:
-                if prev == "NOT":
-                    boolean_terms.append(f"-{token}")  # NOT 表示必须不包含
-                else:
-                    boolean_terms.append(f"+{token}")  # 默认表示必须包含
-                prev = ""  # 重置逻辑标记
-
-        match_clause = f"MATCH({column}) AGAINST('{ ' '.join(boolean_terms) }' IN BOOLEAN MODE)"  # 构造 MATCH 查询
-
-        if search_option == "模糊":
-            match_clause = match_clause.replace("IN BOOLEAN MODE", "IN NATURAL LANGUAGE MODE")
-
-        match_clauses.append(f"({match_clause})")  # 加括号保留逻辑顺序
-
-    return f"({' OR '.join(match_clauses)})"  # 使用 OR 连接各组匹配语句并整体加括号
+def run_search_branch(compiled):
+    """执行一个检索分支并补全字段；连接从连接池借用，结束后归还"""
+    conn = get_mysql_connection()
+    try:
+        with conn.cursor() as cursor:
+            execute_compiled(cursor, compiled)
+            results = cursor.fetchall()
+        return enrich_results_with_missing_info(conn, results)
+    finally:
+        conn.close()
 
-def normalize_keyword(keyword: str) -> str:
-    keyword = keyword.replace("。", " ")  #5月4日崔元皙添加
-    keyword = keyword.replace("(", "").replace(")", "")  # 去除括号
-    keyword = re.sub(r'(?i)(AND|OR|NOT)', r' \1 ', keyword)  # 在逻辑运算符两侧插入空格
-    keyword = re.sub(r'\s+', ' ', keyword)  # 删除多余空格
-    return keyword.strip()
+def advanced_search_build_sql(conditions, limit=DEFAULT_LIMIT, offset=0, after=None):
+    """构建参数化查询，返回 CompiledQuery(sql, params, shape)"""
+    return compile_search(conditions, limit=limit, offset=offset, after=after)
 
 # 基本检索视图
 @csrf_exempt
@@ -508,6 +266,9 @@ def basic_search(request):
     search_field = data.get('search_field', 'all_fields')
     filters = data.get('filters', {})
     search_option = data.get('search_option', '精确')  # 新增搜索选项，默认为精确
+    page_size = parse_page_size(data.get('page_size'))  # 每页条数
+    after = data.get('after')  # 上一页返回的 next_cursor
+    with_facets = bool(data.get('facets'))  # 是否返回分面计数
 
     # 打印输入的查询信息
     print("接收到的查询信息:")
@@ -522,27 +283,10 @@ def basic_search(request):
     if search_field == 'all_fields':
         conditions = [{"column": "all_fields", "keyword": query, "logic": "", "search_option": search_option}]
         # 处理过滤条件
-        if filters:
-            if filters.get('category_type'):
-                conditions.append({"column": "category_type", "keyword": filters['category_type'], "logic": "AND"})
-            if filters.get('specific_category'):
-                conditions.append({"column": "doc_specific_category", "keyword": filters['specific_category'], "logic": "AND"})
-            if filters.get('document_type'):
-                conditions.append({"column": "doc_style", "keyword": filters['document_type'], "logic": "AND"})
+        append_filter_conditions(conditions, filters)
 
         print(f"构建搜索条件: {conditions}")
 
-        # 使用全字段搜索逻辑
-        conn = pymysql.connect(
-            host='localhost',
-            user='leishu',
-            password='Leishu(*&*112M!',
-            db='leishu_yongle',
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
-        results = all_fields_search(conditions, conn)
-        conn.close()
     else:
         # 为单一字段构建查询条件
         if search_field == 'literature':
@@ -555,16 +299,13 @@ def basic_search(request):
             conditions.append({"column": "full_text", "keyword": query, "logic": "", "search_option": search_option})
 
         # 处理过滤条件
-        if filters:
-            if filters.get('category_type'):
-                conditions.append({"column": "category_type", "keyword": filters['category_type'], "logic": "AND"})
-            if filters.get('specific_category'):
-                conditions.append({"column": "doc_specific_category", "keyword": filters['specific_category'], "logic": "AND"})
-            if filters.get('document_type'):
-                conditions.append({"column": "doc_style", "keyword": filters['document_type'], "logic": "AND"})
+        append_filter_conditions(conditions, filters)
 
     # 使用统一的搜索处理函数
-    search_results = perform_search(conditions)
+    try:
+        search_results = perform_search(conditions, page_size=page_size, after=after, with_facets=with_facets)
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
     # 打印一些调试信息
     print(f"搜索结果总数: {search_results.get('total', 0)}")
@@ -586,6 +327,9 @@ def advanced_search(request):
 
     advancedQueries = data.get('queries', [])  # 获取高级检索的查询条件
     filters = data.get('filters', {})
+    page_size = parse_page_size(data.get('page_size'))  # 每页条数
+    after = data.get('after')  # 上一页返回的 next_cursor
+    with_facets = bool(data.get('facets'))  # 是否返回分面计数
 
     # 打印输入的查询信息
     print("接收到的高级检索信息:")
@@ -620,16 +364,13 @@ def advanced_search(request):
         })
 
     # 处理过滤条件
-    if filters:
-        if filters.get('category_type'):
-            conditions.append({"column": "category_type", "keyword": filters['category_type'], "logic": "AND"})
-        if filters.get('specific_category'):
-            conditions.append({"column": "doc_specific_category", "keyword": filters['specific_category'], "logic": "AND"})
-        if filters.get('document_type'):
-            conditions.append({"column": "doc_style", "keyword": filters['document_type'], "logic": "AND"})
+    append_filter_conditions(conditions, filters)
 
      # 使用统一的搜索处理函数
-    search_results = perform_search(conditions)
+    try:
+        search_results = perform_search(conditions, page_size=page_size, after=after, with_facets=with_facets)
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
     # 打印一些调试信息
     print(f"搜索结果总数: {search_results.get('total', 0)}")
@@ -655,6 +396,9 @@ def screen(request):  # 筛选搜索结果
 
     return HttpResponse('fliter: %s, sort_keys: %s' % (fliter, sort_keys))
 
+class NoSimilarResults(Exception):
+    """异文检索确定没有结果（返回“无结果”提示而不是错误）"""
+
 @csrf_exempt
 @require_http_methods(['POST'])
 def similar_search_milvus(request):
@@ -675,26 +419,7 @@ def similar_search_milvus(request):
     if not query_text:
         return JsonResponse({'error': '请输入检索文本'}, status=400)
 
-    # 显示Python环境和库信息
     import sys
-    import os
-    try:
-        import pip
-        installed_packages = sorted(["%s==%s" % (i.key, i.version) for i in pip.get_installed_distributions()])
-    except:
-        try:
-            import pkg_resources
-            installed_packages = sorted(["%s==%s" % (i.key, i.version) for i in pkg_resources.working_set])
-        except:
-            installed_packages = ["无法获取已安装的包信息"]
-
-    python_info = {
-        "python_version": sys.version,
-        "python_path": sys.executable,
-        "sys_path": sys.path,
-        "current_dir": os.getcwd(),
-        "env_vars": {k: v for k, v in os.environ.items() if 'PATH' in k or 'PYTHON' in k}
-    }
 
     # 导入可选依赖，如果不存在则使用模拟结果
     try:
@@ -712,53 +437,10 @@ def similar_search_milvus(request):
             }]
         })
 
+    # 句向量模型每个工作进程只加载一次（通常已在启动时预热），这里只在尚未加载时等待加载完成
     try:
-        from pymilvus import connections, Collection
-    except ImportError as e:
-        return JsonResponse({
-            'total': 1,
-            'query': query_text,
-            'results': [{
-                'document_title': "依赖错误",
-                'title_name': "缺少依赖库",
-                'sentence': f"服务器未安装pymilvus库，请联系管理员安装依赖：pip install pymilvus\n错误详情: {str(e)}",
-                'similarity': 0.0,
-                'text_type': "错误"
-            }]
-        })
-
-    # 加载模型
-    try:
-        try:
-            from sentence_transformers import models, SentenceTransformer
-
-            # 修改为本地模型路径,请替换你的存放地址
-            local_model_path = "/root/leishu/bert-ancient-chinese"
-            # 直接加载本地模型
-            word_embedding_model = models.Transformer(local_model_path)
-            pooling_model = models.Pooling(
-                word_embedding_model.get_word_embedding_dimension(),
-                pooling_mode_mean_tokens=True
-            )
-            model = SentenceTransformer(modules=[word_embedding_model, pooling_model])
-        except ImportError as e:
-            error_msg = str(e)
-            # 检查是否是HTTPError导入问题
-            if "HTTPError" in error_msg and "requests" in error_msg:
-                # 尝试修复requests问题
-                import subprocess
-                subprocess.run([sys.executable, "-m", "pip", "install", "--upgrade", "requests"], capture_output=True)
-                # 再次尝试导入
-                from sentence_transformers import models, SentenceTransformer
-                model_name = "Jihuai/bert-ancient-chinese"
-                word_embedding_model = models.Transformer(model_name)
-                pooling_model = models.Pooling(
-                    word_embedding_model.get_word_embedding_dimension(),
-                    pooling_mode_mean_tokens=True
-                )
-                model = SentenceTransformer(modules=[word_embedding_model, pooling_model])
-            else:
-                raise
+        embedding_service = get_embedding_service()
+        embedding_service.get_model()
     except Exception as e:
         return JsonResponse({
             'total': 1,
@@ -772,24 +454,9 @@ def similar_search_milvus(request):
             }]
         })
 
-    # 数据库配置
-    DB_CONFIG = {
-        "host": "localhost",
-        "user": "leishu",
-        "password": "Leishu(*&*112M!",
-        "database": "leishu_yongle",
-        "charset": "utf8mb4"
-    }
-
-    MILVUS_CONFIG = {
-        "host": "localhost",
-        "port": "19530"
-    }
-
     # MySQL连接
     try:
-        import pymysql
-        db_connection = pymysql.connect(**DB_CONFIG)
+        db_connection = get_mysql_connection()  # 从连接池借出（字典游标）
         cursor = db_connection.cursor()
     except Exception as e:
         return JsonResponse({
@@ -804,16 +471,29 @@ def similar_search_milvus(request):
             }]
         })
 
-    # Milvus连接
+    # Milvus连接：进程级客户端只连接一次（通常已在启动时预加载集合），断线时自动重连
+    milvus = get_milvus_manager()
     try:
-        connections.connect("default", **MILVUS_CONFIG)
+        milvus.connect()
     except Exception as e:
-        # 关闭MySQL连接
+        # 归还MySQL连接
         try:
             db_connection.close()
         except:
             pass
 
+        if isinstance(e, ImportError):
+            return JsonResponse({
+                'total': 1,
+                'query': query_text,
+                'results': [{
+                    'document_title': "依赖错误",
+                    'title_name': "缺少依赖库",
+                    'sentence': f"服务器未安装pymilvus库，请联系管理员安装依赖：pip install pymilvus\n错误详情: {str(e)}",
+                    'similarity': 0.0,
+                    'text_type': "错误"
+                }]
+            })
         return JsonResponse({
             'total': 1,
             'query': query_text,
@@ -826,24 +506,6 @@ def similar_search_milvus(request):
             }]
         })
 
-    # 工具函数
-    def normalize_vector(vector):
-        norm = np.linalg.norm(vector)
-        return (vector / norm).tolist() if norm != 0 else vector
-
-    def count_sentences(text):
-        return text.count("。") + text.count("，")
-
-    def get_collection_by_sentence_count(sentence_count):
-        collections_map = {
-        0: "yongle_1",
-        1: "yongle_2",
-        2: "yongle_3",
-        3: "yongle_4"
-        }
-
-        return collections_map.get(sentence_count)
-
     # 执行相似检索
     result_list = []
 
@@ -857,26 +519,29 @@ def similar_search_milvus(request):
 
     try:
         user_query_fulltext_id = get_fulltext_id_from_mysql(cursor, query_text)
-        sentence_count = count_sentences(query_text)
-        collection_name = get_collection_by_sentence_count(sentence_count)
+        # single：按句数只检索一个集合；multi_window：一次编码，并行检索多个窗口集合后合并（支持长查询）
+        multi_window = data.get('mode') == 'multi_window'
+        collection_name = None if multi_window else collection_for_query(query_text)
 
-        if collection_name is None:
+        if not multi_window and collection_name is None:
+            db_connection.close()
             return JsonResponse({
                 'total': 1,
                 'query': query_text,
                 'results': [{
                     'document_title': "不支持的查询",
                     'title_name': "句子数量错误",
-                    'sentence': f"请按照正确格式输入句子，标点符号最多有三个",
+                    'sentence': f"请按照正确格式输入句子，最多四句（更长的文本请使用多窗口检索）",
                     'similarity': 0.0,
                     'text_type': "错误"
                 }]
             })
 
         try:
-            collection = Collection(collection_name)
-            collection.load()
+            if collection_name is not None:
+                milvus.collection(collection_name)  # 已加载时直接返回
         except Exception as e:
+            db_connection.close()
             return JsonResponse({
                 'total': 1,
                 'query': query_text,
@@ -889,67 +554,78 @@ def similar_search_milvus(request):
                 }]
             })
 
-        # 向量编码查询
-        query_vector = model.encode([query_text], convert_to_numpy=True)[0]
-        query_vector = normalize_vector(query_vector)
-
-        # 向量搜索，增加搜索限制到更多的结果，确保有足够的候选
-        search_params = {"metric_type": "COSINE", "params": {"ef": 100}}
-        results = collection.search([query_vector], "embedding", search_params, limit=50)  # 增加到50个结果供筛选
-
-        filtered_results = []
-
-        # 收集所有结果并过滤掉重复的文本
-        for result in results[0]:
-            text_id = result.id
-            distance = result.distance
-
+        # 过滤条件（及排除查询原文）下推到向量检索；集合未含元数据字段时检索后再过滤
+        apply_filters = filters and any(filters.get(f) for f in ['category_type', 'specific_category', 'document_type', 'compilation_time'])
+        pushdown = milvus_config()['FILTER_PUSHDOWN']
+        expr = None
+        if pushdown:
             try:
-                sentence_data = collection.query(
-                    f"id == {text_id}", output_fields=["fulltext_id", "sentence"]
-                )[0]
+                expr = build_filter_expr(filters)
+            except UnsatisfiableFilter as e:
+                print(f"过滤条件无法匹配: {e}")
+                raise NoSimilarResults()
+            if user_query_fulltext_id is not None:
+                expr = f"fulltext_id != {int(user_query_fulltext_id)}" + (f" and ({expr})" if expr else "")
+            apply_filters = False
+
+        # 向量编码查询并检索（fulltext_id、sentence 随检索结果一并返回）；
+        # 重叠窗口折叠、过滤后不足10条时加大候选数重新检索（查询向量已缓存，不会重复编码）
+        def search(limit):
+            if multi_window:
+                search_stats = {}
+                candidates = multi_window_search(milvus, embedding_service.encode, query_text, expr=expr,
+                                                 limit=limit, stats=search_stats)
+                exhausted = search_stats["exhausted"]
+            else:
+                query_vector = embedding_service.encode([query_text])[0].tolist()  # 已归一化
+                candidates = single_collection_search(milvus, query_vector, collection_name, expr=expr, limit=limit)
+                exhausted = len(candidates) < limit
+            # 过滤掉与原始查询相同的文本
+            return [candidate for candidate in candidates
+                    if user_query_fulltext_id is None or candidate["fulltext_id"] != user_query_fulltext_id], exhausted
+
+        def keep(candidates):
+            # 一次查询取出全部命中的文献/标题/页面信息及过滤所需的元数据
+            fulltext_infos = get_fulltext_infos(cursor, [candidate["fulltext_id"] for candidate in candidates])
+            rows = []
+            for candidate in candidates:
+                fulltext_id = candidate["fulltext_id"]
+                info = fulltext_infos.get(fulltext_id, UNKNOWN_FULLTEXT_INFO)
 
-                # 过滤掉与原始查询相同的文本
-                if user_query_fulltext_id is not None and sentence_data["fulltext_id"] == user_query_fulltext_id:
+                # 应用过滤条件
+                if apply_filters and not matches_filters(info, filters):
+                    print(f"文档 {info['doc_id']} 不符合过滤条件，已跳过")
                     continue
 
-                doc_title, title_name, text_type, page_id, doc_id = get_fulltext_info(cursor, sentence_data["fulltext_id"])
-
-                # 应用过滤条件
-                if filters and any(filters.get(f) for f in ['category_type', 'specific_category', 'document_type', 'compilation_time']):
-                    # 获取文档的元数据信息用于过滤
-                    document_info = get_document_metadata(cursor, doc_id)
-
-                    # 检查是否符合过滤条件
-                    if not matches_filters(document_info, filters):
-                        print(f"文档 {doc_id} 不符合过滤条件，已跳过")
-                        continue
-
-                filtered_results.append({
-                    "collection_name": collection_name,
-                    "fulltext_id": sentence_data["fulltext_id"],
-                    "sentence": sentence_data["sentence"],
-                    "similarity": round(distance, 4),
-                    "document_title": doc_title,
-                    "title_name": title_name,
-                    "text_type": text_type,
-                    "page_id": page_id,
-                    "doc_id": doc_id
+                rows.append({
+                    "collection_name": candidate["collection_name"],
+                    "fulltext_id": fulltext_id,
+                    "sentence": candidate["sentence"],
+                    "similarity": round(candidate["similarity"], 4),
+                    "score": round(candidate["score"], 4),
+                    "document_title": info["doc_title"],
+                    "title_name": info["title_name"],
+                    "text_type": info["text_type"],
+                    "page_id": info["page_id"],
+                    "doc_id": info["doc_id"]
                 })
-            except Exception as e:
-                print(f"处理搜索结果时出错: {str(e)}")
+            return rows
+
+        search_start = time.monotonic()
+        filtered_results, candidate_limit = diverse_search(search, want=10, keep=keep)
+        print(f"编码及向量检索耗时: {(time.monotonic() - search_start) * 1000:.1f} ms，候选数: {candidate_limit}，"
+              f"编码服务指标: {embedding_service.stats()}")
 
-        # 确保最多返回10条结果，按相似度排序
-        result_list = sorted(filtered_results, key=lambda x: x["similarity"], reverse=True)[:10]
+        # 确保最多返回10条结果，按得分排序（单集合检索时得分即相似度），每段全文只保留最相似的片段
+        result_list = sorted(filtered_results, key=lambda x: x["score"], reverse=True)[:10]
         print(f"过滤后的结果数量: {len(result_list)}")
 
-        # 对结果进行高亮处理
-        for result in result_list:
-            if result.get("sentence"):
-                # 提取中文字符用于高亮
-                highlight_chars = list(set(re.findall(r'[\u4e00-\u9fff]', query_text)))
-                result["sentence"] = highlight_text(result["sentence"], highlight_chars)
+        # 对结果进行高亮处理（按查询文本中的汉字，匹配器只构建一次）
+        highlighter = Highlighter.from_chars(query_text)
+        result_list = [highlighter.highlight_row(result) for result in result_list]
 
+    except NoSimilarResults:
+        result_list = []
     except Exception as e:
         result_list.append({
             "collection_name": "error",
@@ -963,11 +639,7 @@ def similar_search_milvus(request):
             "doc_id": None
         })
 
-    # 关闭连接
-    try:
-        connections.disconnect("default")
-    except:
-        pass
+    # 归还MySQL连接（Milvus连接由进程级客户端保持）
     try:
         db_connection.close()
     except:
@@ -993,21 +665,6 @@ def similar_search_milvus(request):
         'results': result_list
     })
 
-def get_document_metadata(cursor, doc_id):
-    """获取文档的元数据信息"""
-    try:
-        sql = """
-            SELECT category_type, doc_specific_category, doc_style, compilation_time
-            FROM documents
-            WHERE doc_id = %s
-        """
-        cursor.execute(sql, (doc_id,))
-        result = cursor.fetchone()
-        return result or {}
-    except Exception as e:
-        print(f"获取文档元数据失败: {str(e)}")
-        return {}
-
 def matches_filters(document_info, filters):
     """检查文档是否符合过滤条件"""
     if not filters:
@@ -1028,41 +685,31 @@ def matches_filters(document_info, filters):
 
     return True  # 所有条件都匹配
 
-def get_fulltext_info(cursor, fulltext_id):
-    """获取全文的基本信息"""
-    try:
-        sql = "SELECT doc_id, title_id, text_type, page_number, page_type FROM full_text_1 WHERE full_text_id = %s"
-        cursor.execute(sql, (fulltext_id,))
-        fulltext_info = cursor.fetchone()
-        if not fulltext_info:
-            return "未知文献", "未知标题", "未知类型", None, None
-
-        doc_id, title_id, text_type, page_number, page_type = fulltext_info
-
-        cursor.execute("SELECT doc_title FROM documents WHERE doc_id = %s", (doc_id,))
-        doc_title = cursor.fetchone()
-        doc_title = doc_title[0] if doc_title else "未知文献"
-
-        cursor.execute("SELECT title_name FROM titles WHERE title_id = %s", (title_id,))
-        title_name = cursor.fetchone()
-        title_name = title_name[0] if title_name else "未知标题"
-
-        # 获取page_id
-        page_id = None
-        if page_number and page_type:
-            cursor.execute("""
-                SELECT page_id
-                FROM pages
-                WHERE doc_id = %s AND page_number = %s AND page_type = %s
-                LIMIT 1
-            """, (doc_id, page_number, page_type))
-            page_row = cursor.fetchone()
-            page_id = page_row[0] if page_row else None
-
-        return doc_title, title_name, text_type, page_id, doc_id
-    except Exception as e:
-        print(f"获取文本信息失败: {str(e)}")
-        return "数据库查询错误", "数据库查询错误", "错误", None, None
+UNKNOWN_FULLTEXT_INFO = {
+    "doc_id": None, "doc_title": "未知文献", "title_name": "未知标题", "text_type": "未知类型", "page_id": None,
+    "category_type": None, "doc_specific_category": None, "doc_style": None, "compilation_time": None,
+}
+
+def get_fulltext_infos(cursor, fulltext_ids):
+    """
+    一次查询取出一批全文的文献标题、标题名、文本类型、所在页面和文献元数据（用于过滤）
+    :return: {full_text_id: 信息字典}，cursor 需为字典游标
+    """
+    fulltext_ids = list(dict.fromkeys(fid for fid in fulltext_ids if fid is not None))
+    if not fulltext_ids:
+        return {}
+    cursor.execute(f"""
+        SELECT ft.full_text_id, ft.doc_id, ft.text_type,
+               COALESCE(d.doc_title, '未知文献') AS doc_title,
+               COALESCE(t.title_name, '未知标题') AS title_name,
+               (SELECT MIN(pf.page_id) FROM page_fulltext pf WHERE pf.full_text_id = ft.full_text_id) AS page_id,
+               d.category_type, d.doc_specific_category, d.doc_style, d.compilation_time
+        FROM full_text_1 ft
+        LEFT JOIN documents d ON d.doc_id = ft.doc_id
+        LEFT JOIN titles t ON t.title_id = ft.title_id
+        WHERE ft.full_text_id IN ({", ".join(["%s"] * len(fulltext_ids))})
+    """, tuple(fulltext_ids))
+    return {row["full_text_id"]: row for row in cursor.fetchall()}
 
 def get_fulltext_id_from_mysql(cursor, query_text):
     """根据文本内容查找对应的全文ID"""
@@ -1075,7 +722,7 @@ def get_fulltext_id_from_mysql(cursor, query_text):
         """
         cursor.execute(sql, (query_text,))
         result = cursor.fetchone()
-        return result[0] if result else None
+        return result["full_text_id"] if result else None
     except Exception as e:
         print(f"获取全文ID失败: {str(e)}")
         return None
@@ -1083,7 +730,11 @@ def get_fulltext_id_from_mysql(cursor, query_text):
 @csrf_exempt
 @require_http_methods(['POST'])
 def get_compare_texts(request):
-    """批量获取对比阅读所需的全文内容"""
+    """
+    批量获取对比阅读所需的全文内容。
+    每批文本项只需两次查询（定位页面、取全文），见 apps/search/compare.py；
+    最多处理 MAX_COMPARE_ITEMS 项，超过 STREAM_THRESHOLD 项时流式返回。
+    """
     try:
         data = json.loads(request.body)
         items = data.get('items', [])
@@ -1094,139 +745,29 @@ def get_compare_texts(request):
                 'error': '没有提供要获取的文本项'
             })
 
+        truncated = len(items) > MAX_COMPARE_ITEMS
+        items = items[:MAX_COMPARE_ITEMS]
+
         # 获取数据库连接
         conn = get_mysql_connection()
-        cursor = conn.cursor()
 
-        try:
-            texts = []
-            for item in items:
-                doc_id = item.get('doc_id')
-                page_id = item.get('page_id')
-                title_id = item.get('title_id')
-                page_number = item.get('page_number')
-                page_type = item.get('page_type')
-                full_text_id = item.get('fulltext_id')
-
-                print(f"处理文本项: doc_id={doc_id}, title_id={title_id}, page_number={page_number}, page_type={page_type}, page_id={page_id}")
-
-                # 策略1: 通过title_id、page_number和page_type精确定位
-                if title_id and page_number and page_type:
-                    print("使用策略1: 通过title_id、page_number和page_type精确定位")
-                    cursor.execute("""
-                        SELECT p.page_id, p.full_text_id_list, p.doc_id,
-                               d.doc_title, d.dynasty, d.doc_specific_category, d.doc_theme,
-                               t.title_name, a.author_name
-                        FROM pages p
-                        JOIN documents d ON d.doc_id = p.doc_id
-                        LEFT JOIN document_author_links dal ON dal.doc_id = d.doc_id
-                        LEFT JOIN authors a ON a.author_id = dal.author_id
-                        LEFT JOIN titles t ON t.title_id = %s
-                        WHERE p.title_id = %s
-                        AND p.page_number = %s
-                        AND p.page_type = %s
-                    """, (title_id, title_id, page_number, page_type))
-
-                    page_result = cursor.fetchone()
-                    if page_result:
-                        page_id = page_result['page_id']
-                        full_text_id_list = page_result['full_text_id_list']
-                        doc_id = page_result['doc_id']
-                        doc_title = page_result['doc_title']
-                        dynasty = page_result['dynasty']
-                        author_name = page_result['author_name']
-                        doc_specific_category = page_result['doc_specific_category']
-                        doc_theme = page_result['doc_theme']
-                        title_name = page_result['title_name']
-                        print(f"找到页面: page_id={page_id}, full_text_ids={full_text_id_list}")
-                    else:
-                        print("未找到匹配的页面")
-                        continue
-
-
-                # 策略2: 通过page_id直接获取
-                elif full_text_id:
-                    print("使用策略2: 通过full_text_id直接获取")
-                    cursor.execute("""
-                        SELECT p.page_id, p.full_text_id_list, p.page_number, p.page_type, p.doc_id,
-                               d.doc_title, d.dynasty, d.doc_specific_category, d.doc_theme,
-                               t.title_name, a.author_name
-                        FROM pages p
-                        JOIN full_text_1 ft ON ft.full_text_id = %s
-                        JOIN documents d ON d.doc_id = ft.doc_id
-                        JOIN document_author_links dal ON dal.doc_id = d.doc_id
-                        JOIN authors a ON a.author_id = dal.author_id
-                        LEFT JOIN titles t ON t.title_id = ft.title_id
-                        WHERE p.doc_id = ft.doc_id
-                        AND p.page_number = ft.page_number
-                        AND p.page_type = ft.page_type
-                    """, (full_text_id,))
-
-                    page_result = cursor.fetchone()
-                    if not page_result or not page_result['full_text_id_list']:
-                        print(f"未找到page_id={page_id}的页面")
-                        continue
-                    full_text_id_list = page_result['full_text_id_list']
-                    page_number = page_result['page_number']
-                    page_type = page_result['page_type']
-                    doc_id = page_result['doc_id']
-                    doc_title = page_result['doc_title']
-                    dynasty = page_result['dynasty']
-                    author_name = page_result['author_name']
-                    doc_specific_category = page_result['doc_specific_category']
-                    doc_theme = page_result['doc_theme']
-                    title_name = page_result['title_name']
-
-                else:
-                    print("缺少必要的定位信息")
-                    continue
+        if len(items) > STREAM_THRESHOLD:
+            # 连接在响应关闭时归还（见 compare.ClosingStream）
+            return StreamingHttpResponse(stream_compare_json(conn, items, truncated),
+                                         content_type='application/json')
 
-                # 获取所有相关的全文内容
-                full_text_ids = full_text_id_list.split(',')
-                placeholders = ','.join(['%s'] * len(full_text_ids))
-
-                cursor.execute(f"""
-                    SELECT ft.full_text_id, ft.full_text, ft.text_type, ft.full_text_order,
-                           ft.related_id, t.title_name
-                    FROM full_text_1 ft
-                    LEFT JOIN titles t ON ft.title_id = t.title_id
-                    WHERE ft.full_text_id IN ({placeholders})
-                    ORDER BY ft.full_text_order
-                """, tuple(full_text_ids))
-
-                full_texts = cursor.fetchall()
-                print(f"获取到{len(full_texts)}条文本记录")
-
-                # 组织返回数据
-                texts.append({
-                    'page_id': page_id,
-                    'doc_id': doc_id,
-                    'title_id': title_id,
-                    'page_number': page_number,
-                    'page_type': page_type,
-                    'doc_title': doc_title,
-                    'dynasty': dynasty,
-                    'author_name': author_name,
-                    'doc_specific_category': doc_specific_category,
-                    'doc_theme': doc_theme,
-                    'title_name': title_name,
-                    'full_texts': [{
-                        'text': text['full_text'],
-                        'text_type': text['text_type'],
-                        'text_id': text['full_text_id'],
-                        'related_id': text['related_id'],
-                        'title_name': text['title_name']
-                    } for text in full_texts]
-                })
+        try:
+            with conn.cursor() as cursor:
+                texts = resolve_batch(cursor, items)
 
             print(f"总共处理了{len(texts)}个页面的文本")
             return JsonResponse({
                 'success': True,
+                'truncated': truncated,
                 'texts': texts
             })
 
         finally:
-            cursor.close()
             conn.close()
 
     except json.JSONDecodeError:
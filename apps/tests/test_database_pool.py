@@ -0,0 +1,114 @@
+# apps/tests/test_database_pool.py
+import threading
+
+import pymysql
+from django.test import SimpleTestCase
+
+from utils.database import ConnectionPool, PoolTimeout
+
+
+class FakeRawConnection:
+    def __init__(self):
+        self.open = True
+        self.cursorclass = None
+        self.rollbacks = 0
+        self.ping_ok = True
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def ping(self, reconnect=False):
+        if not self.ping_ok:
+            raise pymysql.err.OperationalError(2006, "MySQL server has gone away")
+
+    def close(self):
+        self.open = False
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def make_pool(self, **kwargs):
+        self.created = []
+
+        def connect(**config):
+            raw = FakeRawConnection()
+            self.created.append(raw)
+            return raw
+
+        options = {'max_size': 2, 'wait_timeout': 0.05, 'idle_timeout': 300, 'ping_interval': 30}
+        options.update(kwargs)
+        return ConnectionPool({'host': 'localhost'}, connect=connect, **options)
+
+    def test_close_returns_connection_for_reuse(self):
+        """close() 归还连接并回滚事务，下一次借出复用同一连接"""
+        pool = self.make_pool()
+        conn = pool.acquire()
+        raw = conn._raw
+        conn.close()
+        self.assertEqual(raw.rollbacks, 1)
+
+        again = pool.acquire(cursorclass=pymysql.cursors.DictCursor)
+        self.assertIs(again._raw, raw)
+        self.assertIs(raw.cursorclass, pymysql.cursors.DictCursor)
+        self.assertEqual(len(self.created), 1)
+        again.close()
+
+    def test_bounded_size_times_out(self):
+        pool = self.make_pool()
+        first, second = pool.acquire(), pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        first.close()
+        second.close()
+
+    def test_waiter_gets_released_connection(self):
+        pool = self.make_pool(max_size=1, wait_timeout=2)
+        held = pool.acquire()
+        timer = threading.Timer(0.05, held.close)
+        timer.start()
+        with pool.acquire() as conn:
+            self.assertIsNotNone(conn._raw)
+        timer.join()
+        stats = pool.stats()
+        self.assertEqual(stats['waits'], 1)
+        self.assertGreater(stats['max_wait_ms'], 0)
+
+    def test_failed_ping_replaces_connection(self):
+        pool = self.make_pool(ping_interval=-1)
+        conn = pool.acquire()
+        raw = conn._raw
+        conn.close()
+        raw.ping_ok = False
+
+        with pool.acquire() as conn:
+            self.assertIsNot(conn._raw, raw)
+        self.assertFalse(raw.open)
+        self.assertEqual(pool.stats()['ping_failures'], 1)
+
+    def test_ping_does_not_block_other_acquires(self):
+        """慢 ping 期间其他线程仍能借出新连接"""
+        pool = self.make_pool(ping_interval=-1, wait_timeout=1)
+        conn = pool.acquire()
+        raw = conn._raw
+        conn.close()
+        other = {}
+
+        def slow_ping(reconnect=False):
+            thread = threading.Thread(target=lambda: other.setdefault("conn", pool.acquire()))
+            thread.start()
+            thread.join(0.5)
+
+        raw.ping = slow_ping
+        with pool.acquire() as conn:
+            self.assertIs(conn._raw, raw)
+        self.assertIn("conn", other)
+        other["conn"].close()
+
+    def test_idle_connections_are_reaped(self):
+        pool = self.make_pool(idle_timeout=-1)
+        conn = pool.acquire()
+        raw = conn._raw
+        conn.close()
+        pool.acquire().close()
+        self.assertFalse(raw.open)
+        self.assertEqual(len(self.created), 2)
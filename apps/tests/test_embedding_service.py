@@ -0,0 +1,114 @@
+# apps/tests/test_embedding_service.py
+import os
+import tempfile
+import threading
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from utils.embedding import EmbeddingCache, EmbeddingService, _EncodeRequest
+
+
+class FakeModel:
+    """按文本长度生成向量，记录每次调用的批次"""
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True):
+        self.calls.append(list(texts))
+        return np.array([[len(text), 0.0, 0.0] for text in texts], dtype=np.float32)
+
+
+class EmbeddingServiceTests(SimpleTestCase):
+    def make_service(self, **kwargs):
+        self.loads = 0
+        self.model = FakeModel()
+
+        def loader():
+            self.loads += 1
+            return self.model
+
+        return EmbeddingService(loader, **kwargs)
+
+    def test_model_loaded_once_and_vectors_normalized(self):
+        service = self.make_service(batch_wait_ms=0)
+        service.warmup()
+        vectors = service.encode(["天地", "日月星辰"])
+        service.encode(["玄黄"])
+
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(vectors.dtype, np.float32)
+        np.testing.assert_allclose(vectors, [[1, 0, 0], [1, 0, 0]])
+        np.testing.assert_allclose(service.encode(["天地"], normalize=False), [[2, 0, 0]])
+        stats = service.stats()
+        self.assertTrue(stats["loaded"])
+        self.assertIsNotNone(stats["load_ms"])
+
+    def test_concurrent_requests_share_batches(self):
+        service = self.make_service(max_batch_size=8, batch_wait_ms=200)
+        service.get_model()
+        results = {}
+
+        def run(i):
+            results[i] = service.encode(["字" * (i + 1)], normalize=False)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLess(len(self.model.calls), 4)
+        self.assertEqual({i: results[i][0][0] for i in range(4)}, {0: 1, 1: 2, 2: 3, 3: 4})
+        self.assertEqual(service.stats()["requests"], 4)
+
+    def test_overflow_request_heads_the_next_batch(self):
+        service = self.make_service(max_batch_size=4, batch_wait_ms=50)
+        first, overflow, later = _EncodeRequest(["甲", "乙"]), _EncodeRequest(["丙", "丁", "戊"]), _EncodeRequest(["己"])
+        service._queue.put(overflow)
+        service._queue.put(later)
+
+        self.assertEqual(service._collect_batch(first), [first])
+        self.assertIs(service._carry, overflow)  # 不重新排到 later 之后
+        self.assertEqual(service.stats()["pending"], 2)
+
+    def test_load_failure_is_reported_and_retried(self):
+        attempts = []
+
+        def loader():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OSError("模型目录不存在")
+            return FakeModel()
+
+        service = EmbeddingService(loader, batch_wait_ms=0)
+        with self.assertRaises(OSError):
+            service.encode(["天"])
+        self.assertEqual(service.encode(["天"]).shape, (1, 3))
+        self.assertEqual(service.stats()["load_failures"], 1)
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+    def test_cached_texts_skip_the_model(self):
+        model = FakeModel()
+        service = EmbeddingService(lambda: model, batch_wait_ms=0, cache=EmbeddingCache())
+        service.encode(["天地 玄黄", "日月"])
+        vectors = service.encode(["  天地\u3000玄黄 ", "日月", "宇宙洪荒"], normalize=False)
+
+        self.assertEqual(model.calls, [["天地 玄黄", "日月"], ["宇宙洪荒"]])
+        np.testing.assert_allclose(vectors[:, 0], [5, 2, 4])
+        cache_stats = service.stats()["cache"]
+        self.assertEqual((cache_stats["hits"], cache_stats["misses"]), (2, 3))
+
+    def test_evicted_vectors_spill_to_disk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # 每条约 12 + 3 字节，只容纳一条
+            cache = EmbeddingCache(max_bytes=20, spill_path=os.path.join(tmp, "spill"), spill_slots=2)
+            cache.set("天", np.array([1, 0, 0], dtype=np.float32))
+            cache.set("地", np.array([0, 1, 0], dtype=np.float32))
+            np.testing.assert_allclose(cache.get("天"), [1, 0, 0])
+            self.assertFalse(os.path.exists(os.path.join(tmp, "spill")))  # 映射后即删除，不残留
+
+            stats = cache.stats()
+            self.assertEqual((stats["spill_hits"], stats["evictions"], stats["entries"]), (1, 2, 1))
+            self.assertIsNone(EmbeddingCache(max_bytes=20).get("天"))
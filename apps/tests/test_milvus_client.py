@@ -0,0 +1,191 @@
+# apps/tests/test_milvus_client.py
+import enum
+
+from django.test import SimpleTestCase
+
+from utils.milvus_client import (LOADED, MILVUS_CONNECT_FAILED, FailoverManager, LocalBackend, MilvusManager,
+                                 is_connection_error)
+
+
+# 与 pymilvus / grpc 同名同形的异常，未安装这两个可选依赖时照样能测试错误分类
+class MilvusException(Exception):
+    def __init__(self, code=1, message=""):
+        super().__init__(message)
+        self.code = code
+
+
+class StatusCode(enum.Enum):
+    INVALID_ARGUMENT = (3, "invalid argument")
+    DEADLINE_EXCEEDED = (4, "deadline exceeded")
+    UNAVAILABLE = (14, "unavailable")
+
+
+class RpcError(Exception):
+    def __init__(self, status):
+        super().__init__(status.name)
+        self.status = status
+
+    def code(self):
+        return self.status
+
+
+class FutureTimeoutError(Exception):
+    pass
+
+
+def retries_exhausted(rpc_error):
+    """pymilvus 重试装饰器用尽重试后的形态：MilvusException(e.code(), ...) from e"""
+    try:
+        raise MilvusException(rpc_error.code(), "Retry run out of 75 retry times") from rpc_error
+    except MilvusException as e:
+        return e
+
+
+class FlakyBackend(LocalBackend):
+    """第一次检索时模拟连接断开"""
+    def __init__(self, error=None):
+        super().__init__()
+        self.error = error or ConnectionError("channel closed")
+        self.fail_next = True
+
+    def get_collection(self, name):
+        collection = super().get_collection(name)
+        if self.fail_next:
+            self.fail_next = False
+            original = collection.search
+
+            def broken(*args, **kwargs):
+                collection.search = original
+                raise self.error
+            collection.search = broken
+        return collection
+
+
+class MilvusManagerTests(SimpleTestCase):
+    def make_manager(self, backend):
+        backend.connect()
+        backend.get_collection("yongle_1").insert([
+            {"fulltext_id": 1, "sentence": "天地玄黃，", "category_type": 1, "embedding": [1.0, 0.0]},
+            {"fulltext_id": 2, "sentence": "宇宙洪荒。", "category_type": 2, "embedding": [0.6, 0.8]},
+        ])
+        backend.disconnect()
+        return MilvusManager(backend, ["yongle_1", "yongle_2"])
+
+    def test_connect_and_load_once(self):
+        backend = LocalBackend()
+        manager = self.make_manager(backend)
+        state = manager.preload()
+        self.assertEqual({name: s["state"] for name, s in state.items()}, {"yongle_1": LOADED, "yongle_2": LOADED})
+
+        for _ in range(3):
+            hits = manager.search("yongle_1", [[0.0, 1.0]], "embedding", {}, limit=1, output_fields=["fulltext_id"])
+        self.assertEqual(hits[0][0].entity.get("fulltext_id"), 2)
+        self.assertEqual(backend.connect_calls, 2)  # 一次为测试造数，一次为 manager
+        self.assertEqual(backend.collections["yongle_1"].load_calls, 1)
+
+    def test_expression_filter(self):
+        manager = self.make_manager(LocalBackend())
+        hits = manager.search("yongle_1", [[0.0, 1.0]], "embedding", {}, limit=5,
+                              expr='category_type in [1] && sentence like "天%"', output_fields=["sentence"])
+        self.assertEqual([hit.entity.get("sentence") for hit in hits[0]], ["天地玄黃，"])
+
+    def test_reconnects_after_failure(self):
+        backend = FlakyBackend()
+        manager = self.make_manager(backend)
+        hits = manager.search("yongle_1", [[1.0, 0.0]], "embedding", {}, limit=1)
+        self.assertEqual(hits[0][0].id, 1)
+        self.assertEqual(manager.stats()["reconnects"], 1)
+
+    def test_reconnects_after_pymilvus_connect_failure(self):
+        backend = FlakyBackend(MilvusException(MILVUS_CONNECT_FAILED, "Fail connecting to server"))
+        manager = self.make_manager(backend)
+        hits = manager.search("yongle_1", [[1.0, 0.0]], "embedding", {}, limit=1)
+        self.assertEqual(hits[0][0].id, 1)
+        self.assertEqual(manager.stats()["reconnects"], 1)
+
+    def test_connection_error_classification(self):
+        self.assertTrue(is_connection_error(MilvusException(MILVUS_CONNECT_FAILED)))
+        self.assertTrue(is_connection_error(MilvusException(StatusCode.UNAVAILABLE)))
+        self.assertTrue(is_connection_error(retries_exhausted(RpcError(StatusCode.UNAVAILABLE))))
+        self.assertTrue(is_connection_error(FutureTimeoutError()))
+        wrapped_timeout = MilvusException(1, "Unexpected error")
+        wrapped_timeout.__cause__ = FutureTimeoutError()
+        self.assertTrue(is_connection_error(wrapped_timeout))
+
+        self.assertFalse(is_connection_error(MilvusException(1, "collection not found")))
+        self.assertFalse(is_connection_error(RpcError(StatusCode.INVALID_ARGUMENT)))
+        self_caused = MilvusException(1, "bad expr")
+        self_caused.__cause__ = self_caused  # raise e from e
+        self.assertFalse(is_connection_error(self_caused))
+
+    def test_bad_expression_is_not_retried(self):
+        backend = LocalBackend()
+        manager = self.make_manager(backend)
+        with self.assertRaises(SyntaxError):
+            manager.search("yongle_1", [[1.0, 0.0]], "embedding", {}, limit=1, expr="category_type ==")
+        self.assertEqual(manager.stats()["reconnects"], 0)
+        self.assertEqual(backend.connect_calls, 2)
+
+
+class BrokenBackend(LocalBackend):
+    """连接或检索时抛出给定的异常"""
+    def __init__(self, connect_error=None, search_error=None):
+        super().__init__()
+        self.connect_error = connect_error
+        self.search_error = search_error
+
+    def connect(self):
+        if self.connect_error is not None:
+            raise self.connect_error
+        super().connect()
+
+    def get_collection(self, name):
+        collection = super().get_collection(name)
+        if self.search_error is not None:
+            def broken(*args, **kwargs):
+                raise self.search_error
+            collection.search = broken
+        return collection
+
+
+class FailoverManagerTests(SimpleTestCase):
+    def make_manager(self, primary):
+        fallback = LocalBackend()
+        fallback.connect()
+        fallback.get_collection("yongle_1").insert([{"fulltext_id": 7, "embedding": [1.0, 0.0]}])
+        return FailoverManager(MilvusManager(primary, ["yongle_1"], retries=0), MilvusManager(fallback, ["yongle_1"]))
+
+    def search(self, manager):
+        return manager.search("yongle_1", [[1.0, 0.0]], "embedding", {}, limit=1, output_fields=["fulltext_id"])
+
+    def test_falls_back_on_pymilvus_connection_errors(self):
+        for primary in (BrokenBackend(connect_error=MilvusException(MILVUS_CONNECT_FAILED, "Fail connecting")),
+                        BrokenBackend(search_error=retries_exhausted(RpcError(StatusCode.UNAVAILABLE)))):
+            manager = self.make_manager(primary)
+            with self.assertLogs("utils.milvus_client", level="WARNING"):
+                hits = self.search(manager)
+            self.assertEqual(hits[0][0].entity.get("fulltext_id"), 7)
+            self.assertEqual(manager.stats()["fallbacks"], 1)
+
+    def test_request_errors_are_not_failed_over(self):
+        manager = self.make_manager(BrokenBackend(search_error=MilvusException(1, "field not exist")))
+        with self.assertRaises(MilvusException):
+            self.search(manager)
+        self.assertEqual(manager.stats()["fallbacks"], 0)
+
+
+class FilterPushdownTests(SimpleTestCase):
+    def test_filters_translated_to_expression(self):
+        from apps.search.similar import UnsatisfiableFilter, build_filter_expr
+        from utils.milvus_client import compile_expr
+
+        expr = build_filter_expr({"category_type": "1", "document_type": "类事", "compilation_time": "永乐",
+                                  "specific_category": ""})
+        self.assertEqual(expr, 'category_type == 1 and doc_style == "类事" and compilation_time like "%永乐%"')
+        self.assertIsNone(build_filter_expr({}))
+        with self.assertRaises(UnsatisfiableFilter):
+            build_filter_expr({"category_type": "类书"})
+
+        matches = compile_expr(expr)
+        self.assertTrue(matches({"category_type": 1, "doc_style": "类事", "compilation_time": "明永乐年间"}))
+        self.assertFalse(matches({"category_type": 1, "doc_style": "类文", "compilation_time": "明永乐年间"}))
@@ -0,0 +1,165 @@
+# apps/tests/test_query_compiler.py
+from django.test import SimpleTestCase
+
+from apps.search.query_compiler import PreparedStatementCache, compile_search, render_sql
+
+
+class QueryCompilerTests(SimpleTestCase):
+    def test_keywords_are_bound_not_inlined(self):
+        compiled = compile_search([
+            {"column": "full_text", "keyword": "天地 NOT 玄黄 OR 日月'", "logic": ""},
+            {"column": "doc_style", "keyword": "类事", "logic": "AND"},
+        ], limit=5, offset=10)
+
+        self.assertNotIn("天地", compiled.sql)
+        self.assertNotIn("类事", compiled.sql)
+        self.assertIn("LIMIT %s OFFSET %s", compiled.sql)
+        scores = ("+天地 -玄黄", "+日月'")
+        self.assertEqual(compiled.params, scores + scores + scores + ("类事", 5, 10))
+
+    def test_same_shape_shares_sql(self):
+        """同形状不同关键词复用同一 SQL 文本"""
+        render_sql.cache_clear()
+        first = compile_search([{"column": "author_name", "keyword": "解缙", "logic": ""}])
+        second = compile_search([{"column": "author_name", "keyword": "姚广孝", "logic": ""}], limit=20)
+        self.assertEqual(first.shape, second.shape)
+        self.assertIs(first.sql, second.sql)
+        self.assertEqual(render_sql.cache_info().hits, 1)
+
+    def test_search_option_changes_shape_and_mode(self):
+        fuzzy = compile_search([{"column": "doc_title", "keyword": "永乐", "logic": "", "search_option": "模糊"}])
+        exact = compile_search([{"column": "doc_title", "keyword": "永乐", "logic": ""}])
+        self.assertIn("IN NATURAL LANGUAGE MODE", fuzzy.sql)
+        self.assertIn("IN BOOLEAN MODE", exact.sql)
+        self.assertNotEqual(fuzzy.shape, exact.shape)
+
+    def test_title_and_full_text_in_same_block_are_linked(self):
+        compiled = compile_search([
+            {"column": "title_name", "keyword": "天", "logic": ""},
+            {"column": "full_text", "keyword": "地", "logic": "AND"},
+        ])
+        self.assertIn("f.title_id = t.title_id", compiled.sql)
+
+    def test_ordered_by_weighted_relevance(self):
+        """各字段得分按权重加权，结果按综合相关度降序"""
+        with self.settings(SEARCH_FIELD_WEIGHTS={"title_name": 5, "full_text": 0.5}):
+            compiled = compile_search([
+                {"column": "title_name", "keyword": "天", "logic": ""},
+                {"column": "full_text", "keyword": "地", "logic": "AND"},
+            ])
+        self.assertIn("AS score_title_name", compiled.sql)
+        self.assertIn("5.0 * (MATCH(t.title_name) AGAINST(%s IN BOOLEAN MODE))"
+                      " + 0.5 * (MATCH(f.full_text) AGAINST(%s IN BOOLEAN MODE)) AS relevance", compiled.sql)
+        self.assertIn("ORDER BY relevance DESC", compiled.sql)
+
+    def test_narrow_projection_with_sql_preview(self):
+        compiled = compile_search([{"column": "full_text", "keyword": "天", "logic": ""}])
+        self.assertNotIn("DISTINCT", compiled.sql)
+        self.assertNotIn("d.*", compiled.sql)
+        self.assertIn("CONCAT(LEFT(f.full_text, 100), '···') AS full_text", compiled.sql)
+        self.assertIn("f.title_id", compiled.sql)  # 未连接标题表时 title_id 取自全文表
+
+
+class FacetTests(SimpleTestCase):
+    def test_one_grouped_query_summarized_per_field(self):
+        from apps.search.facets import FACET_FIELDS, summarize_facets
+        from apps.search.query_compiler import compile_facets
+
+        conditions = [
+            {"column": "doc_title", "keyword": "大典", "logic": ""},
+            {"column": "dynasty", "keyword": "明", "logic": "AND"},
+        ]
+        compiled = compile_facets(conditions, [column for _, column in FACET_FIELDS])
+        self.assertIn("GROUP BY d.category_type, d.doc_specific_category, d.doc_style, d.dynasty", compiled.sql)
+        self.assertIn("(d.dynasty = %s)", compiled.sql)
+        self.assertEqual(compiled.params, ("大典", "明"))
+
+        facets = summarize_facets([
+            {"category_type": 1, "doc_specific_category": "传记", "doc_style": "类事", "dynasty": "明", "cnt": 2},
+            {"category_type": 1, "doc_specific_category": None, "doc_style": "类文", "dynasty": "明", "cnt": 5},
+        ])
+        self.assertEqual(facets["category_type"], [{"value": 1, "count": 7}])
+        self.assertEqual(facets["document_type"], [{"value": "类文", "count": 5}, {"value": "类事", "count": 2}])
+        self.assertEqual(facets["specific_category"], [{"value": "传记", "count": 2}])
+
+    def test_branch_facets_count_overlapping_hits_once(self):
+        from apps.search.facets import fetch_facets
+
+        class KeyCursor:
+            def __init__(self):
+                self.executed = []
+                self.batches = [
+                    [{"doc_id": 1, "title_id": 10, "dynasty": "明"}, {"doc_id": 2, "title_id": 20, "dynasty": "明"}],
+                    # (1, 10) 同时被全文分支命中，只计一次
+                    [{"doc_id": 1, "title_id": 10, "dynasty": "明"}, {"doc_id": 3, "title_id": 30, "dynasty": "清"}],
+                ]
+
+            def execute(self, sql, params=None):
+                self.executed.append(sql)
+
+            def fetchall(self):
+                return self.batches.pop(0)
+
+        meta = [{"column": "doc_title", "keyword": "大典", "logic": ""},
+                {"column": "title_name", "keyword": "大典", "logic": "OR"}]
+        full = [{"column": "full_text", "keyword": "大典", "logic": ""}]
+        cursor = KeyCursor()
+        facets = fetch_facets(cursor, meta, full)
+        self.assertEqual(facets["dynasty"], [{"value": "明", "count": 2}, {"value": "清", "count": 1}])
+        self.assertIn("SELECT DISTINCT d.doc_id, t.title_id AS title_id", cursor.executed[0])
+        self.assertIn("SELECT DISTINCT d.doc_id, f.title_id AS title_id", cursor.executed[1])
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+
+
+class FakeRawConnection:
+    pass
+
+
+class PreparedStatementTests(SimpleTestCase):
+    def test_prepare_once_per_connection(self):
+        cache = PreparedStatementCache()
+        cursor = FakeCursor(FakeRawConnection())
+        compiled = compile_search([{"column": "author_org", "keyword": "翰林院", "logic": ""}])
+
+        cache.execute(cursor, compiled)
+        cache.execute(cursor, compile_search([{"column": "author_org", "keyword": "国子监", "logic": ""}]))
+
+        prepares = [sql for sql in cursor.executed if sql.startswith("PREPARE")]
+        executes = [sql for sql in cursor.executed if sql.startswith("EXECUTE")]
+        self.assertEqual(len(prepares), 1)
+        self.assertEqual(len(executes), 2)
+
+
+class KeysetPaginationTests(SimpleTestCase):
+    CONDITIONS = [{"column": "full_text", "keyword": "天", "logic": ""}]
+
+    def test_keyset_predicate_and_order(self):
+        compiled = compile_search(self.CONDITIONS, limit=21, offset=0, after=[0.5, 3, 42])
+        self.assertIn(", d.doc_id, f.full_text_id) < (%s, %s, %s)", compiled.sql)
+        self.assertIn("ORDER BY relevance DESC, d.doc_id DESC, f.full_text_id DESC", compiled.sql)
+        self.assertEqual(compiled.params, ("+天", "+天", "+天", "+天", 0.5, 3, 42, 21, 0))
+
+    def test_cursor_round_trip_carries_total(self):
+        from apps.search.pagination import decode_cursor, encode_cursor, row_sort_key
+
+        key = row_sort_key({"doc_id": 3, "full_text_id": 42, "title_id": 7, "relevance": 0.5}, self.CONDITIONS)
+        token = encode_cursor(self.CONDITIONS, key, 1500, False)
+        state = decode_cursor(token, self.CONDITIONS)
+        self.assertEqual(state, {"key": [0.5, 3, 42], "total": 1500, "total_exact": False})
+
+    def test_cursor_rejected_for_other_conditions(self):
+        from apps.search.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+        token = encode_cursor(self.CONDITIONS, [0.5, 3, 42], 10, True)
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(token, [{"column": "full_text", "keyword": "地", "logic": ""}])
+        with self.assertRaises(InvalidCursor):
+            decode_cursor("not-a-cursor", self.CONDITIONS)
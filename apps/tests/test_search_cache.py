@@ -0,0 +1,63 @@
+# apps/tests/test_search_cache.py
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.search.cache import (DEFAULT_CACHE_CONFIG, DjangoCacheBackend, LocalCacheBackend, NullCache,
+                               SearchResultCache, create_search_cache)
+from apps.search.pagination import conditions_digest
+from apps.search.query_compiler import compile_search
+
+
+class SearchResultCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = SearchResultCache(LocalCacheBackend(ttl=60, max_entries=2))
+
+    def test_equivalent_conditions_share_key(self):
+        """关键词空白、逻辑大小写、末尾过滤条件顺序不同，视为同一检索"""
+        a = [
+            {"column": "doc_title", "keyword": "天  地", "logic": ""},
+            {"column": "doc_style", "keyword": "类书", "logic": "AND"},
+            {"column": "category_type", "keyword": "子部", "logic": "AND"},
+        ]
+        b = [
+            {"column": "doc_title", "keyword": " 天 地", "logic": "", "search_option": "精确"},
+            {"column": "category_type", "keyword": "子部", "logic": "and"},
+            {"column": "doc_style", "keyword": "类书", "logic": "AND"},
+        ]
+        self.assertEqual(self.cache.make_key(a, page_size=10), self.cache.make_key(b, page_size=10))
+        self.assertNotEqual(self.cache.make_key(a, page_size=10), self.cache.make_key(a, page_size=20))
+        self.assertEqual(conditions_digest(a), conditions_digest(b))  # 缓存的 next_cursor 对两者都有效
+        # 共用缓存键的检索绑定的也是同样的参数
+        self.assertEqual(compile_search(a).params, compile_search([b[0], b[2], b[1]]).params)
+
+    def test_lru_and_ttl(self):
+        self.cache.set("k1", {"v": 1})
+        self.cache.set("k2", {"v": 2})
+        self.cache.get("k1")
+        self.cache.set("k3", {"v": 3})  # 淘汰最久未用的 k2
+        self.assertIsNone(self.cache.get("k2"))
+        self.assertEqual(self.cache.get("k1"), {"v": 1})
+
+        with mock.patch("apps.search.cache.time.monotonic", return_value=10 ** 9):
+            self.assertIsNone(self.cache.get("k1"))
+
+    def test_invalidate_changes_generation(self):
+        conditions = [{"column": "full_text", "keyword": "天", "logic": ""}]
+        key = self.cache.make_key(conditions)
+        self.cache.set(key, {"results": []})
+        self.cache.invalidate()
+        self.assertNotEqual(self.cache.make_key(conditions), key)
+        self.assertIsNone(self.cache.get(key))
+
+    def test_process_local_django_cache_is_disabled(self):
+        """LocMemCache 的代数不跨进程，宁可不缓存也不返回其他进程写入前的旧结果"""
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem), self.assertLogs('apps.search.cache', level='WARNING'):
+            self.assertIsInstance(create_search_cache(dict(DEFAULT_CACHE_CONFIG)), NullCache)
+
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                              'LOCATION': 'redis://127.0.0.1:6379/1'}}
+        with override_settings(CACHES=shared):
+            cache = create_search_cache(dict(DEFAULT_CACHE_CONFIG))
+        self.assertIsInstance(cache.backend, DjangoCacheBackend)
@@ -0,0 +1,155 @@
+# apps/tests/test_search_enrichment.py
+from django.test import SimpleTestCase
+
+from apps.search.enrichment import bulk_fetch_extra_fields
+
+
+class FakeCursor:
+    """按 SQL 关键字返回预置结果的假游标"""
+    def __init__(self, conn):
+        self.conn = conn
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append(sql)
+        for marker, rows in self.conn.responses.items():
+            if marker in sql:
+                self._rows = rows
+                return
+        self._rows = []
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeConnection:
+    def __init__(self, responses):
+        self.responses = responses
+        self.executed = []
+
+    def cursor(self, cursorclass=None):
+        return FakeCursor(self)
+
+
+class BulkEnrichmentTests(SimpleTestCase):
+    def make_conn(self):
+        return FakeConnection({
+            "FROM titles\n            WHERE doc_id": [
+                {"doc_id": 1, "title_name": "卷一", "cnt": 3},
+                {"doc_id": 2, "title_name": "卷二", "cnt": 1},
+            ],
+            "document_author_links": [
+                {"doc_id": 1, "author_name": "解缙", "author_org": "翰林院", "cnt": 2},
+            ],
+            "first_full_text_id": [
+                {"root_id": 10, "preview": "天地玄黄", "page_number": 3, "page_type": "A"},
+            ],
+            "FROM full_text_1\n            WHERE doc_id": [
+                {"doc_id": 2, "preview": "宇宙洪荒", "page_number": 0, "page_type": None},
+            ],
+            "FROM pages": [
+                {"doc_id": 1, "page_number": 3, "page_type": "A", "page_id": 99},
+            ],
+        })
+
+    def test_etc_semantics_and_page_resolution(self):
+        """多于一个标题/作者时加"等"，并按页码解析 page_id"""
+        enriched = bulk_fetch_extra_fields(self.make_conn(), [(1, 10), (2, None)])
+
+        self.assertEqual(enriched[(1, 10)], {
+            "title_name": "卷一 等",
+            "author_name": "解缙 等",
+            "author_org": "翰林院",
+            "full_text": "天地玄黄···",
+            "page_id": 99,
+        })
+        self.assertEqual(enriched[(2, None)]["title_name"], "卷二")
+        self.assertIsNone(enriched[(2, None)]["author_name"])
+        self.assertEqual(enriched[(2, None)]["full_text"], "宇宙洪荒···")
+        self.assertIsNone(enriched[(2, None)]["page_id"])
+
+    def test_query_count_independent_of_result_size(self):
+        """查询次数不随结果条数增长"""
+        conn = self.make_conn()
+        bulk_fetch_extra_fields(conn, [(doc_id % 3, doc_id) for doc_id in range(1, 101)])
+        self.assertLessEqual(len(conn.executed), 5)
+
+    def test_empty_keys(self):
+        conn = self.make_conn()
+        self.assertEqual(bulk_fetch_extra_fields(conn, []), {})
+        self.assertEqual(conn.executed, [])
+
+
+class CompareTextsTests(SimpleTestCase):
+    PAGE = {"page_id": 5, "page_number": 3, "page_type": "A", "doc_id": 1,
+            "doc_title": "永乐大典", "dynasty": "明", "doc_specific_category": None, "doc_theme": None,
+            "title_name": "卷一", "author_name": "解缙"}
+
+    def test_batch_resolves_with_two_queries(self):
+        from apps.search.compare import resolve_batch
+
+        conn = FakeConnection({
+            "UNION ALL": [dict(self.PAGE, lookup_kind="p", lookup_id=7), dict(self.PAGE, lookup_kind="f", lookup_id=11)],
+            "FROM page_fulltext": [
+                {"page_id": 5, "full_text_id": 11, "full_text": "天", "text_type": "正文", "full_text_order": 1,
+                 "related_id": None, "title_name": "卷一"},
+                {"page_id": 5, "full_text_id": 12, "full_text": "地", "text_type": "正文", "full_text_order": 2,
+                 "related_id": None, "title_name": "卷一"},
+            ],
+        })
+        items = [
+            {"title_id": 7, "page_number": 3, "page_type": "A"},
+            {"title_id": "7", "page_number": " 3", "page_type": "A"},  # 前端传字符串，与数据库取值规范化后相同
+            {"fulltext_id": 99},  # 找不到页面，跳过
+            {"fulltext_id": 11},
+            {"doc_id": 1},  # 缺少定位信息，跳过
+        ]
+        with conn.cursor() as cursor:
+            texts = resolve_batch(cursor, items)
+
+        self.assertEqual(len(conn.executed), 2)
+        self.assertEqual([t["title_id"] for t in texts], [7, "7", None])
+        self.assertEqual([t["text"] for t in texts[0]["full_texts"]], ["天", "地"])
+
+    def test_stream_returns_connection_when_closed_unstarted(self):
+        from django.http import StreamingHttpResponse
+
+        from apps.search.compare import stream_compare_json
+
+        class Conn(FakeConnection):
+            closed = False
+
+            def close(self):
+                self.closed = True
+
+        conn = Conn({})
+        StreamingHttpResponse(stream_compare_json(conn, [{"fulltext_id": 1}])).close()
+        self.assertTrue(conn.closed)
+
+
+class SimilarHitMetadataTests(SimpleTestCase):
+    def test_all_hits_resolved_with_one_query(self):
+        from apps.search.views import get_fulltext_infos, matches_filters
+
+        conn = FakeConnection({"FROM full_text_1 ft": [
+            {"full_text_id": 5, "doc_id": 1, "doc_title": "永樂大典", "title_name": "卷一", "text_type": "正文",
+             "page_id": 12, "category_type": 1, "doc_specific_category": "类书", "doc_style": "类事",
+             "compilation_time": "明永乐"},
+            {"full_text_id": 9, "doc_id": 2, "doc_title": "太平御览", "title_name": "卷二", "text_type": "注文",
+             "page_id": None, "category_type": 2, "doc_specific_category": "类书", "doc_style": "类文",
+             "compilation_time": "宋太平兴国"},
+        ]})
+        infos = get_fulltext_infos(conn.cursor(), [5, 9, 5, None])
+
+        self.assertEqual(len(conn.executed), 1)
+        self.assertEqual(set(infos), {5, 9})
+        self.assertTrue(matches_filters(infos[5], {"compilation_time": "永乐", "document_type": "类事"}))
+        self.assertFalse(matches_filters(infos[9], {"category_type": "1"}))
+        self.assertEqual(get_fulltext_infos(conn.cursor(), []), {})
+        self.assertEqual(len(conn.executed), 1)
@@ -0,0 +1,34 @@
+# apps/tests/test_search_highlight.py
+from django.test import SimpleTestCase
+
+from apps.search import highlight
+from apps.search.highlight import Highlighter
+
+HL = '<span class="highlight">{}</span>'
+
+
+class HighlighterTests(SimpleTestCase):
+    def test_phrase_terms_per_field(self):
+        """精确检索按短语高亮；NOT 排除词不高亮；其他字段的检索词不影响本字段"""
+        highlighter = Highlighter.from_conditions([
+            {"column": "title_name", "keyword": "天地 NOT 人", "logic": ""},
+            {"column": "author_name", "keyword": "解缙", "logic": "AND"},
+        ])
+        row = {"title_name": "天文 天地人", "author_name": "解缙等", "doc_title": "天地"}
+        result = highlighter.highlight_row(row)
+        self.assertEqual(result["title_name"], "天文 " + HL.format("天地") + "人")
+        self.assertEqual(result["author_name"], HL.format("解缙") + "等")
+        self.assertEqual(result["doc_title"], "天地")
+        self.assertEqual(row["title_name"], "天文 天地人")  # 原行不变
+
+    def test_fuzzy_and_char_mode_merge_adjacent_matches(self):
+        highlighter = Highlighter.from_chars("天地")
+        self.assertEqual(highlighter.highlight("地天人", "sentence"), HL.format("地天") + "人")
+
+    def test_long_full_text_is_windowed(self):
+        text = "甲" * 1000 + "天地" + "乙" * 1000
+        highlighter = Highlighter.from_conditions([{"column": "full_text", "keyword": "天地", "logic": ""}])
+        result = highlighter.highlight(text, "full_text")
+        context = "甲" * highlight.WINDOW_CONTEXT
+        self.assertEqual(result, "···" + context + HL.format("天地") + "乙" * highlight.WINDOW_CONTEXT + "···")
+
@@ -0,0 +1,59 @@
+# apps/tests/test_search_ranking.py
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from apps.search import views
+from apps.search.cache import NullCache
+from apps.search.ranking import merge_top_k
+from utils.database import PoolTimeout
+
+
+class SingleConnectionPool:
+    """只有一个连接的连接池：已借出时等待片刻后超时，模拟连接池耗尽"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.available = threading.Semaphore(1)
+
+    def acquire(self):
+        if not self.available.acquire(timeout=2):
+            raise PoolTimeout("连接池已耗尽")
+        conn = mock.MagicMock()
+        conn.cursor.return_value.__enter__.return_value.fetchall.return_value = list(self.rows)
+        conn.close.side_effect = self.available.release
+        return conn
+
+
+class MergeTopKTests(SimpleTestCase):
+    def test_dedup_keeps_best_and_ranks_by_sql_relevance(self):
+        meta = [
+            {"doc_id": 1, "title_id": 10, "doc_title": "永乐大典", "relevance": 9.5},
+            {"doc_id": 2, "title_id": 20, "author_name": "解缙", "relevance": 1.0},
+        ]
+        full = [
+            {"doc_id": 2, "title_id": 20, "full_text": "大典 大典", "relevance": 4.0},
+            {"doc_id": 3, "title_id": 30, "full_text": "大典", "relevance": 2.0},
+        ]
+        merged = merge_top_k([meta, full], k=2)
+        self.assertEqual([(r["doc_id"], r["title_id"]) for r in merged], [(1, 10), (2, 20)])
+        self.assertEqual(merged[1]["relevance"], 4.0)  # 重复行保留相关度高的一条
+
+    def test_ties_prefer_earlier_branch(self):
+        merged = merge_top_k([[{"doc_id": 1, "title_id": 1, "relevance": 1.0}],
+                              [{"doc_id": 2, "title_id": 2, "relevance": 1.0}]], k=1)
+        self.assertEqual(merged[0]["doc_id"], 1)
+
+
+class AllFieldsFanoutTests(SimpleTestCase):
+    def test_request_does_not_hold_a_connection_while_branches_run(self):
+        """请求线程等待分支结果时不占用连接，连接池只剩一个连接时也不会超时"""
+        pool = SingleConnectionPool([{"doc_id": 1, "title_id": 10, "relevance": 1.0}])
+        conditions = [{"column": "all_fields", "keyword": "大典", "logic": ""}]
+        with mock.patch.object(views, "get_mysql_connection", pool.acquire), \
+                mock.patch.object(views, "get_search_cache", NullCache), \
+                mock.patch.object(views, "estimate_total", return_value=(1, True)), \
+                mock.patch.object(views, "enrich_results_with_missing_info", lambda conn, rows: list(rows)):
+            search_results = views.perform_search(conditions)
+        self.assertEqual([(r["doc_id"], r["title_id"]) for r in search_results["results"]], [(1, 10)])
@@ -0,0 +1,127 @@
+# apps/tests/test_similar_search.py
+from django.test import SimpleTestCase
+
+from utils.milvus_client import LocalBackend, MilvusManager
+
+
+class MultiWindowSearchTests(SimpleTestCase):
+    def test_plan_windows(self):
+        from apps.search.similar import plan_windows
+
+        texts, plan = plan_windows("天地玄黃，宇宙洪荒。")
+        self.assertEqual(texts, ["天地玄黃，宇宙洪荒。"])
+        self.assertEqual(plan, {"yongle_1": ([0], 0.5), "yongle_2": ([0], 1.0), "yongle_3": ([0], 0.5)})
+
+        long_query = "".join(f"第{i}句，" for i in range(20))
+        texts, plan = plan_windows(long_query, max_windows=8)
+        self.assertEqual(len(texts), 8)
+        self.assertTrue(texts[0].startswith("第0句") and texts[-1].endswith("第19句，"))
+        self.assertEqual(list(plan), ["yongle_4"])
+
+    def test_one_encode_and_per_fulltext_aggregation(self):
+        import numpy as np
+
+        from apps.search.similar import multi_window_search
+
+        backend = LocalBackend()
+        backend.connect()
+        backend.get_collection("yongle_4").insert([
+            {"fulltext_id": 1, "sentence": "甲", "embedding": [1.0, 0.0]},
+            {"fulltext_id": 1, "sentence": "乙", "embedding": [0.0, 1.0]},
+            {"fulltext_id": 2, "sentence": "丙", "embedding": [0.8, 0.6]},
+            {"fulltext_id": 3, "sentence": "丁", "embedding": [-1.0, 0.0]},
+        ])
+        manager = MilvusManager(backend, ["yongle_4"])
+        encoded = []
+
+        def encode(texts):
+            encoded.append(list(texts))
+            return np.array([[1.0, 0.0] if i % 2 == 0 else [0.0, 1.0] for i in range(len(texts))], dtype=np.float32)
+
+        merged = multi_window_search(manager, encode, "一，二，三，四，五，", limit=3)
+        self.assertEqual(len(encoded), 1)
+        self.assertEqual(len(encoded[0]), 2)
+        self.assertEqual([candidate["fulltext_id"] for candidate in merged], [1, 2])
+        self.assertEqual(merged[0]["matched_windows"], 2)
+        self.assertAlmostEqual(merged[0]["score"], 1.0)
+
+    def test_timeout_is_passed_to_the_collection_search(self):
+        import numpy as np
+
+        from apps.search.similar import multi_window_search
+
+        backend = LocalBackend()
+        backend.connect()
+        collection = backend.get_collection("yongle_4")
+        collection.insert([{"fulltext_id": 1, "sentence": "甲", "embedding": [1.0, 0.0]}])
+        timeouts = []
+        search = collection.search
+        collection.search = lambda *args, **kwargs: timeouts.append(kwargs.get("timeout")) or search(*args, **kwargs)
+
+        multi_window_search(MilvusManager(backend, ["yongle_4"]), lambda texts: np.ones((len(texts), 2)) / 2 ** 0.5,
+                            "一，二，三，四，五，", limit=3, timeout=2)
+        self.assertEqual(timeouts, [2])
+
+
+class CollapseHitsTests(SimpleTestCase):
+    @staticmethod
+    def hit(fulltext_id, sentence, score):
+        return {"collection_name": "yongle_2", "fulltext_id": fulltext_id, "sentence": sentence,
+                "similarity": score, "score": score}
+
+    def test_overlapping_windows_collapse_to_best(self):
+        from apps.search.similar import collapse_hits
+
+        hits = [
+            self.hit(1, "天地玄黃，宇宙洪荒。", 0.9),
+            self.hit(1, "宇宙洪荒。日月盈昃，", 0.8),
+            self.hit(1, "辰宿列張，寒來暑往。", 0.7),
+            self.hit(2, "天地玄黃，宇宙洪荒。", 0.85),
+        ]
+        collapsed = collapse_hits(hits)
+        self.assertEqual([(c["fulltext_id"], c["score"], c["collapsed"]) for c in collapsed],
+                         [(1, 0.9, 1), (2, 0.85, 0)])
+        # 每段全文保留两组时，不重叠的窗口单独成组
+        self.assertEqual([c["score"] for c in collapse_hits(hits, max_per_fulltext=2)], [0.9, 0.85, 0.7])
+
+    def test_diverse_search_over_fetches_until_filled(self):
+        from apps.search.similar import diverse_search
+
+        corpus = [self.hit(i // 5, f"第{i}句，", 1 - i / 100) for i in range(100)]  # 每段全文 5 个窗口
+        limits = []
+
+        def search(limit):
+            limits.append(limit)
+            return corpus[:limit], limit >= len(corpus)
+
+        results, limit = diverse_search(search, want=10, limit=10, max_limit=200)
+        self.assertGreaterEqual(len(results), 10)
+        self.assertEqual(len({c["fulltext_id"] for c in results}), len(results))
+        self.assertEqual(limits[0], 10)
+        self.assertGreater(limit, 10)
+
+
+class IndexProfileTests(SimpleTestCase):
+    def test_quantized_profile_reranks_with_raw_vectors(self):
+        from apps.search.similar import ann_search
+        from utils.vector_schema import INDEX_PROFILES
+
+        backend = LocalBackend()
+        backend.connect()
+        backend.get_collection("yongle_1").insert([
+            {"fulltext_id": i, "sentence": str(i), "embedding": [1.0 - i / 10, i / 10]} for i in range(10)
+        ])
+        manager = MilvusManager(backend, ["yongle_1"])
+        calls = []
+        search = manager.search
+        manager.search = lambda *args, **kwargs: calls.append((args, kwargs)) or search(*args, **kwargs)
+
+        hits = ann_search(manager, "yongle_1", [[1.0, 0.0]], 2, profile=INDEX_PROFILES["ivf_sq8"])[0]
+        self.assertEqual([hit.entity["fulltext_id"] for hit in hits], [0, 1])
+        self.assertNotIn("embedding", hits[0].entity)
+        self.assertEqual(calls[-1][1]["limit"], 2 * INDEX_PROFILES["ivf_sq8"]["rerank"])
+        self.assertIn("embedding", calls[-1][1]["output_fields"])
+
+        # HNSW 的 ef 随 topk 调大
+        ann_search(manager, "yongle_1", [[1.0, 0.0]], 500, profile=INDEX_PROFILES["hnsw"])
+        self.assertEqual(calls[-1][0][3]["params"]["ef"], 500)
@@ -0,0 +1,70 @@
+# apps/tests/test_title_hierarchy.py
+from django.test import SimpleTestCase
+
+from utils.title_hierarchy import build_closure, compute_first_full_text, doc_ids_of, refresh_titles
+
+
+class FakeCursor:
+    """按 SQL 关键字返回 titles / 首段全文两类查询的结果，记录 first_full_text_id 的更新"""
+
+    def __init__(self, titles, own_first_text):
+        self.titles = titles  # {title_id: (doc_id, parent_id)}
+        self.own_first_text = own_first_text
+        self.updates = {}
+        self.result = []
+
+    def execute(self, sql, params=()):
+        if 'ROW_NUMBER' in sql:
+            self.result = [(t, text) for t, text in self.own_first_text.items()
+                           if t in self.titles and self.titles[t][0] in params]
+        elif 'SELECT DISTINCT doc_id' in sql:
+            self.result = sorted({(self.titles[t][0],) for t in params if t in self.titles})
+        else:
+            self.result = [(doc_id, t, parent_id) for t, (doc_id, parent_id) in self.titles.items()
+                           if doc_id in params]
+
+    def executemany(self, sql, rows):
+        self.updates.update((title_id, text_id) for text_id, title_id in rows)
+
+    def fetchall(self):
+        return self.result
+
+
+class TitleHierarchyTests(SimpleTestCase):
+    # 1 ─┬─ 2 ── 4
+    #    └─ 3
+    TITLES = [(1, None), (2, 1), (3, 1), (4, 2)]
+
+    def test_closure_rows_and_preorder(self):
+        closure_rows, preorder = build_closure(self.TITLES)
+        self.assertEqual(preorder, [1, 2, 4, 3])
+        self.assertIn((1, 4, 2), closure_rows)
+        self.assertIn((2, 4, 1), closure_rows)
+        self.assertIn((3, 3, 0), closure_rows)
+        self.assertEqual(len(closure_rows), 4 + 3 + 1)
+
+    def test_first_full_text_follows_depth_first_order(self):
+        """自身无全文时，先深入第一个子标题的子树，再看后面的兄弟"""
+        closure_rows, preorder = build_closure(self.TITLES)
+        first = compute_first_full_text(closure_rows, preorder, {3: 300, 4: 400})
+        self.assertEqual(first, {1: 400, 2: 400, 4: 400, 3: 300})
+
+    def test_cycle_is_broken_and_still_refreshed(self):
+        with self.assertLogs("utils.title_hierarchy", "WARNING") as logs:
+            closure_rows, preorder = build_closure([(1, 2), (2, 1), (3, None)])
+        self.assertEqual(preorder, [3, 1, 2])
+        self.assertIn((1, 2, 1), closure_rows)
+        self.assertIn("[1, 2]", logs.output[0])
+
+    def test_deep_tree_does_not_hit_recursion_limit(self):
+        titles = [(i, i - 1 if i else None) for i in range(1500)]
+        closure_rows, preorder = build_closure(titles)
+        self.assertEqual(preorder, list(range(1500)))
+        self.assertIn((0, 1499, 1499), closure_rows)
+
+    def test_delete_refreshes_old_ancestors(self):
+        cursor = FakeCursor({1: (10, None), 2: (10, 1), 3: (10, 1)}, {2: 200, 3: 300})
+        old_doc_ids = doc_ids_of(cursor, [2])
+        del cursor.titles[2]  # 删除标题 2 后，祖先 1 的首段应落到 3
+        refresh_titles(cursor, [], doc_ids=old_doc_ids)
+        self.assertEqual(cursor.updates, {1: 300, 3: 300})
@@ -0,0 +1,167 @@
+# apps/tests/test_vector_ingest.py
+import os
+import tempfile
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from utils.milvus_client import LocalBackend
+from utils.vector_ingest import Checkpoint, IngestPipeline, LocalTarget, resume_point
+
+
+def fulltext_row(fulltext_id, text):
+    return (fulltext_id, text, 1, 1, "综合性类书", "类事", "明永乐")
+
+
+class Crash(Exception):
+    pass
+
+
+class IngestPipelineTests(SimpleTestCase):
+    ROWS = [fulltext_row(1, "天地玄黃，宇宙洪荒。"), fulltext_row(2, "日月盈昃，辰宿列張。寒來暑往，"),
+            fulltext_row(3, "秋收冬藏。")]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.checkpoint = Checkpoint(os.path.join(self.tmp.name, "checkpoint.json"))
+        self.encode_calls = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def encode(self, texts):
+        self.encode_calls.append(len(texts))
+        return np.ones((len(texts), 4), dtype=np.float32) / 2
+
+    def counts(self, backend):
+        return {name: collection.num_entities for name, collection in sorted(backend.collections.items())}
+
+    def test_windows_batched_across_paragraphs(self):
+        backend = LocalBackend()
+        target = LocalTarget(backend)
+        resume_point(target, self.checkpoint)
+        stats = IngestPipeline(target, self.encode, self.checkpoint, encode_batch_size=100).run(self.ROWS)
+
+        self.assertEqual(self.encode_calls, [10])  # 3 段全文的全部片段一次编码
+        self.assertEqual(self.counts(backend), {"yongle_1": 6, "yongle_2": 3, "yongle_3": 1, "yongle_4": 0})
+        row = backend.collections["yongle_2"].rows[0]
+        self.assertEqual((row["fulltext_id"], row["sentence"], row["doc_style"]), (1, "天地玄黃，宇宙洪荒。", "类事"))
+        self.assertEqual(stats["inserted"], 10)
+        self.assertEqual(self.checkpoint.load()["last_full_text_id"], 3)
+
+    def test_resume_after_crash_does_not_duplicate(self):
+        backend = LocalBackend()
+        target = LocalTarget(backend)
+
+        def crashing_rows():
+            yield from self.ROWS[:2]
+            raise Crash()
+
+        resume_point(target, self.checkpoint)
+        pipeline = IngestPipeline(target, self.encode, self.checkpoint, encode_batch_size=1, insert_batch_size=1,
+                                  checkpoint_every=1)
+        with self.assertRaises(Crash):
+            pipeline.run(crashing_rows())
+        self.assertEqual(self.checkpoint.load()["last_full_text_id"], 2)
+        backend.get_collection("yongle_1").insert([{"fulltext_id": 3, "sentence": "残留", "embedding": [0, 0, 0, 0]}])
+
+        after_id = resume_point(target, self.checkpoint)
+        IngestPipeline(target, self.encode, self.checkpoint).run(row for row in self.ROWS if row[0] > after_id)
+        self.assertEqual(after_id, 2)
+        self.assertEqual(self.counts(backend), {"yongle_1": 6, "yongle_2": 3, "yongle_3": 1, "yongle_4": 0})
+
+    def test_crash_before_first_checkpoint_does_not_duplicate(self):
+        backend = LocalBackend()
+        target = LocalTarget(backend)
+
+        def crashing_rows():
+            yield from self.ROWS[:2]
+            raise Crash()
+
+        resume_point(target, self.checkpoint)
+        pipeline = IngestPipeline(target, self.encode, self.checkpoint, encode_batch_size=1, insert_batch_size=1,
+                                  checkpoint_every=100)
+        with self.assertRaises(Crash):
+            pipeline.run(crashing_rows())
+        self.assertNotIn("last_full_text_id", self.checkpoint.load())
+        self.assertGreater(sum(self.counts(backend).values()), 0)  # 已写入但没有记录检查点
+
+        after_id = resume_point(target, self.checkpoint)
+        self.assertEqual(after_id, 0)
+        IngestPipeline(target, self.encode, self.checkpoint).run(row for row in self.ROWS if row[0] > after_id)
+        self.assertEqual(self.counts(backend), {"yongle_1": 6, "yongle_2": 3, "yongle_3": 1, "yongle_4": 0})
+
+
+class FakeSyncCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if sql.startswith("DELETE FROM fulltext_vector_log"):
+            self.conn.log = [row for row in self.conn.log if row[0] not in params]
+        elif "FROM fulltext_vector_log" in sql:
+            self._rows = sorted(self.conn.log)[:params[0]]
+        else:
+            self._rows = [row for row in self.conn.fulltexts if row[0] in params]
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeSyncConnection:
+    def __init__(self, fulltexts, log):
+        self.fulltexts = fulltexts
+        self.log = log
+
+    def cursor(self):
+        return FakeSyncCursor(self)
+
+    def commit(self):
+        pass
+
+
+class VectorSyncTests(SimpleTestCase):
+    def test_incremental_upsert_delete_and_metadata(self):
+        from utils.vector_sync import VectorSync, collapse_ops
+
+        self.assertEqual(collapse_ops([(1, 5, "upsert"), (2, 5, "meta"), (3, 6, "meta"), (4, 7, "upsert"),
+                                       (5, 7, "delete")]), {5: "upsert", 6: "meta", 7: "delete"})
+
+        backend = LocalBackend()
+        target = LocalTarget(backend)
+        target.prepare(["yongle_1", "yongle_2", "yongle_3", "yongle_4"], load=True)
+        encoded = []
+
+        def encode(texts):
+            encoded.extend(texts)
+            return np.ones((len(texts), 4), dtype=np.float32) / 2
+
+        IngestPipeline(target, encode).run([fulltext_row(1, "天地玄黃，宇宙洪荒。"), fulltext_row(2, "日月盈昃，")])
+        encoded.clear()
+
+        conn = FakeSyncConnection(
+            fulltexts=[(1, "天地玄黃，宇宙洪荒。", 1, 2, "传记", "类文", "明"), (3, "寒來暑往，", 1, 1, "", "类事", "")],
+            log=[(10, 3, "upsert"), (11, 2, "delete"), (12, 1, "meta")],
+        )
+        totals = VectorSync(conn, target, encode, batch_size=2).run_once()
+
+        self.assertEqual(encoded, ["寒來暑往，"])  # 只有新全文重新编码
+        self.assertEqual(totals["log_rows"], 3)
+        self.assertEqual((totals["reencoded"], totals["metadata_updated"], totals["deleted"]), (1, 1, 1))
+        rows = backend.collections["yongle_1"].rows
+        self.assertEqual(sorted(row["fulltext_id"] for row in rows), [1, 1, 3])
+        self.assertEqual({row["doc_style"] for row in rows if row["fulltext_id"] == 1}, {"类文"})
+        self.assertEqual(conn.log, [])  # 处理完的日志已删除
+        self.assertEqual(VectorSync(conn, target, encode).run_once()["log_rows"], 0)
+
+        # 较小的 log_id 晚于已处理的日志才提交，仍会被处理
+        conn.log.append((9, 3, "delete"))
+        self.assertEqual(VectorSync(conn, target, encode).run_once()["deleted"], 1)
+        self.assertEqual(sorted(row["fulltext_id"] for row in backend.collections["yongle_1"].rows), [1, 1])
@@ -0,0 +1,109 @@
+# apps/tests/test_vector_store.py
+import tempfile
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from utils.milvus_client import FailoverManager, LocalBackend, MilvusManager, compile_expr
+from utils.vector_store import NumpyBackend, NumpyTarget, VectorStore, compile_array_expr
+
+
+def make_rows(count, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    styles = ["类事", "类文", ""]
+    return [{"fulltext_id": i // 3, "sentence": f"第{i}句。", "doc_id": i % 7, "category_type": i % 4,
+             "doc_specific_category": "综合性类书", "doc_style": styles[i % 3], "compilation_time": "明永乐",
+             "embedding": vectors[i].tolist()} for i in range(count)]
+
+
+class VectorStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.rows = make_rows(300)
+        target = NumpyTarget(self.tmp.name, segment_rows=120)
+        target.prepare(["yongle_2"])
+        for start in range(0, len(self.rows), 50):
+            target.insert("yongle_2", self.rows[start:start + 50])
+        target.flush()
+        self.store = VectorStore(self.tmp.name, "yongle_2")
+        self.store.load()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def brute_force(self, query, expr, limit):
+        matches = compile_expr(expr)
+        candidates = [row for row in self.rows if matches(row)]
+        scores = [float(np.dot(row["embedding"], query)) for row in candidates]
+        order = np.argsort(scores)[::-1][:limit]
+        return [(candidates[i]["sentence"], round(scores[i], 5)) for i in order]
+
+    def test_exact_search_matches_brute_force(self):
+        self.assertEqual(len(self.store.segments), 2)
+        queries = [row["embedding"] for row in make_rows(3, seed=1)]
+        expr = 'category_type == 1 and doc_style == "类事" and compilation_time like "%永乐%" and fulltext_id != 4'
+        with mock.patch("utils.vector_store.CHUNK_ROWS", 32):
+            for filter_expr in (None, expr, 'not (doc_style in ["类事", "类文"]) || doc_id > 5'):
+                results = self.store.search(queries, "embedding", {}, 10, expr=filter_expr,
+                                            output_fields=["sentence"])
+                for query, hits in zip(queries, results):
+                    self.assertEqual([(hit.entity["sentence"], round(hit.distance, 5)) for hit in hits],
+                                     self.brute_force(query, filter_expr, 10))
+
+    def test_array_expr_agrees_with_row_expr(self):
+        expr = '(doc_style == "类文" or category_type in [0, 2]) and !(doc_id == 3)'
+        mask = np.concatenate([compile_array_expr(expr)(segment) for segment in self.store.segments])
+        self.assertEqual(mask.tolist(), [compile_expr(expr)(row) for row in self.rows])
+
+    def test_delete_and_failover(self):
+        self.assertEqual(self.store.delete("fulltext_id > 90"), 300 - 91 * 3)
+        reloaded = VectorStore(self.tmp.name, "yongle_2")
+        reloaded.load()
+        self.assertEqual(reloaded.num_entities, 91 * 3)
+
+        class DownBackend(LocalBackend):
+            def connect(self):
+                raise ConnectionError("Milvus 未启动")
+
+        manager = FailoverManager(MilvusManager(DownBackend(), ["yongle_2"]),
+                                  MilvusManager(NumpyBackend(self.tmp.name), ["yongle_2"], retries=0))
+        with self.assertLogs(level="WARNING"):
+            manager.connect()
+        hits = manager.search("yongle_2", [self.rows[0]["embedding"]], "embedding", {}, limit=1,
+                              output_fields=["fulltext_id"])[0]
+        self.assertEqual(hits[0].entity["fulltext_id"], 0)
+        self.assertGreaterEqual(manager.stats()["fallbacks"], 2)
+
+        # 请求本身的错误（如表达式写错）不切换后备后端
+        manager = FailoverManager(MilvusManager(LocalBackend(), ["yongle_2"]),
+                                  MilvusManager(NumpyBackend(self.tmp.name), ["yongle_2"], retries=0))
+        with self.assertRaises(SyntaxError):
+            manager.search("yongle_2", [self.rows[0]["embedding"]], "embedding", {}, limit=1, expr="doc_id ==")
+        self.assertEqual(manager.stats()["fallbacks"], 0)
+
+
+class VectorBenchmarkTests(SimpleTestCase):
+    def test_sweep_reports_recall_against_exact_search(self):
+        from utils.vector_benchmark import LocalBench, run_benchmark, store_queries, sweep_configs
+
+        class TunableLocalBench(LocalBench):
+            tunable = True
+            built = []
+
+            def build(self, index_params):
+                self.built.append(index_params)
+                return super().build(index_params)
+
+        rows = [dict(row, id=i) for i, row in enumerate(make_rows(120))]
+        configs = sweep_configs(["hnsw"], [8, 16], [200], [16, 64], [], [])
+        with tempfile.TemporaryDirectory() as tmp:
+            report = run_benchmark(TunableLocalBench(), rows, store_queries(rows, 10), configs, tmp, k=5)
+
+        self.assertEqual([params["params"]["M"] for params in TunableLocalBench.built], [8, 16])
+        self.assertEqual([(row["index"], row["search"]) for row in report],
+                         [("HNSW M=8 efC=200", "ef=16"), ("HNSW M=8 efC=200", "ef=64"),
+                          ("HNSW M=16 efC=200", "ef=16"), ("HNSW M=16 efC=200", "ef=64")])
+        self.assertTrue(all(row["recall@5"] == 1.0 for row in report))
@@ -44,6 +44,67 @@ DB_CONFIG = {
     'charset': 'utf8mb4'
 }
 
+# 数据库连接池配置（utils.database.connect_db），只写需要覆盖的项，默认值见 utils/database.py 的 DEFAULT_POOL_CONFIG
+DB_POOL_CONFIG = {
+    'max_size': 10,  # 每个进程最多持有的连接数，按工作进程数和 MySQL max_connections 调整
+}
+
+# 检索查询是否使用服务端预处理语句（PREPARE/EXECUTE），同形状查询在同一连接上只准备一次
+SEARCH_PREPARED_STATEMENTS = False
+
+# 检索相关度的字段权重（综合相关度 = Σ 权重 × 字段 MATCH 得分），标题 > 作者 > 全文
+SEARCH_FIELD_WEIGHTS = {
+    'doc_title': 3.0,
+    'title_name': 3.0,
+    'author_name': 2.0,
+    'author_org': 1.5,
+    'full_text': 1.0,
+}
+
+# 检索结果缓存（apps.search.cache），只写需要覆盖的项，默认值见 apps/search/cache.py 的 DEFAULT_CACHE_CONFIG
+# BACKEND: django 使用 CACHES 中 ALIAS 指定的缓存，该缓存必须是 Redis/Memcached 等共享缓存，失效才能跨进程生效；
+# 未配置 CACHES 时 Django 默认使用进程内的 LocMemCache，此时检索缓存会记录警告并关闭。
+# local 为进程内 LRU，只适用于单进程部署；none 关闭缓存
+SEARCH_CACHE = {
+    'BACKEND': 'django',
+}
+
+# 启用检索缓存时配置共享缓存，例如（需安装 redis）：
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': 'redis://127.0.0.1:6379/1',
+#     }
+# }
+
+# 异文检索的句向量模型（utils.embedding），每个工作进程只加载一次；
+# 只写需要覆盖的项，默认值见 utils/embedding.py 的 DEFAULT_EMBEDDING_CONFIG
+EMBEDDING_MODEL = {
+    'MODEL_PATH': '/root/leishu/bert-ancient-chinese',  # 本地模型目录，请替换你的存放地址
+    'CACHE_SPILL_FILE': None,  # 如 '/tmp/leishu_query_vectors'：内存淘汰的查询向量溢出到内存映射文件（按进程加后缀，映射后即删除）
+}
+
+# 异文检索的 Milvus 向量库（utils.milvus_client），每个工作进程只连接一次；
+# 只写需要覆盖的项，默认值见 utils/milvus_client.py 的 DEFAULT_MILVUS_CONFIG
+MILVUS_CONFIG = {
+    'HOST': 'localhost',
+    'PORT': '19530',
+    # 过滤条件翻译成表达式在向量检索中生效；现有集合不含元数据字段，保持 False（检索后再过滤），
+    # 用 python -m utils.vector_ingest --restart 按含元数据字段的新结构重建全部集合后再改为 True
+    'FILTER_PUSHDOWN': False,
+    # 向量索引方案：hnsw / ivf_sq8 / ivf_pq，须与 python -m utils.milvus2 --profile <方案> 所建索引一致
+    'INDEX_PROFILE': 'hnsw',
+    # Milvus 不可用时改用本地精确检索：先用 python -m utils.vector_store export 导出到 BASE_DIR/vector_index/store，
+    # 再设为 'numpy'；None 不启用
+    'FALLBACK_BACKEND': None,
+}
+
+# 句向量流式建库（python -m utils.vector_ingest）与增量同步（python -m utils.vector_sync，
+# 日志表和触发器见 utils/vector_sync.sql），建库检查点默认写入 BASE_DIR/vector_index/；
+# 按需覆盖，默认值见各模块的 DEFAULT_INGEST_CONFIG / DEFAULT_SYNC_CONFIG
+VECTOR_INGEST = {}
+VECTOR_SYNC = {}
+
 
 # Elasticsearch连接配置
 ES_NEEDS_AUTH = True
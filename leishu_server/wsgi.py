@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'leishu_server.settings')
 
 application = get_wsgi_application()
+
+# 工作进程启动后在后台加载异文检索的句向量模型并预加载 Milvus 集合，首个检索请求不再等待
+from utils.embedding import warmup_in_background  # noqa: E402
+from utils.milvus_client import preload_in_background  # noqa: E402
+
+warmup_in_background()
+preload_in_background()
@@ -1,6 +1,9 @@
 from django.conf import settings
 import pymysql
 import logging
+import os
+import threading
+import time
 
 if settings.LOGGER == "default":
     logger = logging.getLogger(__name__)
@@ -9,12 +12,250 @@ else:
 
 DB_CONFIG = settings.DB_CONFIG
 
-def connect_db(config=DB_CONFIG, **kwargs):
-    """连接MySQL数据库"""
+# 连接池配置，可在 settings.DB_POOL_CONFIG 中覆盖
+DEFAULT_POOL_CONFIG = {
+    'max_size': 10,          # 每个进程最多持有的连接数
+    'wait_timeout': 10,      # 连接池耗尽时最长等待秒数
+    'idle_timeout': 300,     # 空闲超过该秒数的连接会被回收
+    'ping_interval': 30,     # 空闲超过该秒数的连接在借出前先 ping 一次
+}
+
+
+class PoolTimeout(Exception):
+    """连接池耗尽且等待超时"""
+
+
+class PooledConnection:
+    """
+    连接池借出的连接代理。
+    除 close() 外的所有属性都转发给底层 PyMySQL 连接；
+    close() 不会真正断开，而是把连接归还给连接池。
+    """
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get('_raw')
+        if raw is None:
+            raise pymysql.err.InterfaceError("连接已归还连接池")
+        return getattr(raw, name)
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # 调用方忘记 close() 时兜底归还，避免连接池被耗尽
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    进程内 PyMySQL 连接池：
+    - 有界：同时借出的连接不超过 max_size，耗尽时等待 wait_timeout 秒
+    - 健康检查：空闲超过 ping_interval 的连接借出前 ping，失败则丢弃重建
+    - 空闲回收：空闲超过 idle_timeout 的连接在借还时被关闭
+    - 借出时可指定 DictCursor 或默认元组游标
+    - 统计借出次数、等待时间等指标
+    """
+    def __init__(self, config, max_size=10, wait_timeout=10, idle_timeout=300, ping_interval=30,
+                 connect=pymysql.connect):
+        self.config = dict(config)
+        self.max_size = max_size
+        self.wait_timeout = wait_timeout
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self._connect = connect
+        self._default_cursorclass = self.config.pop('cursorclass', pymysql.cursors.Cursor)
+        self._idle = []  # [(raw_conn, 归还时间)]，后进先出
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._metrics = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'ping_failures': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+        }
+
+    def _close_raw(self, raw):
+        self._metrics['closed'] += 1
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _reap_idle(self, now):
+        """回收空闲过久的连接，调用方需持有锁"""
+        keep = []
+        for raw, returned_at in self._idle:
+            if now - returned_at > self.idle_timeout:
+                self._close_raw(raw)
+            else:
+                keep.append((raw, returned_at))
+        self._idle = keep
+
+    def _checkout_idle(self, now):
+        """取出最近归还的空闲连接及是否需要 ping，没有则返回 (None, False)，调用方需持有锁"""
+        if not self._idle:
+            return None, False
+        raw, returned_at = self._idle.pop()
+        return raw, now - returned_at > self.ping_interval
+
+    def _ping(self, raw):
+        """借出前的健康检查（不持有锁，慢连接不会阻塞其他借用方），失败则关闭连接并返回 False"""
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception as e:
+            logger.warning(f"连接池连接健康检查失败，已丢弃: {e}")
+            with self._cond:
+                self._metrics['ping_failures'] += 1
+                self._close_raw(raw)
+            return False
+
+    def acquire(self, cursorclass=None):
+        """借出一个连接，cursorclass 为 None 时使用配置中的默认游标"""
+        start = time.monotonic()
+        deadline = start + self.wait_timeout
+        raw = None
+        needs_ping = False
+        with self._cond:
+            waited = False
+            while True:
+                now = time.monotonic()
+                self._reap_idle(now)
+                raw, needs_ping = self._checkout_idle(now)
+                if raw is not None or self._in_use + len(self._idle) < self.max_size:
+                    self._in_use += 1
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._metrics['timeouts'] += 1
+                    raise PoolTimeout(f"数据库连接池已耗尽（max_size={self.max_size}），等待 {self.wait_timeout} 秒超时")
+                waited = True
+                self._cond.wait(remaining)
+
+            wait_ms = (time.monotonic() - start) * 1000
+            self._metrics['checkouts'] += 1
+            if waited:
+                self._metrics['waits'] += 1
+            self._metrics['total_wait_ms'] += wait_ms
+            self._metrics['max_wait_ms'] = max(self._metrics['max_wait_ms'], wait_ms)
+
+        # 名额已占用：ping 失败的连接直接用新连接替换
+        if raw is not None and needs_ping and not self._ping(raw):
+            raw = None
+
+        if raw is None:
+            try:
+                raw = self._connect(**self.config)
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._metrics['created'] += 1
+
+        raw.cursorclass = cursorclass or self._default_cursorclass
+        return PooledConnection(self, raw)
+
+    def release(self, raw):
+        """归还连接：结束未提交的事务，避免下一个借用方读到旧快照"""
+        healthy = True
+        try:
+            raw.rollback()
+        except Exception:
+            healthy = False
+        with self._cond:
+            self._in_use -= 1
+            if healthy and raw.open:
+                self._idle.append((raw, time.monotonic()))
+            else:
+                self._close_raw(raw)
+            self._cond.notify()
+
+    def close_all(self):
+        """关闭所有空闲连接（借出的连接归还后照常回收）"""
+        with self._cond:
+            for raw, _ in self._idle:
+                self._close_raw(raw)
+            self._idle = []
+
+    def stats(self):
+        """连接池指标"""
+        with self._cond:
+            metrics = dict(self._metrics)
+            metrics['in_use'] = self._in_use
+            metrics['idle'] = len(self._idle)
+            metrics['max_size'] = self.max_size
+            metrics['avg_wait_ms'] = metrics['total_wait_ms'] / metrics['checkouts'] if metrics['checkouts'] else 0.0
+        return metrics
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+
+def get_pool(config=DB_CONFIG):
+    """按连接参数获取进程级连接池，fork 之后的子进程会重新建池"""
+    global _pools_pid
+    key = tuple(sorted((k, repr(v)) for k, v in config.items() if k != 'cursorclass'))
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()  # 不复用父进程的 socket
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool_config = dict(DEFAULT_POOL_CONFIG)
+            pool_config.update(getattr(settings, 'DB_POOL_CONFIG', {}))
+            pool = ConnectionPool(config, **pool_config)
+            _pools[key] = pool
+    return pool
+
+
+def pool_stats():
+    """所有连接池的指标"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [dict(pool.stats(), db=pool.config.get('db') or pool.config.get('database')) for pool in pools]
+
+
+def connect_db(config=DB_CONFIG, pooled=True, **kwargs):
+    """
+    连接MySQL数据库。
+    默认从进程级连接池借出连接，close() 即归还；pooled=False 时返回独立的新连接。
+    """
     config = config.copy()
+    cursorclass = kwargs.pop('cursorclass', None)
     config.update(kwargs)
     try:
-        return pymysql.connect(**config)
+        if not pooled:
+            if cursorclass is not None:
+                config['cursorclass'] = cursorclass
+            return pymysql.connect(**config)
+        return get_pool(config).acquire(cursorclass=cursorclass)
     except Exception as e:
         logger.error(f"数据库连接失败: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+def connect_dict_db(config=DB_CONFIG, **kwargs):
+    """借出使用 DictCursor 的连接"""
+    return connect_db(config, cursorclass=pymysql.cursors.DictCursor, **kwargs)
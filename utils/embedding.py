@@ -0,0 +1,436 @@
+"""
+常驻的句向量编码服务（bert-ancient-chinese）
+
+过去 similar_search_milvus 在每个请求里重新构建 Transformer + Pooling 模型，
+每次检索都要花数秒加载模型、分配数百 MB 内存。这里改为：
+- 每个工作进程只加载一次模型（惰性单例，fork 之后的子进程重新加载）
+- 启动时可在后台线程预热（加载模型并编码一条样例文本），见 leishu_server/wsgi.py
+- encode() 把并发请求的文本合并成小批次一起编码，减少模型调用次数
+- 统计模型加载耗时、编码耗时、批次大小和排队等待时间
+- 查询向量缓存：同一段文本（规范化空白后）只编码一次，见 EmbeddingCache
+numpy、sentence-transformers 为可选依赖，只在真正加载模型/编码时导入。
+"""
+from collections import OrderedDict
+from django.conf import settings
+import atexit
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+if settings.LOGGER == "default":
+    logger = logging.getLogger(__name__)
+else:
+    logger = logging.getLogger(settings.LOGGER)
+
+# 可在 settings.EMBEDDING_MODEL 中覆盖
+DEFAULT_EMBEDDING_CONFIG = {
+    'MODEL_PATH': '/root/leishu/bert-ancient-chinese',  # 本地模型目录
+    'FALLBACK_MODEL': 'Jihuai/bert-ancient-chinese',  # 本地目录不存在时从 HuggingFace 加载
+    'DEVICE': None,  # None 时由 sentence-transformers 自动选择
+    'MAX_BATCH_SIZE': 32,  # 一次模型调用最多编码的文本数
+    'BATCH_WAIT_MS': 5,  # 收到第一条文本后最多再等待多少毫秒凑批
+    'WARMUP': True,  # 工作进程启动时是否在后台预热
+    'CACHE_MAX_BYTES': 64 * 1024 * 1024,  # 查询向量缓存的内存上限，0 关闭缓存
+    'CACHE_SPILL_FILE': None,  # 内存淘汰的向量溢出到该内存映射文件（每个进程一个文件），None 不溢出
+    'CACHE_SPILL_SLOTS': 100000,  # 溢出文件最多容纳的向量数，写满后循环覆盖最旧的
+}
+
+WARMUP_TEXT = "天地玄黃，宇宙洪荒。"
+
+
+def load_sentence_model(model_path, fallback_model=None, device=None):
+    """构建 Transformer + 平均池化的 SentenceTransformer（与建库 utils/vector_ingest.py 一致）"""
+    from sentence_transformers import models, SentenceTransformer
+
+    if not os.path.isdir(model_path) and fallback_model:
+        logger.warning(f"本地模型目录 {model_path} 不存在，改为加载 {fallback_model}")
+        model_path = fallback_model
+    word_embedding_model = models.Transformer(model_path)
+    pooling_model = models.Pooling(
+        word_embedding_model.get_word_embedding_dimension(),
+        pooling_mode_mean_tokens=True
+    )
+    return SentenceTransformer(modules=[word_embedding_model, pooling_model], device=device)
+
+
+def normalize_rows(vectors):
+    """逐行归一化为单位向量（零向量保持不变）"""
+    import numpy as np
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+_WHITESPACE = re.compile(r"[\s\u3000]+")
+
+
+def normalize_query(text):
+    """查询文本规范化：去掉首尾空白，连续空白（含全角空格）合并为一个空格"""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class EmbeddingCache:
+    """
+    规范化文本 -> float32 向量的 LRU 缓存：
+    - 向量以 bytes 保存（768 维 3 KB），总字节数不超过 max_bytes，超出时淘汰最久未用的
+    - 配置 spill_path 时，被淘汰的向量写入内存映射文件（固定 slots 个槽位，循环复用），
+      内存未命中时再查文件，命中后提升回内存
+    - 统计命中（内存/文件）、未命中、淘汰次数
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024, spill_path=None, spill_slots=100000):
+        self.max_bytes = max_bytes
+        self.spill_path = spill_path
+        self.spill_slots = spill_slots
+        self._data = OrderedDict()  # key -> bytes
+        self._bytes = 0
+        self._dim = None
+        self._spill = None  # np.memmap (slots, dim)
+        self._spill_index = {}  # key -> 槽位
+        self._slot_keys = {}  # 槽位 -> key
+        self._next_slot = 0
+        self._lock = threading.Lock()
+        self._metrics = {'hits': 0, 'spill_hits': 0, 'misses': 0, 'evictions': 0, 'spilled': 0}
+
+    @staticmethod
+    def _entry_size(key, value):
+        return len(value) + len(key.encode("utf-8"))
+
+    def get(self, key):
+        import numpy as np
+
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+                self._metrics['hits'] += 1
+                return np.frombuffer(value, dtype=np.float32)
+            slot = self._spill_index.get(key)
+            if slot is not None:
+                self._metrics['spill_hits'] += 1
+                vector = np.array(self._spill[slot], dtype=np.float32)
+                self._put(key, vector.tobytes())
+                return vector
+            self._metrics['misses'] += 1
+            return None
+
+    def set(self, key, vector):
+        import numpy as np
+
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if self._dim is None:
+                self._dim = vector.shape[0]
+            self._put(key, vector.tobytes())
+
+    def _put(self, key, value):
+        """调用方需持有锁"""
+        if self.max_bytes <= 0:
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._bytes -= self._entry_size(key, old)
+        self._data[key] = value
+        self._bytes += self._entry_size(key, value)
+        while self._bytes > self.max_bytes and len(self._data) > 1:
+            evicted_key, evicted = self._data.popitem(last=False)
+            self._bytes -= self._entry_size(evicted_key, evicted)
+            self._metrics['evictions'] += 1
+            self._spill_out(evicted_key, evicted)
+
+    def _open_spill(self):
+        import numpy as np
+
+        os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+        self._spill = np.memmap(self.spill_path, dtype=np.float32, mode="w+", shape=(self.spill_slots, self._dim))
+        try:
+            # 映射建立后即删除目录项：映射照常可用，进程退出（包括异常退出）后空间由系统回收，不留文件
+            os.unlink(self.spill_path)
+        except OSError:  # 不允许删除已映射文件的平台（Windows）改为退出时删除
+            atexit.register(_remove_file, self.spill_path)
+
+    def _spill_out(self, key, value):
+        """调用方需持有锁"""
+        import numpy as np
+
+        if not self.spill_path or self._dim is None or key in self._spill_index:
+            return
+        if self._spill is None:
+            self._open_spill()
+        slot = self._next_slot
+        self._next_slot = (self._next_slot + 1) % self.spill_slots
+        previous = self._slot_keys.pop(slot, None)
+        if previous is not None:
+            del self._spill_index[previous]
+        self._spill[slot] = np.frombuffer(value, dtype=np.float32)
+        self._spill_index[key] = slot
+        self._slot_keys[slot] = key
+        self._metrics['spilled'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self._spill_index.clear()
+            self._slot_keys.clear()
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['entries'] = len(self._data)
+            metrics['bytes'] = self._bytes
+            metrics['spill_entries'] = len(self._spill_index)
+        lookups = metrics['hits'] + metrics['spill_hits'] + metrics['misses']
+        metrics['hit_rate'] = (metrics['hits'] + metrics['spill_hits']) / lookups if lookups else 0.0
+        return metrics
+
+
+class _EncodeRequest:
+    __slots__ = ('texts', 'enqueued_at', 'done', 'vectors', 'error')
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.enqueued_at = time.monotonic()
+        self.done = threading.Event()
+        self.vectors = None
+        self.error = None
+
+
+class EmbeddingService:
+    """
+    进程内的编码服务：
+    - 模型在第一次使用（或 warmup）时加载，加载失败会在下次调用时重试
+    - 编码请求进入队列，由一个后台线程合并成不超过 max_batch_size 的批次统一编码，
+      单个请求的文本数超过上限时单独成批
+    - encode() 返回 float32 的 numpy 矩阵，默认已归一化（COSINE 检索直接使用）
+    - 传入 cache 时，文本先规范化并查缓存，只有未命中的文本进入队列编码
+    """
+    def __init__(self, loader, max_batch_size=32, batch_wait_ms=5, cache=None):
+        self._loader = loader
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.cache = cache
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._carry = None  # 上一批放不下的请求，作为下一批的第一个（只由工作线程读写）
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._metrics = {
+            'load_ms': None,
+            'load_failures': 0,
+            'requests': 0,
+            'texts': 0,
+            'batches': 0,
+            'max_batch_size': 0,
+            'total_encode_ms': 0.0,
+            'max_encode_ms': 0.0,
+            'total_wait_ms': 0.0,
+        }
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def get_model(self):
+        """惰性加载模型，并发调用时只加载一次"""
+        if self._model is not None:
+            return self._model
+        with self._load_lock:
+            if self._model is None:
+                start = time.monotonic()
+                try:
+                    model = self._loader()
+                except Exception:
+                    with self._stats_lock:
+                        self._metrics['load_failures'] += 1
+                    raise
+                load_ms = (time.monotonic() - start) * 1000
+                with self._stats_lock:
+                    self._metrics['load_ms'] = load_ms
+                logger.info(f"句向量模型加载完成，耗时 {load_ms:.0f} ms")
+                self._model = model
+        return self._model
+
+    def warmup(self):
+        """加载模型并编码一条样例文本，让首个真实请求不再承担初始化开销"""
+        self.encode([WARMUP_TEXT])
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def encode(self, texts, normalize=True, timeout=None):
+        """
+        :param texts: 待编码的文本列表
+        :return: (len(texts), dim) 的 float32 矩阵
+        """
+        import numpy as np
+
+        texts = list(texts)
+        if self.cache is None:
+            vectors = self._encode_uncached(texts, timeout)
+        else:
+            texts = [normalize_query(text) for text in texts]
+            cached = [self.cache.get(text) for text in texts]
+            missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+            encoded = dict(zip(missing, self._encode_uncached(missing, timeout))) if missing else {}
+            for text, vector in encoded.items():
+                self.cache.set(text, vector)
+            vectors = np.stack([vector if vector is not None else encoded[text]
+                                for text, vector in zip(texts, cached)]) if texts else np.zeros((0, 0), np.float32)
+        return normalize_rows(vectors) if normalize else vectors
+
+    def _encode_uncached(self, texts, timeout=None):
+        request = _EncodeRequest(texts)
+        self._ensure_worker()
+        self._queue.put(request)
+        if not request.done.wait(timeout):
+            raise TimeoutError(f"句向量编码等待超时（{timeout} 秒）")
+        if request.error is not None:
+            raise request.error
+        return request.vectors
+
+    def _collect_batch(self, first):
+        """以 first 为首凑一个批次：在 batch_wait 内继续取请求，直到文本数达到上限"""
+        batch, size = [first], len(first.texts)
+        deadline = time.monotonic() + self.batch_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + len(request.texts) > self.max_batch_size:
+                self._carry = request  # 留作下一批的第一个，不排到后来的请求后面
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            first, self._carry = self._carry, None
+            batch = self._collect_batch(first if first is not None else self._queue.get())
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        import numpy as np
+
+        texts = [text for request in batch for text in request.texts]
+        started = time.monotonic()
+        try:
+            model = self.get_model()
+            encode_start = time.monotonic()
+            vectors = np.asarray(model.encode(texts, batch_size=max(len(texts), 1), convert_to_numpy=True),
+                                 dtype=np.float32)
+            encode_ms = (time.monotonic() - encode_start) * 1000
+        except Exception as e:
+            logger.error(f"句向量编码失败: {e}")
+            for request in batch:
+                request.error = e
+                request.done.set()
+            return
+
+        offset = 0
+        for request in batch:
+            request.vectors = vectors[offset:offset + len(request.texts)]
+            offset += len(request.texts)
+
+        with self._stats_lock:
+            metrics = self._metrics
+            metrics['requests'] += len(batch)
+            metrics['texts'] += len(texts)
+            metrics['batches'] += 1
+            metrics['max_batch_size'] = max(metrics['max_batch_size'], len(texts))
+            metrics['total_encode_ms'] += encode_ms
+            metrics['max_encode_ms'] = max(metrics['max_encode_ms'], encode_ms)
+            metrics['total_wait_ms'] += sum((started - request.enqueued_at) * 1000 for request in batch)
+
+        for request in batch:
+            request.done.set()
+
+    def stats(self):
+        """加载/编码耗时等指标"""
+        with self._stats_lock:
+            metrics = dict(self._metrics)
+        metrics['loaded'] = self.loaded
+        metrics['pending'] = self._queue.qsize() + (self._carry is not None)
+        batches, requests = metrics['batches'], metrics['requests']
+        metrics['avg_batch_size'] = metrics['texts'] / batches if batches else 0.0
+        metrics['avg_encode_ms'] = metrics['total_encode_ms'] / batches if batches else 0.0
+        metrics['avg_wait_ms'] = metrics['total_wait_ms'] / requests if requests else 0.0
+        if self.cache is not None:
+            metrics['cache'] = self.cache.stats()
+        return metrics
+
+
+def embedding_config():
+    config = dict(DEFAULT_EMBEDDING_CONFIG)
+    config.update(getattr(settings, 'EMBEDDING_MODEL', {}))
+    return config
+
+
+_service = None
+_service_lock = threading.Lock()
+_service_pid = os.getpid()
+
+
+def get_embedding_service():
+    """进程级编码服务，fork 之后的子进程重新创建（模型和后台线程都不跨进程共享）"""
+    global _service, _service_pid
+    with _service_lock:
+        if _service is None or _service_pid != os.getpid():
+            config = embedding_config()
+            spill_file = config['CACHE_SPILL_FILE']
+            if spill_file:
+                spill_file = f"{spill_file}.{os.getpid()}"  # 溢出文件不跨进程共享
+            cache = EmbeddingCache(config['CACHE_MAX_BYTES'], spill_file,
+                                   config['CACHE_SPILL_SLOTS']) if config['CACHE_MAX_BYTES'] > 0 else None
+            _service = EmbeddingService(
+                lambda: load_sentence_model(config['MODEL_PATH'], config['FALLBACK_MODEL'], config['DEVICE']),
+                max_batch_size=config['MAX_BATCH_SIZE'],
+                batch_wait_ms=config['BATCH_WAIT_MS'],
+                cache=cache,
+            )
+            _service_pid = os.getpid()
+    return _service
+
+
+def encode_texts(texts, normalize=True):
+    """用进程级编码服务编码文本"""
+    return get_embedding_service().encode(texts, normalize=normalize)
+
+
+def warmup_in_background():
+    """在后台线程中预热编码服务（EMBEDDING_MODEL['WARMUP'] 为 False 时不做任何事）"""
+    if not embedding_config()['WARMUP']:
+        return None
+
+    def run():
+        try:
+            get_embedding_service().warmup()
+        except Exception as e:
+            logger.warning(f"句向量模型预热失败，将在首次检索时重试: {e}")
+
+    thread = threading.Thread(target=run, name="embedding-warmup", daemon=True)
+    thread.start()
+    return thread
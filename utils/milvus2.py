@@ -1,37 +1,69 @@
 # 步骤二：生成索引
 # 不用加入到前端代码里，步骤二纯属于后端
+# 在项目根目录运行：python -m utils.milvus2 [--profile hnsw|ivf_sq8|ivf_pq]
+# 索引方案见 utils/vector_schema.py 的 INDEX_PROFILES；换方案后须同时修改 settings.MILVUS_CONFIG['INDEX_PROFILE']
+import argparse
+
 from pymilvus import Collection, connections
 
-connections.connect("default", host="localhost", port="19530")
+from utils.vector_schema import COLLECTIONS, INDEX_PROFILES
+
+# 异文检索过滤条件对应的标量字段（见 utils/vector_schema.py）
+scalar_index_fields = ["category_type", "doc_specific_category", "doc_style"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="为 yongle_* 集合创建向量索引及标量索引")
+    parser.add_argument("--profile", choices=sorted(INDEX_PROFILES), default="hnsw",
+                        help="向量索引方案（默认 hnsw：M=16, efConstruction=500）")
+    args = parser.parse_args(argv)
+
+    connections.connect("default", host="localhost", port="19530")
+
+    yongle_collections = list(COLLECTIONS.values())
+
+    # HNSW 的 M 为图中每个节点最大连接数、efConstruction 为构建时的搜索深度（值越大，准确率越高，速度越慢）；
+    # IVF_SQ8 / IVF_PQ 把索引中的向量量化为 8 位标量 / 乘积量化码，原始 float32 向量仍保存在集合中（重排要用）
+    profile = INDEX_PROFILES[args.profile]
+    index_params = profile["index_params"]  # Milvus 内部会把 COSINE 转换为 IP
+    print(f"[INFO] 索引方案 {args.profile}: {index_params}，mmap: {profile['mmap']}")
+
+    # 遍历每个集合进行索引创建
+    for collection_name in yongle_collections:
+        print(f"\n[INFO] 集合 {collection_name} 开始创建索引...")
+
+        collection = Collection(collection_name)
+
+        # 加载状态下不能删除索引、修改集合属性，先释放
+        collection.release()
+
+        # 如果已有索引，则先删除（避免冲突）
+        if collection.indexes:
+            print(f"[INFO] {collection_name} 存在旧索引，正在删除...")
+            for index in collection.indexes:
+                collection.drop_index(index_name=index.index_name)
 
-yongle_collections = ["yongle_1", "yongle_2", "yongle_3", "yongle_4"]
+        # 量化方案开启 mmap：原始向量（及索引）映射到磁盘文件而不是全部读入内存，
+        # 否则重排所需的 float32 原始向量会抵消量化省下的内存
+        collection.set_properties({"mmap.enabled": profile["mmap"]})
 
-index_params = {
-    "metric_type": "COSINE",  # Milvus 内部会转换为 IP
-    "index_type": "HNSW",
-    "params": {
-        "M": 16,  # HNSW 图中每个节点最大连接数（值越大，准确率越高，速度越慢）
-        "efConstruction": 500  # 构建索引时的搜索深度（值越大，准确率越高，速度越慢）
-    }
-}
+        # 创建新的索引
+        collection.create_index(field_name="embedding", index_params=index_params, index_name="idx_embedding")
 
-# 遍历每个集合进行索引创建
-for collection_name in yongle_collections:
-    print(f"\n[INFO] 集合 {collection_name} 开始创建索引...")
-    
-    collection = Collection(collection_name)
+        # 过滤条件下推用到的标量字段建倒排索引（编纂时间按 like 包含匹配，不建索引）
+        field_names = {field.name for field in collection.schema.fields}
+        for field_name in scalar_index_fields:
+            if field_name in field_names:
+                collection.create_index(field_name=field_name, index_params={"index_type": "INVERTED"},
+                                        index_name=f"idx_{field_name}")
 
-    # 如果已有索引，则先删除（避免冲突）
-    if collection.has_index():
-        print(f"[INFO] {collection_name} 存在旧索引，正在删除...")
-        collection.drop_index()
+        # 加载集合到内存，准备搜索
+        collection.load()
 
-    # 创建新的索引
-    collection.create_index(field_name="embedding", index_params=index_params)
+        print(f"[SUCCESS] {collection_name} 索引创建并加载完成。")
 
-    # 加载集合到内存，准备搜索
-    collection.load()
+    print("\n✅ 所有 Yongle 集合索引已成功创建！")
 
-    print(f"[SUCCESS] {collection_name} 索引创建并加载完成。")
 
-print("\n✅ 所有 Yongle 集合索引已成功创建！")
+if __name__ == "__main__":
+    main()
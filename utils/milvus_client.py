@@ -0,0 +1,458 @@
+"""
+进程级 Milvus 客户端
+
+过去每个异文检索请求都要 connections.connect、Collection(name).load()，最后再 disconnect，
+gRPC 通道和集合加载在每次查询时重建。这里改为：
+- 每个工作进程只连接一次，yongle_1..yongle_4 在启动时预加载（见 leishu_server/wsgi.py）
+- 记录每个集合的加载状态、加载耗时和最近一次错误
+- 检索/查询遇到连接类错误时自动重连并重新加载集合，重试一次
+- 后端可替换：pymilvus 为真实服务；local 为进程内的暴力检索实现，供测试和无 Milvus 的开发环境使用；
+  numpy 为本地精确检索引擎（utils/vector_store.py）
+- 配置 FALLBACK_BACKEND 时，Milvus 不可用（连接类错误）后改用后备后端，冷却期内不再尝试 Milvus
+"""
+from django.conf import settings
+import logging
+import os
+import re
+import threading
+import time
+
+if settings.LOGGER == "default":
+    logger = logging.getLogger(__name__)
+else:
+    logger = logging.getLogger(settings.LOGGER)
+
+# 可在 settings.MILVUS_CONFIG 中覆盖
+DEFAULT_MILVUS_CONFIG = {
+    'BACKEND': 'pymilvus',  # pymilvus 或 local
+    'HOST': 'localhost',
+    'PORT': '19530',
+    'ALIAS': 'default',
+    'COLLECTIONS': ['yongle_1', 'yongle_2', 'yongle_3', 'yongle_4'],
+    'PRELOAD': True,  # 工作进程启动时在后台连接并加载集合
+    'FILTER_PUSHDOWN': False,  # 集合含文献元数据标量字段（utils/vector_schema.py）时把过滤条件下推到检索
+    'INDEX_PROFILE': 'hnsw',  # 向量索引方案（utils/vector_schema.py 的 INDEX_PROFILES），须与 milvus2.py 所建索引一致
+    'NUMPY_STORE_DIR': None,  # 本地向量库目录，None 时为 BASE_DIR/vector_index/store
+    'FALLBACK_BACKEND': None,  # Milvus 不可用时的后备后端（如 numpy），None 不启用
+    'FALLBACK_COOLDOWN': 30,  # Milvus 失败后多少秒内直接使用后备后端
+}
+
+LOADED, NOT_LOADED, FAILED = "loaded", "not_loaded", "failed"
+
+# pymilvus.client.types.Status.CONNECT_FAILED：connections.connect 连不上服务时 MilvusException 的 code
+MILVUS_CONNECT_FAILED = 2
+
+# 本身即表示连接不可用的 pymilvus / grpc 异常类
+CONNECTION_ERROR_CLASSES = {"ConnectionNotExistException", "MilvusUnavailableException", "FutureTimeoutError"}
+
+
+def _is_unavailable(code):
+    """grpc.StatusCode.UNAVAILABLE（MilvusException 的 code 也可能是 grpc 状态码）"""
+    return getattr(code, "name", None) == "UNAVAILABLE"
+
+
+def _is_connection_error_itself(error):
+    if isinstance(error, ConnectionError):
+        return True
+    # pymilvus、grpc 是可选依赖，按类名（含父类）识别，未安装时也不必导入
+    class_names = {cls.__name__ for cls in type(error).__mro__}
+    if class_names & CONNECTION_ERROR_CLASSES:
+        return True
+    if "MilvusException" in class_names:
+        code = getattr(error, "code", None)
+        return code == MILVUS_CONNECT_FAILED or _is_unavailable(code)
+    if "RpcError" in class_names and callable(getattr(error, "code", None)):
+        return _is_unavailable(error.code())
+    return False
+
+
+def is_connection_error(error):
+    """
+    是否为连接类错误（服务不可达、连接已断开）：只有这类错误值得重连重试或切换到后备后端，
+    表达式错误、字段不存在等请求本身的错误直接抛出。
+    pymilvus 的重试装饰器重试用尽后把 UNAVAILABLE 的 RpcError 包成 MilvusException 抛出，
+    原始错误在 __cause__ 中，因此沿 __cause__ 链逐个判断
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:  # pymilvus 常用 raise e from e，链上可能有环
+        seen.add(id(error))
+        if _is_connection_error_itself(error):
+            return True
+        error = error.__cause__
+    return False
+
+
+class PymilvusBackend:
+    """真实的 Milvus 服务（pymilvus 为可选依赖，连接时才导入）"""
+    def __init__(self, host, port, alias="default"):
+        self.host = host
+        self.port = port
+        self.alias = alias
+
+    def connect(self):
+        from pymilvus import connections
+        connections.connect(self.alias, host=self.host, port=self.port)
+
+    def disconnect(self):
+        from pymilvus import connections
+        connections.disconnect(self.alias)
+
+    def get_collection(self, name):
+        from pymilvus import Collection
+        return Collection(name, using=self.alias)
+
+
+class LocalHit:
+    """与 pymilvus 的 Hit 一致的访问方式：hit.id、hit.distance、hit.entity.get(字段)"""
+    __slots__ = ('id', 'distance', 'entity')
+
+    def __init__(self, id, distance, entity):
+        self.id = id
+        self.distance = distance
+        self.entity = entity
+
+
+_LIKE = re.compile(r'(\w+)\s+like\s+"((?:[^"\\]|\\.)*)"', re.IGNORECASE)
+
+
+def like_match(value, pattern):
+    regex = "".join(".*" if ch == "%" else re.escape(ch) for ch in pattern)
+    return value is not None and re.fullmatch(regex, str(value)) is not None
+
+
+def compile_expr(expr):
+    """
+    把 Milvus 布尔表达式编译为对行字典求值的函数（仅供 local 后端使用）。
+    支持 ==、!=、<、>、in [...]、like "前缀%"、and/or/not（及 &&、||）。
+    """
+    if not expr:
+        return lambda row: True
+    source = _LIKE.sub(lambda m: f'like_match({m.group(1)}, "{m.group(2)}")', expr)
+    source = source.replace("&&", " and ").replace("||", " or ")
+    source = re.sub(r"!(?!=)", " not ", source)
+    code = compile(source, "<milvus-expr>", "eval")
+
+    def matches(row):
+        return bool(eval(code, {"__builtins__": {}, "like_match": like_match}, dict(row)))
+    return matches
+
+
+class LocalCollection:
+    """进程内集合：自增主键，向量按 COSINE（内积，入库前需归一化）暴力检索"""
+    def __init__(self, name, primary_field="id"):
+        self.name = name
+        self.primary_field = primary_field
+        self.rows = []
+        self._next_id = 1
+        self.loaded = False
+        self.load_calls = 0
+
+    @property
+    def num_entities(self):
+        return len(self.rows)
+
+    def load(self):
+        self.loaded = True
+        self.load_calls += 1
+
+    def release(self):
+        self.loaded = False
+
+    def insert(self, rows):
+        """:param rows: 行字典列表，未给出主键时自动分配"""
+        ids = []
+        for row in rows:
+            row = dict(row)
+            if self.primary_field not in row:
+                row[self.primary_field] = self._next_id
+                self._next_id += 1
+            ids.append(row[self.primary_field])
+            self.rows.append(row)
+        return ids
+
+    def delete(self, expr):
+        matches = compile_expr(expr)
+        before = len(self.rows)
+        self.rows = [row for row in self.rows if not matches(row)]
+        return before - len(self.rows)
+
+    def _require_loaded(self):
+        if not self.loaded:
+            raise RuntimeError(f"集合 {self.name} 未加载")
+
+    def query(self, expr, output_fields=None, limit=None):
+        self._require_loaded()
+        matches = compile_expr(expr)
+        fields = [self.primary_field] + list(output_fields or [])
+        return [{field: row.get(field) for field in fields} for row in self.rows if matches(row)][:limit]
+
+    def search(self, data, anns_field, param, limit, expr=None, output_fields=None, timeout=None):
+        """参数与 pymilvus 的 Collection.search 一致；本地检索不会阻塞，timeout 不起作用"""
+        import numpy as np
+
+        self._require_loaded()
+        matches = compile_expr(expr)
+        rows = [row for row in self.rows if matches(row)]
+        results = []
+        for vector in data:
+            if not rows:
+                results.append([])
+                continue
+            matrix = np.asarray([row[anns_field] for row in rows], dtype=np.float32)
+            scores = matrix @ np.asarray(vector, dtype=np.float32)
+            order = np.argsort(-scores, kind="stable")[:limit]
+            results.append([
+                LocalHit(rows[i][self.primary_field], float(scores[i]),
+                         {field: rows[i].get(field) for field in (output_fields or [])})
+                for i in order
+            ])
+        return results
+
+
+class LocalBackend:
+    """进程内的 Milvus 替身：集合在第一次访问时创建"""
+    def __init__(self):
+        self.collections = {}
+        self.connected = False
+        self.connect_calls = 0
+
+    def connect(self):
+        self.connected = True
+        self.connect_calls += 1
+
+    def disconnect(self):
+        self.connected = False
+
+    def get_collection(self, name):
+        if not self.connected:
+            raise ConnectionError("未连接到 Milvus")
+        return self.collections.setdefault(name, LocalCollection(name))
+
+
+class MilvusManager:
+    """
+    长期持有的 Milvus 客户端：
+    - connect() 幂等，只在尚未连接（或连接失败后）真正建立连接
+    - collection(name) 返回已加载的集合句柄，未加载时先加载
+    - search()/query() 遇到连接类错误时重连、重新加载该集合并重试一次，其他错误直接抛出
+    """
+    def __init__(self, backend, collections=(), retries=1):
+        self.backend = backend
+        self.collection_names = list(collections)
+        self.retries = retries
+        self._lock = threading.RLock()
+        self._connected = False
+        self._handles = {}
+        self._state = {name: {"state": NOT_LOADED, "load_ms": None, "error": None} for name in self.collection_names}
+        self._metrics = {'connects': 0, 'reconnects': 0, 'failures': 0}
+
+    def connect(self):
+        with self._lock:
+            if not self._connected:
+                self.backend.connect()
+                self._connected = True
+                self._metrics['connects'] += 1
+        return self
+
+    def _reset(self):
+        """丢弃连接和集合句柄，下次访问时重新连接、重新加载"""
+        with self._lock:
+            try:
+                self.backend.disconnect()
+            except Exception:
+                pass
+            self._connected = False
+            self._handles.clear()
+            for state in self._state.values():
+                state["state"] = NOT_LOADED
+
+    def collection(self, name):
+        """返回已加载的集合句柄"""
+        with self._lock:
+            handle = self._handles.get(name)
+            if handle is not None:
+                return handle
+            self.connect()
+            state = self._state.setdefault(name, {"state": NOT_LOADED, "load_ms": None, "error": None})
+            start = time.monotonic()
+            try:
+                handle = self.backend.get_collection(name)
+                handle.load()
+            except Exception as e:
+                state.update(state=FAILED, error=str(e))
+                raise
+            state.update(state=LOADED, load_ms=(time.monotonic() - start) * 1000, error=None)
+            self._handles[name] = handle
+            return handle
+
+    def preload(self):
+        """连接并加载全部集合，返回各集合的加载状态；单个集合失败不影响其他集合"""
+        for name in self.collection_names:
+            try:
+                self.collection(name)
+            except Exception as e:
+                logger.warning(f"Milvus 集合 {name} 预加载失败: {e}")
+        return self.load_state()
+
+    def _call(self, name, operation):
+        attempt = 0
+        while True:
+            try:
+                return operation(self.collection(name))
+            except Exception as e:
+                with self._lock:
+                    self._metrics['failures'] += 1
+                if attempt >= self.retries or not is_connection_error(e):
+                    raise
+                attempt += 1
+                logger.warning(f"Milvus 调用失败，重连后重试: {e}")
+                self._reset()
+                with self._lock:
+                    self._metrics['reconnects'] += 1
+
+    def search(self, name, data, anns_field, param, limit, expr=None, output_fields=None, timeout=None):
+        """:param timeout: 交给 pymilvus 的检索超时秒数，超时后调用返回、线程随即释放"""
+        kwargs = {} if timeout is None else {"timeout": timeout}
+        return self._call(name, lambda collection: collection.search(
+            data, anns_field, param, limit=limit, expr=expr, output_fields=output_fields, **kwargs))
+
+    def query(self, name, expr, output_fields=None, limit=None):
+        kwargs = {} if limit is None else {"limit": limit}
+        return self._call(name, lambda collection: collection.query(expr, output_fields=output_fields, **kwargs))
+
+    def load_state(self):
+        with self._lock:
+            return {name: dict(state) for name, state in self._state.items()}
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['connected'] = self._connected
+        metrics['collections'] = self.load_state()
+        return metrics
+
+
+class FailoverManager:
+    """
+    主后端（Milvus）不可用时改用后备后端（本地精确检索），接口与 MilvusManager 一致。
+    失败后 cooldown 秒内直接使用后备后端，避免每个请求都等待 Milvus 连接超时。
+    """
+    def __init__(self, primary, fallback, cooldown=30):
+        self.primary = primary
+        self.fallback = fallback
+        self.cooldown = cooldown
+        self._failed_at = None
+        self._lock = threading.Lock()
+        self._metrics = {'fallbacks': 0}
+
+    @property
+    def collection_names(self):
+        return self.primary.collection_names
+
+    def _primary_available(self):
+        with self._lock:
+            return self._failed_at is None or time.monotonic() - self._failed_at >= self.cooldown
+
+    def _call(self, method, *args, **kwargs):
+        if self._primary_available():
+            try:
+                result = getattr(self.primary, method)(*args, **kwargs)
+                with self._lock:
+                    self._failed_at = None
+                return result
+            except Exception as e:
+                # 只有服务不可用才切换；未安装 pymilvus 也视为不可用。表达式错误等照常抛出
+                if not (is_connection_error(e) or isinstance(e, ImportError)):
+                    raise
+                logger.warning(f"Milvus 不可用，改用后备向量库: {e}")
+                with self._lock:
+                    self._failed_at = time.monotonic()
+        with self._lock:
+            self._metrics['fallbacks'] += 1
+        return getattr(self.fallback, method)(*args, **kwargs)
+
+    def connect(self):
+        self._call('connect')
+        return self
+
+    def collection(self, name):
+        return self._call('collection', name)
+
+    def search(self, *args, **kwargs):
+        return self._call('search', *args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        return self._call('query', *args, **kwargs)
+
+    def preload(self):
+        return self.primary.preload()
+
+    def load_state(self):
+        return self.primary.load_state()
+
+    def stats(self):
+        metrics = self.primary.stats()
+        with self._lock:
+            metrics.update(self._metrics)
+            metrics['primary_available'] = self._failed_at is None
+        metrics['fallback'] = self.fallback.stats()
+        return metrics
+
+
+def milvus_config():
+    config = dict(DEFAULT_MILVUS_CONFIG)
+    config.update(getattr(settings, 'MILVUS_CONFIG', {}))
+    return config
+
+
+def numpy_store_dir(config):
+    return config['NUMPY_STORE_DIR'] or os.path.join(settings.BASE_DIR, 'vector_index', 'store')
+
+
+def create_backend(config, backend=None):
+    backend = backend or config['BACKEND']
+    if backend == 'local':
+        return LocalBackend()
+    if backend == 'pymilvus':
+        return PymilvusBackend(config['HOST'], config['PORT'], config['ALIAS'])
+    if backend == 'numpy':
+        from utils.vector_store import NumpyBackend
+        return NumpyBackend(numpy_store_dir(config))
+    raise ValueError(f"未知的 Milvus 后端: {backend}")
+
+
+_manager = None
+_manager_lock = threading.Lock()
+_manager_pid = os.getpid()
+
+
+def get_milvus_manager():
+    """进程级 Milvus 客户端，fork 之后的子进程重新连接（gRPC 通道不跨进程共享）"""
+    global _manager, _manager_pid
+    with _manager_lock:
+        if _manager is None or _manager_pid != os.getpid():
+            config = milvus_config()
+            _manager = MilvusManager(create_backend(config), config['COLLECTIONS'])
+            if config['FALLBACK_BACKEND']:
+                fallback = MilvusManager(create_backend(config, config['FALLBACK_BACKEND']), config['COLLECTIONS'],
+                                         retries=0)
+                _manager = FailoverManager(_manager, fallback, config['FALLBACK_COOLDOWN'])
+            _manager_pid = os.getpid()
+    return _manager
+
+
+def preload_in_background():
+    """在后台线程中连接 Milvus 并加载全部集合（MILVUS_CONFIG['PRELOAD'] 为 False 时不做任何事）"""
+    if not milvus_config()['PRELOAD']:
+        return None
+
+    def run():
+        try:
+            state = get_milvus_manager().preload()
+            logger.info(f"Milvus 集合预加载完成: {state}")
+        except Exception as e:
+            logger.warning(f"Milvus 预加载失败，将在首次检索时重试: {e}")
+
+    thread = threading.Thread(target=run, name="milvus-preload", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,31 @@
+-- 页面 → 全文段落关联表，取代 pages.full_text_id_list 中逗号分隔的 ID 串
+-- full_text_id_list 仍继续写入以兼容旧数据和 ES 同步，读取一律走本表
+
+USE `leishu_yongle`;
+
+CREATE TABLE IF NOT EXISTS `page_fulltext` (
+  `page_fulltext_id` int unsigned NOT NULL AUTO_INCREMENT,
+  `page_id` int unsigned NOT NULL,
+  `full_text_id` int unsigned NOT NULL,
+  `ordinal` smallint unsigned NOT NULL COMMENT '在页面中的顺序，从 1 开始',
+  PRIMARY KEY (`page_fulltext_id`),
+  UNIQUE KEY `uniq_page_fulltext` (`page_id`, `full_text_id`),
+  KEY `idx_full_text` (`full_text_id`),
+  CONSTRAINT `fk_page_fulltext_page` FOREIGN KEY (`page_id`) REFERENCES `pages` (`page_id`) ON DELETE CASCADE,
+  CONSTRAINT `fk_page_fulltext_text` FOREIGN KEY (`full_text_id`) REFERENCES `full_text_1` (`full_text_id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- 回填已有页面：把 "12,13,14" 转成 JSON 数组后用 JSON_TABLE 展开，顺序即 ordinal
+-- 可重复执行（INSERT IGNORE + 唯一键），列表中已不存在的全文 ID 会被跳过
+INSERT IGNORE INTO `page_fulltext` (`page_id`, `full_text_id`, `ordinal`)
+SELECT p.page_id, j.full_text_id, j.ordinal
+FROM `pages` p
+JOIN JSON_TABLE(
+  CONCAT('[', REPLACE(TRIM(BOTH ',' FROM p.full_text_id_list), ' ', ''), ']'),
+  '$[*]' COLUMNS (
+    `ordinal` FOR ORDINALITY,
+    `full_text_id` int unsigned PATH '$'
+  )
+) j
+JOIN `full_text_1` f ON f.full_text_id = j.full_text_id
+WHERE p.full_text_id_list IS NOT NULL AND p.full_text_id_list <> '';
@@ -0,0 +1,186 @@
+"""
+向量量化的召回-内存对比报告
+
+在一批真实句向量上用 NumPy 模拟各种量化编码，与 float32 精确检索的前 k 个结果比较：
+- SQ8：每维按最小/最大值线性量化为 8 位（对应 Milvus IVF_SQ8），768 B/向量
+- PQ：切成 m 个子空间、各用 256 个中心的 k-means 码本（对应 IVF_PQ），m B/向量
+- 二值：每维只保留符号位，按汉明距离检索（对应 BIN_* 索引，需要单独的 BINARY_VECTOR 字段），96 B/向量
+每种编码分别统计不重排和取 rerank*k 个候选用原始向量重排后的 recall@k。
+重排要读取原始 float32 向量（4*维数 B/向量），报告单独列出这部分：不开 mmap 时它和索引一样常驻内存，
+量化省下的内存会被抵消（milvus2.py 为量化方案开启 mmap，原始向量留在磁盘上按需读入）。
+这里只衡量量化误差；IVF 粗聚类（nprobe）和 HNSW 图检索带来的召回损失须在 Milvus 上实测（python -m utils.vector_benchmark）。
+HNSW 一行只给出内存估算（原始向量 + 第 0 层 2*M 个 int32 邻居）。
+
+用法（项目根目录）：
+    python -m utils.quantization --collection yongle_2 --sample 20000 --queries 200
+    python -m utils.quantization --npy vectors.npy   # 离线：已归一化的 float32 矩阵
+"""
+import argparse
+import os
+
+import numpy as np
+
+from utils.vector_schema import INDEX_PROFILES
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def top_k(scores, k):
+    """每行得分最高的 k 个下标（按得分降序）"""
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+def sq8_scores(base, queries):
+    low, high = base.min(axis=0), base.max(axis=0)
+    scale = np.where(high > low, (high - low) / 255, 1.0)
+    codes = np.round((base - low) / scale).astype(np.uint8)
+    decoded = codes.astype(np.float32) * scale + low
+    return queries @ decoded.T
+
+
+def train_pq(base, m, iterations=10, train_size=10000, seed=0):
+    """每个子空间在至多 train_size 个样本上训练一个 k-means 码本，返回 (m, 中心数, 子空间维数)"""
+    rng = np.random.default_rng(seed)
+    train = base[rng.choice(len(base), min(train_size, len(base)), replace=False)]
+    sub_dim = base.shape[1] // m
+    centers = min(256, len(train))
+    codebooks = np.empty((m, centers, sub_dim), dtype=np.float32)
+    for i in range(m):
+        sub = train[:, i * sub_dim:(i + 1) * sub_dim]
+        book = sub[rng.choice(len(sub), centers, replace=False)].copy()
+        for _ in range(iterations):
+            assign = pq_assign(sub, book)
+            sums = np.zeros_like(book)
+            np.add.at(sums, assign, sub)
+            counts = np.bincount(assign, minlength=centers)
+            filled = counts > 0  # 空簇保留原中心
+            book[filled] = sums[filled] / counts[filled, None]
+        codebooks[i] = book
+    return codebooks
+
+
+def pq_assign(sub, book):
+    distances = (sub ** 2).sum(axis=1, keepdims=True) - 2 * sub @ book.T + (book ** 2).sum(axis=1)
+    return distances.argmin(axis=1)
+
+
+def pq_scores(base, queries, m):
+    codebooks = train_pq(base, m)
+    sub_dim = base.shape[1] // m
+    codes = np.stack([pq_assign(base[:, i * sub_dim:(i + 1) * sub_dim], codebooks[i]) for i in range(m)], axis=1)
+    scores = np.zeros((len(queries), len(base)), dtype=np.float32)
+    for i in range(m):
+        # 非对称距离：查询子向量与各中心的内积查表
+        table = queries[:, i * sub_dim:(i + 1) * sub_dim] @ codebooks[i].T
+        scores += table[:, codes[:, i]]
+    return scores
+
+
+def binary_scores(base, queries):
+    base_bits = np.packbits(base > 0, axis=1)
+    query_bits = np.packbits(queries > 0, axis=1)
+    dim = base.shape[1]
+    return np.stack([dim - _POPCOUNT[np.bitwise_xor(base_bits, bits)].sum(axis=1).astype(np.float32)
+                     for bits in query_bits])
+
+
+def recall_at_k(approx, exact, truth, k, rerank=0):
+    """
+    :param approx: 量化后的得分矩阵 (查询数, 向量数)
+    :param exact: 精确得分矩阵，用于重排
+    :param truth: 精确前 k 个的下标
+    """
+    found = top_k(approx, k * rerank if rerank else k)
+    if rerank:
+        reranked = np.argsort(-np.take_along_axis(exact, found, axis=1), axis=1, kind="stable")[:, :k]
+        found = np.take_along_axis(found, reranked, axis=1)
+    hits = sum(len(set(row) & set(expected)) for row, expected in zip(found.tolist(), truth.tolist()))
+    return hits / truth.size
+
+
+def quantization_report(base, queries, k=10, reranks=(0, 3, 5), pq_m=96):
+    """
+    :return: [{method, bytes_per_vector, raw_bytes_per_vector, rerank, recall}]，
+             raw_bytes_per_vector 为重排另需读取的原始向量字节数（FLAT/HNSW 的索引本身已含原始向量）
+    """
+    base = np.asarray(base, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    dim = base.shape[1]
+    exact = queries @ base.T
+    truth = top_k(exact, k)
+
+    hnsw_m = INDEX_PROFILES["hnsw"]["index_params"]["params"]["M"]
+    rows = [
+        {"method": "float32 (FLAT)", "bytes_per_vector": 4 * dim, "raw_bytes_per_vector": 0, "rerank": 0,
+         "recall": 1.0},
+        {"method": f"HNSW M={hnsw_m}", "bytes_per_vector": 4 * dim + 2 * hnsw_m * 4, "raw_bytes_per_vector": 0,
+         "rerank": 0, "recall": None},
+    ]
+    methods = [
+        ("SQ8", dim, lambda: sq8_scores(base, queries)),
+        (f"PQ m={pq_m}", pq_m, lambda: pq_scores(base, queries, pq_m)),
+        ("binary", dim // 8, lambda: binary_scores(base, queries)),
+    ]
+    for method, size, score in methods:
+        if method.startswith("PQ") and dim % pq_m:
+            continue
+        approx = score()
+        for rerank in reranks:
+            rows.append({"method": method, "bytes_per_vector": size, "raw_bytes_per_vector": 4 * dim if rerank else 0,
+                         "rerank": rerank, "recall": recall_at_k(approx, exact, truth, k, rerank)})
+    return rows
+
+
+def format_report(rows, total_vectors=None):
+    lines = [f"{'方案':<16}{'字节/向量':>10}{'原始向量':>10}{'重排倍数':>10}{'recall@k':>10}"
+             + (f"{'索引内存(MB)':>14}{'原始向量(MB)':>14}" if total_vectors else "")]
+    for row in rows:
+        recall = "Milvus实测" if row["recall"] is None else f"{row['recall']:.3f}"
+        line = (f"{row['method']:<16}{row['bytes_per_vector']:>10}{row['raw_bytes_per_vector'] or '-':>10}"
+                f"{row['rerank'] or '-':>10}{recall:>10}")
+        if total_vectors:
+            line += (f"{row['bytes_per_vector'] * total_vectors / 1024 / 1024:>14.1f}"
+                     f"{row['raw_bytes_per_vector'] * total_vectors / 1024 / 1024:>14.1f}")
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def split_queries(vectors, query_count, seed=0):
+    """随机留出 query_count 个向量作为查询，其余作为库"""
+    order = np.random.default_rng(seed).permutation(len(vectors))
+    return vectors[order[query_count:]], vectors[order[:query_count]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="向量量化召回-内存对比报告")
+    parser.add_argument("--collection", default="yongle_2", help="从该 Milvus 集合取样本向量")
+    parser.add_argument("--npy", default=None, help="改为读取已归一化的 float32 向量矩阵（.npy）")
+    parser.add_argument("--sample", type=int, default=20000, help="样本向量数")
+    parser.add_argument("--queries", type=int, default=200, help="留出作为查询的向量数")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    total = None
+    if args.npy:
+        vectors = np.load(args.npy, mmap_mode="r")[:args.sample]
+    else:
+        from utils.milvus_client import get_milvus_manager
+
+        manager = get_milvus_manager()
+        rows = manager.query(args.collection, "id >= 0", ["embedding"], limit=args.sample)
+        vectors = np.asarray([row["embedding"] for row in rows], dtype=np.float32)
+        total = manager.collection(args.collection).num_entities
+    base, queries = split_queries(np.asarray(vectors, dtype=np.float32), args.queries)
+    print(f"[INFO] 样本 {len(base)} 个向量，{len(queries)} 个查询，维数 {base.shape[1]}")
+    print(format_report(quantization_report(base, queries, k=args.k), total))
+
+
+if __name__ == "__main__":
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'leishu_server.settings')
+    django.setup()
+    main()
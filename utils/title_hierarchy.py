@@ -0,0 +1,162 @@
+"""
+标题层级维护：titles.first_full_text_id
+
+first_full_text_id 记录从该标题开始深度优先（先自身，再按 title_id 顺序遍历子标题）
+找到的第一段非空全文，检索补全时只需一次按主键的查询，不再逐层递归。
+闭包只在内存中计算，用来求 first_full_text_id，不落表。
+按文献整体重建：一部文献的标题树规模有限，整体重建比增量维护更不容易出错；
+标题被删除或改挂到其他文献时，需在写入前用 doc_ids_of 取出原所属文献，写入后一并重建，
+原祖先链上的 first_full_text_id 才会随之更新。
+
+ResourceView 在插入/更新/删除标题、导入全文后调用 refresh_titles / refresh_docs；
+已有数据执行 utils/title_hierarchy.sql 后运行 python -m utils.title_hierarchy 回填。
+游标只要求支持 %s 占位符和元组结果，Django 游标与 PyMySQL 游标均可。
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def build_closure(titles):
+    """
+    根据 [(title_id, parent_id)] 计算闭包行与前序遍历顺序。
+    :return: (closure_rows[(ancestor_id, descendant_id, depth)], preorder[title_id])
+    """
+    title_ids = {title_id for title_id, _ in titles}
+    children = {}
+    roots = []
+    for title_id, parent_id in sorted(titles):
+        if parent_id in title_ids and parent_id != title_id:
+            children.setdefault(parent_id, []).append(title_id)
+        else:
+            roots.append(title_id)  # 父标题不存在（或属于其他文献）的视为根
+
+    closure_rows = []
+    preorder = []
+    visited = set()
+
+    def walk(root_id):
+        # 显式栈做前序遍历，树再深也不会超出递归深度限制
+        stack = [(root_id, ())]
+        while stack:
+            title_id, ancestors = stack.pop()
+            if title_id in visited:
+                continue
+            visited.add(title_id)
+            preorder.append(title_id)
+            closure_rows.append((title_id, title_id, 0))
+            for depth, ancestor_id in enumerate(reversed(ancestors), start=1):
+                closure_rows.append((ancestor_id, title_id, depth))
+            path = ancestors + (title_id,)
+            stack.extend((child_id, path) for child_id in reversed(children.get(title_id, [])))
+
+    for root_id in roots:
+        walk(root_id)
+
+    # 没有从任何根到达的标题处在环中（或挂在环下）：按 id 从小到大补作根断开，仍为它们生成闭包行
+    cyclic = sorted(title_ids - visited)
+    if cyclic:
+        logger.warning(f"标题 {cyclic} 的 parent_id 存在循环引用，已断开后照常生成闭包")
+        for title_id in cyclic:
+            if title_id not in visited:
+                walk(title_id)
+    return closure_rows, preorder
+
+
+def compute_first_full_text(closure_rows, preorder, own_first_text):
+    """
+    :param own_first_text: {title_id: 该标题自身 full_text_order 最小的非空全文ID}
+    :return: {title_id: 深度优先遇到的第一段全文ID 或 None}
+    """
+    position = {title_id: i for i, title_id in enumerate(preorder)}
+    first = {}
+    for ancestor_id, descendant_id, _ in closure_rows:
+        text_id = own_first_text.get(descendant_id)
+        if text_id is None:
+            continue
+        best = first.get(ancestor_id)
+        if best is None or position[descendant_id] < position[best[0]]:
+            first[ancestor_id] = (descendant_id, text_id)
+    return {title_id: first[title_id][1] if title_id in first else None for title_id in preorder}
+
+
+def refresh_docs(cursor, doc_ids):
+    """重建指定文献所有标题的 first_full_text_id"""
+    doc_ids = sorted({doc_id for doc_id in doc_ids if doc_id is not None})
+    if not doc_ids:
+        return
+
+    cursor.execute(f"""
+        SELECT doc_id, title_id, parent_id
+        FROM titles
+        WHERE doc_id IN ({_placeholders(doc_ids)})
+    """, tuple(doc_ids))
+    titles_by_doc = {}
+    for doc_id, title_id, parent_id in cursor.fetchall():
+        titles_by_doc.setdefault(doc_id, []).append((title_id, parent_id))
+
+    # 各标题自身的首段：与原递归逻辑一致，只看 full_text_order 最小的一段是否非空
+    cursor.execute(f"""
+        SELECT title_id, full_text_id
+        FROM (
+            SELECT f.title_id, f.full_text_id, f.full_text,
+                   ROW_NUMBER() OVER (PARTITION BY f.title_id ORDER BY f.full_text_order) AS rn
+            FROM full_text_1 f
+            JOIN titles t ON t.title_id = f.title_id
+            WHERE t.doc_id IN ({_placeholders(doc_ids)})
+        ) x
+        WHERE rn = 1 AND full_text IS NOT NULL AND full_text <> ''
+    """, tuple(doc_ids))
+    own_first_text = dict(cursor.fetchall())
+
+    first_values = []
+    for titles in titles_by_doc.values():
+        closure_rows, preorder = build_closure(titles)
+        first_text = compute_first_full_text(closure_rows, preorder, own_first_text)
+        first_values.extend((text_id, title_id) for title_id, text_id in first_text.items())
+
+    if first_values:
+        cursor.executemany("UPDATE titles SET first_full_text_id = %s WHERE title_id = %s", first_values)
+    logger.info(f"标题层级已刷新: 文献 {doc_ids}，标题 {len(first_values)} 个")
+
+
+def doc_ids_of(cursor, title_ids):
+    """标题当前所属的文献ID；删除或改挂标题前调用，记下原祖先链所在的文献"""
+    title_ids = sorted({title_id for title_id in title_ids if title_id})
+    if not title_ids:
+        return set()
+    cursor.execute(f"SELECT DISTINCT doc_id FROM titles WHERE title_id IN ({_placeholders(title_ids)})",
+                   tuple(title_ids))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def refresh_titles(cursor, title_ids, doc_ids=()):
+    """按标题ID找到所属文献，连同额外指定的文献（写入前记下的原文献）一起重建"""
+    refresh_docs(cursor, doc_ids_of(cursor, title_ids) | set(doc_ids))
+
+
+def backfill(batch_size=200):
+    """为所有已有文献回填 first_full_text_id"""
+    from utils.database import connect_db
+
+    with connect_db(pooled=False) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT doc_id FROM titles WHERE doc_id IS NOT NULL ORDER BY doc_id")
+            doc_ids = [row[0] for row in cursor.fetchall()]
+            for i in range(0, len(doc_ids), batch_size):
+                refresh_docs(cursor, doc_ids[i:i + batch_size])
+                conn.commit()
+                print(f"[INFO] 已回填 {min(i + batch_size, len(doc_ids))}/{len(doc_ids)} 部文献")
+
+
+if __name__ == "__main__":
+    import os
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'leishu_server.settings')
+    django.setup()
+    backfill()
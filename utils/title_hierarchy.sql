@@ -0,0 +1,12 @@
+-- 标题子树首段全文
+-- 执行后运行 python -m utils.title_hierarchy 回填已有数据
+
+USE `leishu_yongle`;
+
+-- 早期版本建过 title_closure 闭包表，但检索只读 first_full_text_id，闭包改为在内存中计算
+DROP TABLE IF EXISTS `title_closure`;
+
+-- 深度优先（先自身，再按 title_id 顺序遍历子标题）遇到的第一段非空全文
+ALTER TABLE `titles`
+  ADD COLUMN `first_full_text_id` int unsigned DEFAULT NULL COMMENT '子树中最近的首段全文',
+  ADD KEY `idx_first_full_text` (`first_full_text_id`);
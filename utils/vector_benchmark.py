@@ -0,0 +1,352 @@
+"""
+异文检索的召回率/延迟基准
+
+回答“milvus2.py 的 HNSW 参数（M=16、efConstruction=500）和检索时的 ef=100 是否适合我们的语料”：
+- 语料：从本地 NumPy 向量库（utils/vector_store.py）取一个集合的前 --corpus 个片段
+- 查询：留出的 --queries 个片段（默认从语料中随机抽取向量；--queries-from db 则从 full_text_1 随机取全文、
+  切出同样大小的窗口重新编码），每个查询都排除自身所在的全文，与异文检索一致
+- 精确结果：同一语料上的 NumPy 精确检索
+- 被测引擎：milvus（在临时集合 BENCH_COLLECTION 上按 --index/--M/--ef-construction/--nlist 逐一建索引，
+  再按 --ef/--nprobe 检索）、local（utils.milvus_client.LocalBackend）、numpy（本地精确检索）；
+  后两者不使用索引参数，只跑一组
+- 检索走线上同一路径（apps.search.similar.ann_search：ef 不小于 topk、量化索引重排）
+- 报告 recall@k、单次检索延迟 p50/p99、建索引耗时、内存（Milvus 取查询节点上的段内存，其余为向量字节数）
+
+用法（项目根目录，先 python -m utils.vector_store export 导出本地向量库）：
+    python -m utils.vector_benchmark --engine milvus --collection yongle_2 --index hnsw --M 8,16,32 --ef 32,64,100,200
+    python -m utils.vector_benchmark --engine milvus --index hnsw,ivf_sq8,ivf_pq --nprobe 16,32,64
+    python -m utils.vector_benchmark --engine numpy --queries 500   # 离线：只测精确检索延迟
+"""
+import argparse
+import copy
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from utils.vector_schema import EMBEDDING_DIM, INDEX_PROFILES, SENTENCE_MAX_LENGTH, window_texts
+from utils.vector_store import SEGMENT_ID_BITS, NumpyTarget, VectorStore
+
+BENCH_COLLECTION = "yongle_bench"
+BENCH_NAME = "bench"  # 基准对象内部的集合名
+EXACT_PROFILE = {"search_params": {"metric_type": "COSINE", "params": {}}, "rerank": 0}
+WARMUP_QUERIES = 5
+
+
+def corpus_rows(store, limit=None):
+    """按段顺序读出语料行，id 为语料内的行号"""
+    rows = []
+    for segment in store.segments:
+        for row in np.flatnonzero(segment.live()):
+            if limit is not None and len(rows) >= limit:
+                return rows
+            rows.append({"id": len(rows), "fulltext_id": segment.value("fulltext_id", row),
+                         "sentence": segment.value("sentence", row), "embedding": segment.value("embedding", row)})
+    return rows
+
+
+class NumpyBench:
+    """本地精确检索：既是被测引擎，也提供精确结果"""
+    tunable = False
+
+    def __init__(self, root):
+        self.store = VectorStore(root, BENCH_NAME)
+        self._offsets = {}
+
+    def load_corpus(self, rows):
+        target = NumpyTarget(os.path.dirname(self.store.path), segment_rows=len(rows) + 1)
+        target.prepare([BENCH_NAME], drop=True)
+        target.insert(BENCH_NAME, rows)
+        target.flush()
+
+    def build(self, index_params):
+        started = time.monotonic()
+        self.store.load()
+        offset = 0
+        for segment in self.store.segments:
+            self._offsets[segment.id_base] = offset
+            offset += segment.size
+        memory = sum(segment.embedding.nbytes for segment in self.store.segments)  # 内存映射，按需换入
+        return {"build_s": time.monotonic() - started, "memory_bytes": memory}
+
+    def corpus_index(self, hit_id):
+        base = hit_id >> SEGMENT_ID_BITS << SEGMENT_ID_BITS
+        return self._offsets[base] + (hit_id - base)
+
+    def search(self, name, data, anns_field, param, limit, expr=None, output_fields=None):
+        return self.store.search(data, anns_field, param, limit, expr=expr, output_fields=output_fields)
+
+    def drop(self):
+        self.store.drop()
+
+
+class LocalBench:
+    """utils.milvus_client.LocalBackend（进程内暴力检索的 Milvus 替身）"""
+    tunable = False
+
+    def __init__(self):
+        from utils.milvus_client import LocalBackend
+
+        self.backend = LocalBackend()
+        self.backend.connect()
+        self.collection = self.backend.get_collection(BENCH_NAME)
+
+    def load_corpus(self, rows):
+        self.collection.insert(rows)
+
+    def build(self, index_params):
+        started = time.monotonic()
+        self.collection.load()
+        memory = self.collection.num_entities * EMBEDDING_DIM * 4
+        return {"build_s": time.monotonic() - started, "memory_bytes": memory}
+
+    def corpus_index(self, hit_id):
+        return hit_id
+
+    def search(self, name, data, anns_field, param, limit, expr=None, output_fields=None):
+        return self.collection.search(data, anns_field, param, limit, expr=expr, output_fields=output_fields)
+
+    def drop(self):
+        self.collection.release()
+
+
+class MilvusBench:
+    """真实 Milvus 上的临时集合：语料只插入一次，每组索引参数重建一次索引"""
+    tunable = True
+
+    def __init__(self, host, port, alias="default", name=BENCH_COLLECTION):
+        from pymilvus import connections
+
+        connections.connect(alias, host=host, port=port)
+        self.alias = alias
+        self.name = name
+        self.collection = None
+
+    def load_corpus(self, rows, batch_size=2000):
+        from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, utility
+
+        if utility.has_collection(self.name, using=self.alias):
+            utility.drop_collection(self.name, using=self.alias)
+        schema = CollectionSchema([
+            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),  # 语料行号
+            FieldSchema(name="fulltext_id", dtype=DataType.INT64),
+            FieldSchema(name="sentence", dtype=DataType.VARCHAR, max_length=SENTENCE_MAX_LENGTH),
+            FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=EMBEDDING_DIM),
+        ], description="异文检索基准临时集合")
+        self.collection = Collection(self.name, schema=schema, using=self.alias)
+        for start in range(0, len(rows), batch_size):
+            self.collection.insert(rows[start:start + batch_size])
+        self.collection.flush()
+
+    def build(self, index_params):
+        from pymilvus import utility
+
+        self.collection.release()
+        for index in self.collection.indexes:
+            self.collection.drop_index(index_name=index.index_name)
+        started = time.monotonic()
+        self.collection.create_index(field_name="embedding", index_params=index_params, index_name="idx_embedding")
+        utility.wait_for_index_building_complete(self.name, using=self.alias)
+        self.collection.load()
+        build_s = time.monotonic() - started
+        segments = utility.get_query_segment_info(self.name, using=self.alias)
+        return {"build_s": build_s, "memory_bytes": sum(segment.mem_size for segment in segments)}
+
+    def corpus_index(self, hit_id):
+        return hit_id
+
+    def search(self, name, data, anns_field, param, limit, expr=None, output_fields=None):
+        return self.collection.search(data, anns_field, param, limit=limit, expr=expr, output_fields=output_fields)
+
+    def drop(self):
+        from pymilvus import utility
+
+        utility.drop_collection(self.name, using=self.alias)
+
+
+def sweep_configs(indexes, m_values, ef_constructions, efs, nlists, nprobes):
+    """
+    :return: [(索引说明, 索引参数, [(检索说明, 索引方案)])]，索引方案即 ann_search 的 profile
+    """
+    configs = []
+    for name in indexes:
+        base = INDEX_PROFILES[name]
+        if base["index_params"]["index_type"] == "HNSW":
+            builds = [(f"M={m} efC={efc}", {"M": m, "efConstruction": efc})
+                      for m in m_values for efc in ef_constructions]
+            searches = [(f"ef={ef}", {"ef": ef}) for ef in efs]
+        else:
+            builds = [(f"nlist={nlist}", {"nlist": nlist}) for nlist in nlists]
+            searches = [(f"nprobe={nprobe}", {"nprobe": nprobe}) for nprobe in nprobes]
+        for build_label, build_params in builds:
+            index_params = copy.deepcopy(base["index_params"])
+            index_params["params"].update(build_params)
+            variants = []
+            for search_label, search_params in searches:
+                profile = copy.deepcopy(base)
+                profile["index_params"] = index_params
+                profile["search_params"]["params"].update(search_params)
+                variants.append((search_label, profile))
+            configs.append((f"{index_params['index_type']} {build_label}", index_params, variants))
+    return configs
+
+
+def run_queries(bench, queries, profile, k):
+    """:return: (每个查询命中的语料行号列表, 每次检索的毫秒数)"""
+    from apps.search.similar import ann_search
+
+    for vector, expr in queries[:WARMUP_QUERIES]:
+        ann_search(bench, BENCH_NAME, [vector], k, expr=expr, profile=profile)
+    found, latencies = [], []
+    for vector, expr in queries:
+        started = time.perf_counter()
+        hits = ann_search(bench, BENCH_NAME, [vector], k, expr=expr, profile=profile)[0]
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append([bench.corpus_index(hit.id) for hit in hits])
+    return found, latencies
+
+
+def recall(found, truth):
+    total = sum(len(expected) for expected in truth)
+    return sum(len(set(hits) & set(expected)) for hits, expected in zip(found, truth)) / total if total else 1.0
+
+
+def run_benchmark(bench, rows, queries, configs, truth_root, k=10):
+    """
+    :param queries: [(查询向量, 排除自身全文的表达式)]
+    :return: 报告行列表
+    """
+    truth_bench = NumpyBench(truth_root)
+    truth_bench.load_corpus(rows)
+    truth_bench.build(None)
+    truth, _ = run_queries(truth_bench, queries, EXACT_PROFILE, k)
+
+    bench.load_corpus(rows)
+    if not bench.tunable:
+        configs = [("exact", None, [("-", EXACT_PROFILE)])]
+    report = []
+    for index_label, index_params, variants in configs:
+        build = bench.build(index_params)
+        for search_label, profile in variants:
+            found, latencies = run_queries(bench, queries, profile, k)
+            report.append({
+                "index": index_label,
+                "search": search_label,
+                "rerank": profile["rerank"],
+                f"recall@{k}": round(recall(found, truth), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+                "build_s": round(build["build_s"], 2),
+                "memory_mb": round(build["memory_bytes"] / 1024 / 1024, 1),
+            })
+    return report
+
+
+def format_report(report):
+    if not report:
+        return ""
+    columns = list(report[0])
+    widths = {column: max(len(column), *(len(str(row[column])) for row in report)) + 2 for column in columns}
+    lines = ["".join(column.rjust(widths[column]) for column in columns)]
+    lines += ["".join(str(row[column]).rjust(widths[column]) for column in columns) for row in report]
+    return "\n".join(lines)
+
+
+def store_queries(rows, count, seed=0):
+    """从语料中随机抽取片段向量作为查询"""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(rows), min(count, len(rows)), replace=False)
+    return [(rows[i]["embedding"], f"fulltext_id != {int(rows[i]['fulltext_id'])}") for i in picks]
+
+
+def db_queries(count, window_size, seed=0):
+    """从 full_text_1 随机取全文，切出 window_size 句的窗口并编码"""
+    from utils.database import connect_db
+    from utils.vector_ingest import build_encoder, ingest_config
+
+    rng = np.random.default_rng(seed)
+    conn = connect_db(pooled=False)
+    texts = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT MIN(full_text_id), MAX(full_text_id) FROM full_text_1")
+            low, high = cursor.fetchone()
+            attempts = 0
+            while len(texts) < count and attempts < count * 20:
+                attempts += 1
+                cursor.execute("SELECT full_text_id, full_text FROM full_text_1 WHERE full_text_id >= %s "
+                               "ORDER BY full_text_id LIMIT 1", (int(rng.integers(low, high + 1)),))
+                row = cursor.fetchone()
+                windows = window_texts(row[1] or "").get(window_size, []) if row else []
+                if windows:
+                    texts.append((row[0], windows[int(rng.integers(len(windows)))]))
+    finally:
+        conn.close()
+    vectors = build_encoder(ingest_config()['MODEL_BATCH_SIZE'])([text for _, text in texts])
+    return [(vector.tolist(), f"fulltext_id != {int(fulltext_id)}") for (fulltext_id, _), vector in zip(texts, vectors)]
+
+
+def _numbers(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+def main(argv=None):
+    from utils.milvus_client import milvus_config, numpy_store_dir
+    from utils.vector_schema import COLLECTIONS
+
+    parser = argparse.ArgumentParser(description="异文检索召回率/延迟基准")
+    parser.add_argument("--engine", choices=["milvus", "local", "numpy"], default="milvus")
+    parser.add_argument("--collection", default="yongle_2", choices=list(COLLECTIONS.values()))
+    parser.add_argument("--corpus", type=int, default=100000, help="语料片段数（取本地向量库的前 N 个）")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--queries-from", choices=["store", "db"], default="store")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index", default="hnsw", help="逗号分隔的索引方案（utils/vector_schema.py 的 INDEX_PROFILES）")
+    parser.add_argument("--M", default="16", help="HNSW M，逗号分隔")
+    parser.add_argument("--ef-construction", default="500", help="HNSW efConstruction，逗号分隔")
+    parser.add_argument("--ef", default="32,64,100,200", help="HNSW 检索 ef，逗号分隔")
+    parser.add_argument("--nlist", default="1024", help="IVF nlist，逗号分隔")
+    parser.add_argument("--nprobe", default="8,16,32,64", help="IVF 检索 nprobe，逗号分隔")
+    parser.add_argument("--json", default=None, help="另存报告为 JSON 文件")
+    args = parser.parse_args(argv)
+
+    config = milvus_config()
+    source = VectorStore(numpy_store_dir(config), args.collection)
+    source.load()
+    rows = corpus_rows(source, args.corpus)
+    window_size = {name: size for size, name in COLLECTIONS.items()}[args.collection]
+    queries = (db_queries(args.queries, window_size) if args.queries_from == "db"
+               else store_queries(rows, args.queries))
+    print(f"[INFO] 语料 {len(rows)} 个片段，查询 {len(queries)} 个，引擎 {args.engine}")
+
+    tmp_root = tempfile.mkdtemp(prefix="vector_benchmark_")
+    if args.engine == "milvus":
+        bench = MilvusBench(config['HOST'], config['PORT'], config['ALIAS'])
+    elif args.engine == "local":
+        bench = LocalBench()
+    else:
+        bench = NumpyBench(os.path.join(tmp_root, "engine"))
+    configs = sweep_configs(args.index.split(","), _numbers(args.M), _numbers(args.ef_construction),
+                            _numbers(args.ef), _numbers(args.nlist), _numbers(args.nprobe))
+    try:
+        report = run_benchmark(bench, rows, queries, configs, os.path.join(tmp_root, "truth"), k=args.k)
+    finally:
+        bench.drop()
+        shutil.rmtree(tmp_root, ignore_errors=True)
+
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"engine": args.engine, "collection": args.collection, "corpus": len(rows),
+                       "queries": len(queries), "report": report}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'leishu_server.settings')
+    django.setup()
+    main()
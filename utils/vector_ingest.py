@@ -0,0 +1,316 @@
+"""
+yongle_* 向量集合的流式建库（取代 utils/milvus1.py 的一次性脚本）
+
+milvus1.py 先 fetchall() 整张 full_text_1，再逐段、逐窗口大小调用 model.encode，
+用 Python 循环逐个归一化，每段插入一次，全量建库约 70 分钟。这里改为：
+- 服务端游标（SSCursor）按 full_text_id 顺序流式读取，内存占用与表大小无关
+- 跨段落、跨窗口大小攒够 ENCODE_BATCH_SIZE 个片段再一起编码，NumPy 整批归一化
+- 每个集合攒够 INSERT_BATCH_SIZE 行再批量插入
+- 每处理 CHECKPOINT_EVERY 段全文，把缓冲区全部写入并 flush 后记录检查点（最后一个 full_text_id）；
+  崩溃后重跑会先删除检查点之后已写入的残留向量，再从检查点继续，结果不重复
+
+用法（项目根目录）：
+    python -m utils.vector_ingest            # 从检查点继续（没有检查点时从头开始）
+    python -m utils.vector_ingest --restart  # 删除并重建全部集合，从头开始
+    python -m utils.vector_ingest --target numpy  # 写入本地 NumPy 向量库（utils/vector_store.py），检查点单独记录
+建库完成后运行 python -m utils.milvus2 创建索引并加载。
+"""
+from django.conf import settings
+import argparse
+import json
+import logging
+import os
+import time
+
+from utils.vector_schema import (COLLECTIONS, FULLTEXT_METADATA_SQL, METADATA_FIELDS, clip_sentence,
+                                 collection_schema, metadata_values, window_texts)
+
+logger = logging.getLogger(__name__)
+
+# 可在 settings.VECTOR_INGEST 中覆盖（作为脚本运行时模块先于 django.setup() 导入，这里不能读取 settings）
+DEFAULT_INGEST_CONFIG = {
+    'CHECKPOINT_FILE': None,  # None 时为 BASE_DIR/vector_index/ingest_checkpoint.json
+    'ENCODE_BATCH_SIZE': 512,  # 攒够多少个片段调用一次编码
+    'MODEL_BATCH_SIZE': 128,  # 模型内部每次前向计算的片段数
+    'INSERT_BATCH_SIZE': 2000,  # 每个集合攒够多少行插入一次
+    'CHECKPOINT_EVERY': 2000,  # 每处理多少段全文记录一次检查点
+}
+
+METADATA_NAMES = [name for name, _, _ in METADATA_FIELDS]
+
+
+def ingest_config():
+    config = dict(DEFAULT_INGEST_CONFIG)
+    config.update(getattr(settings, 'VECTOR_INGEST', {}))
+    if not config['CHECKPOINT_FILE']:
+        config['CHECKPOINT_FILE'] = os.path.join(settings.BASE_DIR, 'vector_index', 'ingest_checkpoint.json')
+    return config
+
+
+class Checkpoint:
+    """JSON 检查点文件，写入时先写临时文件再替换，崩溃时不会留下半个文件"""
+    def __init__(self, path):
+        self.path = str(path)
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save(self, **state):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        state["updated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class MilvusTarget:
+    """写入 Milvus：按 utils/vector_schema.py 的结构创建缺失的集合"""
+    def __init__(self, host, port, alias="default"):
+        from pymilvus import connections
+        connections.connect(alias, host=host, port=port)
+        self.alias = alias
+        self._collections = {}
+
+    def prepare(self, names, drop=False, load=False):
+        from pymilvus import Collection, utility
+        for name in names:
+            if drop and utility.has_collection(name, using=self.alias):
+                utility.drop_collection(name, using=self.alias)
+            if utility.has_collection(name, using=self.alias):
+                self._collections[name] = Collection(name, using=self.alias)
+            else:
+                self._collections[name] = Collection(name, schema=collection_schema(name), using=self.alias)
+            if load:
+                self._collections[name].load()
+
+    def insert(self, name, rows):
+        self._collections[name].insert(rows)
+
+    def query(self, name, expr, output_fields):
+        return self._collections[name].query(expr, output_fields=output_fields)
+
+    def delete(self, name, expr):
+        self._collections[name].delete(expr)
+
+    def flush(self):
+        for collection in self._collections.values():
+            collection.flush()
+
+
+class LocalTarget:
+    """写入 utils.milvus_client.LocalBackend（测试及无 Milvus 的开发环境）"""
+    def __init__(self, backend):
+        self.backend = backend
+        backend.connect()
+
+    def prepare(self, names, drop=False, load=False):
+        for name in names:
+            if drop:
+                self.backend.collections.pop(name, None)
+            collection = self.backend.get_collection(name)
+            if load:
+                collection.load()
+
+    def insert(self, name, rows):
+        self.backend.get_collection(name).insert(rows)
+
+    def query(self, name, expr, output_fields):
+        return self.backend.get_collection(name).query(expr, output_fields=output_fields)
+
+    def delete(self, name, expr):
+        self.backend.get_collection(name).delete(expr)
+
+    def flush(self):
+        pass
+
+
+class IngestPipeline:
+    """
+    :param target: MilvusTarget / LocalTarget / utils.vector_store.NumpyTarget
+    :param encode: 文本列表 -> 已归一化的 float32 向量矩阵
+    :param checkpoint: Checkpoint，为 None 时不记录
+    """
+    def __init__(self, target, encode, checkpoint=None, encode_batch_size=512, insert_batch_size=2000,
+                 checkpoint_every=2000):
+        self.target = target
+        self.encode = encode
+        self.checkpoint = checkpoint
+        self.encode_batch_size = encode_batch_size
+        self.insert_batch_size = insert_batch_size
+        self.checkpoint_every = checkpoint_every
+        self._pending = []  # [(集合名, fulltext_id, 片段, 元数据)]，待编码
+        self._buffers = {name: [] for name in COLLECTIONS.values()}  # 待插入的行（向量保持为 NumPy 行）
+        self.stats = {'paragraphs': 0, 'windows': 0, 'inserted': 0, 'encode_ms': 0.0, 'insert_ms': 0.0,
+                      'last_full_text_id': None}
+
+    def add_paragraph(self, row):
+        """:param row: FULLTEXT_METADATA_SQL 的一行"""
+        fulltext_id, paragraph = row[0], row[1]
+        metadata = dict(zip(METADATA_NAMES, metadata_values(row)))
+        for size, windows in window_texts(paragraph or "").items():
+            for text in windows:
+                self._pending.append((COLLECTIONS[size], fulltext_id, clip_sentence(text), metadata))
+        self.stats['paragraphs'] += 1
+        self.stats['last_full_text_id'] = fulltext_id
+        if len(self._pending) >= self.encode_batch_size:
+            self._encode_pending()
+
+    def _encode_pending(self):
+        if not self._pending:
+            return
+        start = time.monotonic()
+        vectors = self.encode([sentence for _, _, sentence, _ in self._pending])
+        self.stats['encode_ms'] += (time.monotonic() - start) * 1000
+        self.stats['windows'] += len(self._pending)
+        for (name, fulltext_id, sentence, metadata), vector in zip(self._pending, vectors):
+            self._buffers[name].append((fulltext_id, sentence, metadata, vector))
+        self._pending = []
+        for name, buffer in self._buffers.items():
+            if len(buffer) >= self.insert_batch_size:
+                self._insert(name)
+
+    def _insert(self, name):
+        buffer, self._buffers[name] = self._buffers[name], []
+        if not buffer:
+            return
+        start = time.monotonic()
+        for offset in range(0, len(buffer), self.insert_batch_size):
+            self.target.insert(name, [
+                dict(metadata, fulltext_id=fulltext_id, sentence=sentence, embedding=vector.tolist())
+                for fulltext_id, sentence, metadata, vector in buffer[offset:offset + self.insert_batch_size]
+            ])
+        self.stats['insert_ms'] += (time.monotonic() - start) * 1000
+        self.stats['inserted'] += len(buffer)
+
+    def commit(self):
+        """写入全部缓冲区并 flush，然后记录检查点"""
+        self._encode_pending()
+        for name in self._buffers:
+            self._insert(name)
+        self.target.flush()
+        if self.checkpoint is not None and self.stats['last_full_text_id'] is not None:
+            self.checkpoint.save(**self.stats)
+
+    def run(self, rows):
+        """:param rows: 按 full_text_id 升序的 FULLTEXT_METADATA_SQL 行"""
+        since_commit = 0
+        started = time.monotonic()
+        for row in rows:
+            self.add_paragraph(row)
+            since_commit += 1
+            if since_commit >= self.checkpoint_every:
+                self.commit()
+                since_commit = 0
+                elapsed = time.monotonic() - started
+                logger.info(f"已处理 {self.stats['paragraphs']} 段全文（至 full_text_id={self.stats['last_full_text_id']}），"
+                            f"{self.stats['windows']} 个片段，{self.stats['windows'] / elapsed:.0f} 片段/秒")
+        self.commit()
+        return self.stats
+
+
+def resume_point(target, checkpoint, restart=False):
+    """
+    确定起点并清理残留：返回从哪个 full_text_id 之后继续。
+    检查点之后已写入（上次崩溃前未记录检查点）的向量会被删除，避免重复；
+    还没有检查点（第一次检查点之前就崩溃）时从 0 开始，集合中已写入的向量全部删除。
+    """
+    names = list(COLLECTIONS.values())
+    if restart:
+        checkpoint.clear()
+        target.prepare(names, drop=True)
+        return 0
+    target.prepare(names)
+    last_id = checkpoint.load().get('last_full_text_id') or 0
+    for name in names:
+        target.delete(name, f"fulltext_id > {int(last_id)}")
+    target.flush()
+    return last_id
+
+
+def stream_fulltext_rows(after_id, limit=None):
+    """用服务端游标按 full_text_id 升序流式读取全文及文献元数据"""
+    import pymysql
+    from utils.database import connect_db
+
+    conn = connect_db(pooled=False, cursorclass=pymysql.cursors.SSCursor)
+    try:
+        with conn.cursor() as cursor:
+            # 编码较慢时客户端读取间隔较长，放宽服务端写超时，避免流式读取被中断
+            cursor.execute("SET SESSION net_write_timeout = 3600")
+            sql = FULLTEXT_METADATA_SQL + " WHERE ft.full_text_id > %s ORDER BY ft.full_text_id"
+            params = [after_id]
+            if limit:
+                sql += " LIMIT %s"
+                params.append(limit)
+            cursor.execute(sql, params)
+            for row in cursor:
+                yield row
+    finally:
+        conn.close()
+
+
+def build_encoder(model_batch_size):
+    """加载模型（不经过 Web 进程的编码服务），返回 文本列表 -> 已归一化向量矩阵 的函数"""
+    from utils.embedding import embedding_config, load_sentence_model, normalize_rows
+
+    model_config = embedding_config()
+    model = load_sentence_model(model_config['MODEL_PATH'], model_config['FALLBACK_MODEL'], model_config['DEVICE'])
+
+    def encode(texts):
+        return normalize_rows(model.encode(texts, batch_size=model_batch_size, convert_to_numpy=True))
+    return encode
+
+
+def main(argv=None):
+    from utils.milvus_client import milvus_config, numpy_store_dir
+
+    parser = argparse.ArgumentParser(description="流式生成 yongle_* 句向量集合（可断点续跑）")
+    parser.add_argument("--restart", action="store_true", help="删除并重建全部集合，忽略检查点")
+    parser.add_argument("--limit", type=int, default=None, help="本次最多处理的全文段数")
+    parser.add_argument("--target", choices=["milvus", "numpy"], default="milvus",
+                        help="写入 Milvus 或本地 NumPy 向量库")
+    args = parser.parse_args(argv)
+
+    config = ingest_config()
+    milvus = milvus_config()
+    if args.target == "numpy":
+        from utils.vector_store import NumpyTarget
+
+        checkpoint = Checkpoint(os.path.splitext(config['CHECKPOINT_FILE'])[0] + "_numpy.json")
+        target = NumpyTarget(numpy_store_dir(milvus))
+    else:
+        checkpoint = Checkpoint(config['CHECKPOINT_FILE'])
+        target = MilvusTarget(milvus['HOST'], milvus['PORT'], milvus['ALIAS'])
+    after_id = resume_point(target, checkpoint, restart=args.restart)
+    print(f"[INFO] 从 full_text_id > {after_id} 开始")
+
+    pipeline = IngestPipeline(target, build_encoder(config['MODEL_BATCH_SIZE']), checkpoint,
+                              encode_batch_size=config['ENCODE_BATCH_SIZE'],
+                              insert_batch_size=config['INSERT_BATCH_SIZE'],
+                              checkpoint_every=config['CHECKPOINT_EVERY'])
+    started = time.monotonic()
+    stats = pipeline.run(stream_fulltext_rows(after_id, args.limit))
+    print(f"[SUCCESS] 处理 {stats['paragraphs']} 段全文、写入 {stats['inserted']} 个片段，"
+          f"耗时 {time.monotonic() - started:.0f} 秒（编码 {stats['encode_ms'] / 1000:.0f} 秒，"
+          f"插入 {stats['insert_ms'] / 1000:.0f} 秒）")
+    if args.target == "milvus":
+        print("[INFO] 请运行 python -m utils.milvus2 创建索引并加载集合")
+
+
+if __name__ == "__main__":
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'leishu_server.settings')
+    django.setup()
+    main()
@@ -0,0 +1,132 @@
+"""
+yongle_* 向量集合的结构定义（建库脚本与检索共用）
+
+每个集合存放一种滑动窗口大小（1~4 句）的句子片段。除向量外还冗余存放文献元数据标量字段，
+异文检索的过滤条件可直接翻译成 Milvus 布尔表达式在 ANN 检索中生效，不必检索后再逐条过滤。
+Milvus 标量字段不能为空：category_type 缺失时存 -1，字符串字段缺失时存空串。
+本模块不依赖 Django，pymilvus 只在构建集合结构时导入。
+"""
+# 窗口大小 -> 集合名
+COLLECTIONS = {
+    1: "yongle_1",
+    2: "yongle_2",
+    3: "yongle_3",
+    4: "yongle_4",
+}
+
+EMBEDDING_DIM = 768
+SENTENCE_MAX_LENGTH = 1000
+
+# 标量元数据字段：(字段名, 类型, VARCHAR 最大长度)，与 documents 表列同名
+METADATA_FIELDS = [
+    ("doc_id", "INT64", None),
+    ("category_type", "INT64", None),
+    ("doc_specific_category", "VARCHAR", 32),
+    ("doc_style", "VARCHAR", 16),
+    ("compilation_time", "VARCHAR", 100),
+]
+
+MISSING_INT = -1
+
+# 向量索引方案：utils/milvus2.py 按方案建索引，检索按 settings.MILVUS_CONFIG['INDEX_PROFILE'] 取检索参数，两者须一致。
+# rerank 为重排倍数：量化索引先取 rerank * limit 个候选，再用原始 float32 向量精确计算相似度取前 limit 个。
+# 每个向量的索引大小约为：HNSW 4*768 + 2*M*4 ≈ 3.2 KB（含原始向量），IVF_SQ8 768 B，IVF_PQ（m=96）96 B。
+# 量化索引只压缩索引本身：重排要返回原始向量，集合仍保存每个向量 3 KB 的 float32 数据，
+# 因此 mmap 为 True 的方案由 milvus2.py 为集合开启 mmap，原始向量留在磁盘上按需读入页缓存，不常驻内存；
+# 省下的内存以重排时的磁盘读取为代价。对比报告（含原始向量的大小）见 python -m utils.quantization。
+INDEX_PROFILES = {
+    "hnsw": {
+        "index_params": {"metric_type": "COSINE", "index_type": "HNSW", "params": {"M": 16, "efConstruction": 500}},
+        "search_params": {"metric_type": "COSINE", "params": {"ef": 100}},
+        "rerank": 0,
+        "mmap": False,
+    },
+    "ivf_sq8": {
+        "index_params": {"metric_type": "COSINE", "index_type": "IVF_SQ8", "params": {"nlist": 1024}},
+        "search_params": {"metric_type": "COSINE", "params": {"nprobe": 32}},
+        "rerank": 3,
+        "mmap": True,
+    },
+    "ivf_pq": {
+        # m 须整除向量维数：768 / 96 = 每个子空间 8 维，每个向量 96 字节
+        "index_params": {"metric_type": "COSINE", "index_type": "IVF_PQ",
+                         "params": {"nlist": 1024, "m": 96, "nbits": 8}},
+        "search_params": {"metric_type": "COSINE", "params": {"nprobe": 32}},
+        "rerank": 5,
+        "mmap": True,
+    },
+}
+
+# 建库时按全文取文献元数据（列顺序与 METADATA_FIELDS 一致，空值已替换）
+FULLTEXT_METADATA_SQL = """
+    SELECT ft.full_text_id, ft.full_text, ft.doc_id,
+           COALESCE(d.category_type, -1) AS category_type,
+           COALESCE(d.doc_specific_category, '') AS doc_specific_category,
+           COALESCE(d.doc_style, '') AS doc_style,
+           COALESCE(d.compilation_time, '') AS compilation_time
+    FROM full_text_1 ft
+    LEFT JOIN documents d ON d.doc_id = ft.doc_id
+"""
+
+
+def collection_schema(name):
+    """构建集合结构：自增主键 + fulltext_id + sentence + 元数据标量字段 + 向量"""
+    from pymilvus import CollectionSchema, DataType, FieldSchema
+
+    fields = [
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+        FieldSchema(name="fulltext_id", dtype=DataType.INT64),
+        FieldSchema(name="sentence", dtype=DataType.VARCHAR, max_length=SENTENCE_MAX_LENGTH),
+    ]
+    for field_name, dtype, max_length in METADATA_FIELDS:
+        if dtype == "VARCHAR":
+            fields.append(FieldSchema(name=field_name, dtype=DataType.VARCHAR, max_length=max_length))
+        else:
+            fields.append(FieldSchema(name=field_name, dtype=getattr(DataType, dtype)))
+    fields.append(FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=EMBEDDING_DIM))
+    return CollectionSchema(fields, description=f"{name} 向量数据库")
+
+
+def metadata_values(row):
+    """从 FULLTEXT_METADATA_SQL 的一行（元组）取出元数据字段值"""
+    return list(row[2:2 + len(METADATA_FIELDS)])
+
+
+SENTENCE_DELIMITERS = "，。"
+MAX_WINDOW = max(COLLECTIONS)
+
+
+def segment_sentences(text):
+    """按 ， 和 。 切分句子（保留标点），建库与检索使用同一切分方式"""
+    sentences = []
+    current = ""
+    for char in text:
+        current += char
+        if char in SENTENCE_DELIMITERS:
+            sentences.append(current.strip())
+            current = ""
+    if current.strip():
+        sentences.append(current.strip())
+    return [sentence for sentence in sentences if sentence]
+
+
+def sliding_windows(sentences, window_size):
+    """把句子组合为 window_size 句的重叠片段（步长为 1），句子不足时返回空列表"""
+    if len(sentences) < window_size:
+        return []
+    return ["".join(sentences[i:i + window_size]) for i in range(len(sentences) - window_size + 1)]
+
+
+def clip_sentence(sentence, max_bytes=SENTENCE_MAX_LENGTH):
+    """VARCHAR 的 max_length 按 UTF-8 字节计，超长片段截断（不截断半个字符）"""
+    data = sentence.encode("utf-8")
+    if len(data) <= max_bytes:
+        return sentence
+    return data[:max_bytes].decode("utf-8", errors="ignore")
+
+
+def window_texts(paragraph):
+    """一段全文在各集合中的片段：{窗口大小: [片段, ...]}（窗口大小为 1 时即单句）"""
+    sentences = segment_sentences(paragraph)
+    return {size: sliding_windows(sentences, size) for size in COLLECTIONS}
+
@@ -0,0 +1,448 @@
+"""
+本地精确检索引擎（NumPy）
+
+每个 yongle_* 集合对应存储目录（默认 BASE_DIR/vector_index/store/）下的一个子目录，
+与 Milvus 类似按段（segment）存放，每次 flush 写入一个新段，段写入后不再修改，删除只记墓碑：
+    <集合名>/seg_000001/
+        embedding.npy                  float32 (n, 768)，以内存映射方式打开
+        fulltext_id.npy、doc_id.npy、category_type.npy         int64
+        doc_specific_category.npy 等字符串字段                  int32 字典编码，字典在 vocab.json
+        sentence.bin + sentence_offsets.npy                     句子 UTF-8 拼接及偏移
+        deleted.npy                    有删除时的墓碑
+检索逐段、逐块（CHUNK_ROWS 行）做矩阵乘法，每块用 argpartition 取前 k 再合并，结果与暴力检索一致；
+过滤表达式（build_filter_expr 生成的写法）按列向量化求值，字符串字段只在字典上求值。
+
+用途：
+- Milvus 不可用（或未安装 pymilvus）时的后备检索：MILVUS_CONFIG['FALLBACK_BACKEND'] = 'numpy'
+- 召回率基准的精确结果（ground truth）
+- 离线开发：MILVUS_CONFIG['BACKEND'] = 'numpy'
+
+生成方式（项目根目录）：
+    python -m utils.vector_store export              # 从 Milvus 导出全部集合
+    python -m utils.vector_ingest --target numpy     # 由建库流水线直接写入
+    python -m utils.vector_store info                # 查看各集合的段数和向量数
+"""
+import argparse
+import json
+import operator
+import os
+import re
+import shutil
+import threading
+import time
+
+import numpy as np
+
+# utils.milvus_client 在导入时读取 settings，作为脚本运行时须在 django.setup() 之后才能导入，这里在用到时导入
+from utils.vector_schema import COLLECTIONS, METADATA_FIELDS, MISSING_INT
+
+INT_FIELDS = ["fulltext_id"] + [name for name, dtype, _ in METADATA_FIELDS if dtype == "INT64"]
+STR_FIELDS = [name for name, dtype, _ in METADATA_FIELDS if dtype == "VARCHAR"]
+CHUNK_ROWS = 65536  # 每次矩阵乘法的行数（768 维约 192 MB 内存映射页）
+SEGMENT_ROWS = 100000  # 写入时每段最多的行数
+SEGMENT_ID_BITS = 32  # 主键 = 段号 << 32 | 段内行号
+
+_ATOM = re.compile(
+    r'(\w+)\s+like\s+("(?:[^"\\]|\\.)*")'
+    r'|(\w+)\s+in\s+(\[[^\]]*\])'
+    r'|(\w+)\s*(==|!=|>=|<=|>|<)\s*("(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?)',
+    re.IGNORECASE)
+_STRING = re.compile(r'("(?:[^"\\]|\\.)*")')
+_OPERATORS = {"==": operator.eq, "!=": operator.ne, ">=": operator.ge, "<=": operator.le,
+              ">": operator.gt, "<": operator.lt}
+
+
+def compile_array_expr(expr):
+    """
+    把 Milvus 布尔表达式编译为按段求值的函数（返回布尔数组），语义与 milvus_client.compile_expr 一致。
+    每个比较先改写为列函数调用并加括号，再把 and/or/not 换成按位运算。
+    """
+    if not expr:
+        return None
+
+    def atom(m):
+        if m.group(1):
+            return f'(_like("{m.group(1)}", {m.group(2)}))'
+        if m.group(3):
+            return f'(_in("{m.group(3)}", {m.group(4)}))'
+        return f'(_cmp("{m.group(5)}", "{m.group(6)}", {m.group(7)}))'
+
+    parts = _STRING.split(_ATOM.sub(atom, expr))
+    for i in range(0, len(parts), 2):  # 只改写字符串字面量之外的部分
+        part = parts[i].replace("&&", " & ").replace("||", " | ")
+        part = re.sub(r"\band\b", "&", part, flags=re.IGNORECASE)
+        part = re.sub(r"\bor\b", "|", part, flags=re.IGNORECASE)
+        parts[i] = re.sub(r"\bnot\b|!(?!=)", "~", part, flags=re.IGNORECASE)
+    code = compile("".join(parts), "<milvus-expr>", "eval")
+
+    def evaluate(segment):
+        functions = {"_cmp": segment.compare, "_in": segment.isin, "_like": segment.like}
+        return np.asarray(eval(code, {"__builtins__": {}}, functions), dtype=bool)
+    return evaluate
+
+
+def _save_npy(path, array):
+    """先写临时文件再替换"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class Segment:
+    """一个只读段；只有墓碑（deleted.npy）会被更新"""
+    def __init__(self, path, number):
+        self.path = path
+        self.id_base = number << SEGMENT_ID_BITS
+        self.embedding = np.load(os.path.join(path, "embedding.npy"), mmap_mode="r")
+        self.size = len(self.embedding)
+        self.ints = {field: np.load(os.path.join(path, f"{field}.npy")) for field in INT_FIELDS}
+        self.codes = {field: np.load(os.path.join(path, f"{field}.npy")) for field in STR_FIELDS}
+        with open(os.path.join(path, "vocab.json"), encoding="utf-8") as f:
+            self.vocab = json.load(f)
+        self.sentence_offsets = np.load(os.path.join(path, "sentence_offsets.npy"))
+        blob_path = os.path.join(path, "sentence.bin")
+        self.sentence_blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else b""
+        deleted_path = os.path.join(path, "deleted.npy")
+        self.deleted = np.load(deleted_path) if os.path.exists(deleted_path) else np.zeros(self.size, dtype=bool)
+
+    @staticmethod
+    def write(path, rows):
+        """把行字典（字段见 utils/vector_schema.py，embedding 为已归一化向量）写成一个新段"""
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, "embedding.npy"),
+                np.asarray([row["embedding"] for row in rows], dtype=np.float32))
+        for field in INT_FIELDS:
+            np.save(os.path.join(tmp_path, f"{field}.npy"),
+                    np.asarray([row.get(field, MISSING_INT) for row in rows], dtype=np.int64))
+        vocab = {}
+        for field in STR_FIELDS:
+            values = [row.get(field) or "" for row in rows]
+            vocab[field] = sorted(set(values))
+            index = {value: i for i, value in enumerate(vocab[field])}
+            np.save(os.path.join(tmp_path, f"{field}.npy"), np.asarray([index[v] for v in values], dtype=np.int32))
+        with open(os.path.join(tmp_path, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(vocab, f, ensure_ascii=False)
+        encoded = [(row.get("sentence") or "").encode("utf-8") for row in rows]
+        np.save(os.path.join(tmp_path, "sentence_offsets.npy"),
+                np.concatenate([[0], np.cumsum([len(b) for b in encoded], dtype=np.int64)]))
+        with open(os.path.join(tmp_path, "sentence.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+        os.replace(tmp_path, path)  # 段整体出现，读者不会看到写了一半的段
+
+    def live(self):
+        return ~self.deleted
+
+    def int_column(self, field):
+        if field == "id":
+            return self.id_base + np.arange(self.size, dtype=np.int64)
+        if field not in self.ints:
+            raise ValueError(f"本地向量库不支持按字段 {field} 过滤")
+        return self.ints[field]
+
+    def _vocab_mask(self, field, predicate):
+        vocab_mask = np.fromiter((bool(predicate(value)) for value in self.vocab[field]), dtype=bool,
+                                 count=len(self.vocab[field]))
+        return vocab_mask[self.codes[field]] if len(vocab_mask) else np.zeros(self.size, dtype=bool)
+
+    def compare(self, field, op, value):
+        compare = _OPERATORS[op]
+        if field in self.codes:
+            return self._vocab_mask(field, lambda v: isinstance(value, str) and compare(v, value))
+        return compare(self.int_column(field), value)
+
+    def isin(self, field, values):
+        if field in self.codes:
+            values = set(values)
+            return self._vocab_mask(field, lambda v: v in values)
+        return np.isin(self.int_column(field), values)
+
+    def like(self, field, pattern):
+        from utils.milvus_client import like_match
+
+        if field in self.codes:
+            return self._vocab_mask(field, lambda v: like_match(v, pattern))
+        return np.fromiter((like_match(v, pattern) for v in self.int_column(field)), dtype=bool, count=self.size)
+
+    def value(self, field, row):
+        if field == "id":
+            return self.id_base + int(row)
+        if field == "sentence":
+            return bytes(self.sentence_blob[self.sentence_offsets[row]:self.sentence_offsets[row + 1]]).decode("utf-8")
+        if field == "embedding":
+            return self.embedding[row].tolist()
+        if field in self.codes:
+            return self.vocab[field][self.codes[field][row]]
+        return int(self.ints[field][row])
+
+    def delete(self, mask):
+        """标记删除，返回新删除的行数"""
+        newly = mask & ~self.deleted
+        count = int(newly.sum())
+        if count:
+            self.deleted = self.deleted | newly
+            _save_npy(os.path.join(self.path, "deleted.npy"), self.deleted)
+        return count
+
+
+class VectorStore:
+    """一个集合的本地存储，接口与 pymilvus Collection / LocalCollection 一致（load、search、query、insert、delete）"""
+    def __init__(self, root, name):
+        self.name = name
+        self.path = os.path.join(root, name)
+        self.segments = []
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def _segment_numbers(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(int(entry[4:]) for entry in os.listdir(self.path)
+                      if entry.startswith("seg_") and entry[4:].isdigit())
+
+    def load(self):
+        if not os.path.isdir(self.path):
+            raise FileNotFoundError(f"本地向量库 {self.path} 不存在，请先运行 python -m utils.vector_store export")
+        with self._lock:
+            self.segments = [Segment(os.path.join(self.path, f"seg_{number:06d}"), number)
+                             for number in self._segment_numbers()]
+            self.loaded = True
+
+    def release(self):
+        with self._lock:
+            self.segments = []
+            self.loaded = False
+
+    def drop(self):
+        self.release()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    @property
+    def num_entities(self):
+        return sum(int(segment.live().sum()) for segment in self.segments)
+
+    def _require_loaded(self):
+        if not self.loaded:
+            raise RuntimeError(f"集合 {self.name} 未加载")
+
+    def insert(self, rows):
+        """每次调用写入一个新段"""
+        rows = list(rows)
+        if not rows:
+            return 0
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            number = max(self._segment_numbers(), default=0) + 1
+            segment_path = os.path.join(self.path, f"seg_{number:06d}")
+            Segment.write(segment_path, rows)
+            if self.loaded:
+                self.segments.append(Segment(segment_path, number))
+        return len(rows)
+
+    def delete(self, expr):
+        if not self.loaded:
+            self.load()
+        matches = compile_array_expr(expr)
+        with self._lock:
+            return sum(segment.delete(matches(segment) if matches else np.ones(segment.size, dtype=bool))
+                       for segment in self.segments)
+
+    @staticmethod
+    def _mask(segment, matches):
+        mask = segment.live()
+        if matches is not None:
+            mask &= matches(segment)
+        return mask
+
+    def query(self, expr, output_fields=None, limit=None):
+        self._require_loaded()
+        matches = compile_array_expr(expr)
+        fields = ["id"] + [field for field in (output_fields or []) if field != "id"]
+        rows = []
+        for segment in self.segments:
+            for row in np.flatnonzero(self._mask(segment, matches)):
+                if limit is not None and len(rows) >= limit:
+                    return rows
+                rows.append({field: segment.value(field, row) for field in fields})
+        return rows
+
+    def search(self, data, anns_field, param, limit, expr=None, output_fields=None, timeout=None):
+        """精确检索：内积（向量已归一化即余弦），param 中的索引参数和 timeout 不起作用"""
+        from utils.milvus_client import LocalHit
+
+        self._require_loaded()
+        queries = np.asarray(data, dtype=np.float32).reshape(len(data), -1)
+        matches = compile_array_expr(expr)
+        scores_parts, segment_parts, row_parts = [], [], []
+        for position, segment in enumerate(self.segments):
+            mask = self._mask(segment, matches)
+            for start in range(0, segment.size, CHUNK_ROWS):
+                chunk_mask = mask[start:start + CHUNK_ROWS]
+                if chunk_mask.all():
+                    rows = np.arange(start, start + len(chunk_mask))
+                    block = segment.embedding[start:start + len(chunk_mask)]
+                else:
+                    rows = np.flatnonzero(chunk_mask) + start
+                    if not len(rows):
+                        continue
+                    block = segment.embedding[rows]
+                scores = np.asarray(block) @ queries.T  # (行数, 查询数)
+                take = min(limit, len(rows))
+                top = np.argpartition(-scores, take - 1, axis=0)[:take]
+                scores_parts.append(np.take_along_axis(scores, top, axis=0).T)
+                segment_parts.append(np.full((len(queries), take), position))
+                row_parts.append(rows[top].T)
+        if not scores_parts:
+            return [[] for _ in range(len(queries))]
+
+        all_scores = np.concatenate(scores_parts, axis=1)
+        all_segments = np.concatenate(segment_parts, axis=1)
+        all_rows = np.concatenate(row_parts, axis=1)
+        take = min(limit, all_scores.shape[1])
+        top = np.argpartition(-all_scores, take - 1, axis=1)[:, :take]
+        order = np.argsort(-np.take_along_axis(all_scores, top, axis=1), axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        results = []
+        for q in range(len(queries)):
+            hits = []
+            for i in top[q]:
+                segment, row = self.segments[all_segments[q, i]], all_rows[q, i]
+                hits.append(LocalHit(segment.value("id", row), float(all_scores[q, i]),
+                                     {field: segment.value(field, row) for field in (output_fields or [])}))
+            results.append(hits)
+        return results
+
+
+class NumpyBackend:
+    """MilvusManager 的本地后端：集合即存储目录下的 VectorStore"""
+    def __init__(self, root):
+        self.root = root
+        self._stores = {}
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def get_collection(self, name):
+        if name not in self._stores:
+            self._stores[name] = VectorStore(self.root, name)
+        return self._stores[name]
+
+
+class NumpyTarget:
+    """建库写入目标（与 utils.vector_ingest 的 MilvusTarget 接口一致），攒够 SEGMENT_ROWS 行或 flush 时写段"""
+    def __init__(self, root, segment_rows=SEGMENT_ROWS):
+        self.root = root
+        self.segment_rows = segment_rows
+        self._stores = {}
+        self._buffers = {}
+
+    def prepare(self, names, drop=False, load=False):
+        for name in names:
+            store = VectorStore(self.root, name)
+            if drop:
+                store.drop()
+            os.makedirs(store.path, exist_ok=True)
+            store.load()
+            self._stores[name] = store
+            self._buffers[name] = []
+
+    def insert(self, name, rows):
+        buffer = self._buffers[name]
+        buffer.extend(rows)
+        if len(buffer) >= self.segment_rows:
+            self._write(name)
+
+    def _write(self, name):
+        if self._buffers[name]:
+            self._stores[name].insert(self._buffers[name])
+            self._buffers[name] = []
+
+    def query(self, name, expr, output_fields):
+        self._write(name)
+        return self._stores[name].query(expr, output_fields=output_fields)
+
+    def delete(self, name, expr):
+        self._write(name)
+        self._stores[name].delete(expr)
+
+    def flush(self):
+        for name in self._buffers:
+            self._write(name)
+
+
+def export_collection(manager, name, root, batch_size=10000):
+    """把 Milvus 集合导出为本地存储：先写到临时目录，完成后替换旧目录"""
+    collection = manager.collection(name)
+    fields = ["fulltext_id", "sentence", "embedding"] + [field for field, _, _ in METADATA_FIELDS]
+    schema = getattr(collection, "schema", None)
+    if schema is not None:  # 旧结构的集合没有元数据字段
+        present = {field.name for field in schema.fields}
+        fields = [field for field in fields if field in present]
+
+    tmp_name = f"{name}.export"
+    target = NumpyTarget(root)
+    target.prepare([tmp_name], drop=True)
+    count = 0
+    if hasattr(collection, "query_iterator"):
+        iterator = collection.query_iterator(batch_size=batch_size, expr="id >= 0", output_fields=fields)
+        while True:
+            batch = iterator.next()
+            if not batch:
+                break
+            target.insert(tmp_name, batch)
+            count += len(batch)
+        iterator.close()
+    else:
+        rows = collection.query("id >= 0", output_fields=fields)
+        for start in range(0, len(rows), batch_size):
+            target.insert(tmp_name, rows[start:start + batch_size])
+        count = len(rows)
+    target.flush()
+
+    final_path = os.path.join(root, name)
+    shutil.rmtree(final_path, ignore_errors=True)
+    os.replace(os.path.join(root, tmp_name), final_path)
+    return count
+
+
+def main(argv=None):
+    from utils.milvus_client import get_milvus_manager, milvus_config, numpy_store_dir
+
+    parser = argparse.ArgumentParser(description="本地 NumPy 向量库（Milvus 后备检索及召回基准的精确结果）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="从 Milvus 导出集合")
+    export.add_argument("--collections", nargs="*", default=list(COLLECTIONS.values()))
+    export.add_argument("--batch-size", type=int, default=10000)
+    subparsers.add_parser("info", help="查看各集合的段数和向量数")
+    args = parser.parse_args(argv)
+
+    root = numpy_store_dir(milvus_config())
+    if args.command == "export":
+        manager = get_milvus_manager()
+        for name in args.collections:
+            started = time.monotonic()
+            count = export_collection(manager, name, root, args.batch_size)
+            print(f"[SUCCESS] {name} 导出 {count} 个向量，耗时 {time.monotonic() - started:.0f} 秒")
+        print(f"[INFO] 本地向量库位于 {root}")
+        return
+    for name in COLLECTIONS.values():
+        store = VectorStore(root, name)
+        try:
+            store.load()
+        except FileNotFoundError:
+            print(f"{name}: 不存在")
+            continue
+        print(f"{name}: {len(store.segments)} 段，{store.num_entities} 个向量")
+
+
+if __name__ == "__main__":
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'leishu_server.settings')
+    django.setup()
+    main()
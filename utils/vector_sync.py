@@ -0,0 +1,212 @@
+"""
+句向量增量同步
+
+过去新导入的全文只能重跑整张 full_text_1 的建库，再由 milvus2.py 删除并重建全部 HNSW 索引。
+这里按变更日志增量同步（日志表和触发器见 utils/vector_sync.sql）：
+- 按 log_id 顺序分批读取 fulltext_vector_log，同一 full_text_id 的多条日志合并为最终操作
+- upsert：删除该全文的旧向量，重新切分、编码、插入（编码和插入复用 utils.vector_ingest.IngestPipeline）
+- delete：删除该全文的全部向量
+- meta：文献过滤字段变化，取出已有向量换上新元数据后重新插入，不重新编码
+- 每批处理完 flush 后删除这批日志（消费即删除，不用 log_id 水位：自增 ID 按分配顺序而非提交顺序，
+  较小的 log_id 可能在较大的之后才提交，水位会把它永久跳过）；中断后重跑会重放未删除的日志，处理是幂等的
+集合主键自增，Milvus 中的“更新”即先删除再插入；新数据进入增长段后即可检索，
+索引由 Milvus 在段封存时自动构建，不需要重建。
+
+用法（项目根目录）：
+    python -m utils.vector_sync             # 同步到最新日志后退出（适合 cron）
+    python -m utils.vector_sync --watch 60  # 每 60 秒同步一次
+    python -m utils.vector_sync --reset     # 全量建库后执行：清空已有的变更日志
+"""
+from django.conf import settings
+import argparse
+import logging
+import os
+import time
+
+from utils.vector_ingest import METADATA_NAMES, IngestPipeline
+from utils.vector_schema import COLLECTIONS, FULLTEXT_METADATA_SQL, metadata_values
+
+logger = logging.getLogger(__name__)
+
+# 可在 settings.VECTOR_SYNC 中覆盖（作为脚本运行时模块先于 django.setup() 导入，这里不能读取 settings）
+DEFAULT_SYNC_CONFIG = {
+    'BATCH_SIZE': 500,  # 每批读取的日志条数
+    'ID_CHUNK_SIZE': 20,  # 按 fulltext_id 删除/查询向量时每次的 ID 数
+}
+
+UPSERT, DELETE, META = "upsert", "delete", "meta"
+
+
+def sync_config():
+    config = dict(DEFAULT_SYNC_CONFIG)
+    config.update(getattr(settings, 'VECTOR_SYNC', {}))
+    return config
+
+
+def collapse_ops(log_rows):
+    """
+    :param log_rows: [(log_id, full_text_id, op)]，按 log_id 升序
+    :return: {full_text_id: 最终操作}；以最后一条为准，但 upsert 之后的 meta 仍需重新编码（保持 upsert）
+    """
+    final = {}
+    for _, full_text_id, op in log_rows:
+        if op == META and final.get(full_text_id) == UPSERT:
+            continue
+        final[full_text_id] = op
+    return final
+
+
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _in_expr(full_text_ids):
+    return f"fulltext_id in [{', '.join(str(int(fid)) for fid in full_text_ids)}]"
+
+
+class VectorSync:
+    """
+    :param conn: MySQL 连接（元组游标）
+    :param target: utils.vector_ingest 的 MilvusTarget / LocalTarget，集合需已加载（meta 需要查询已有向量）
+    :param encode: 文本列表 -> 已归一化向量矩阵
+    """
+    def __init__(self, conn, target, encode, batch_size=500, id_chunk_size=20):
+        self.conn = conn
+        self.target = target
+        self.encode = encode
+        self.batch_size = batch_size
+        self.id_chunk_size = id_chunk_size
+
+    def fetch_log(self):
+        """最早的一批未处理日志"""
+        with self.conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT log_id, full_text_id, op FROM fulltext_vector_log
+                ORDER BY log_id LIMIT %s
+            """, (self.batch_size,))
+            return list(cursor.fetchall())
+
+    def consume_log(self, log_rows):
+        """删除已处理的日志并提交（同时结束读快照，下一批能看到新提交的日志）"""
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"DELETE FROM fulltext_vector_log WHERE log_id IN ({', '.join(['%s'] * len(log_rows))})",
+                           tuple(row[0] for row in log_rows))
+        self.conn.commit()
+
+    def fetch_rows(self, full_text_ids):
+        """{full_text_id: FULLTEXT_METADATA_SQL 行}，已删除的全文不在结果中"""
+        rows = {}
+        with self.conn.cursor() as cursor:
+            for chunk in _chunks(sorted(full_text_ids), 500):
+                cursor.execute(FULLTEXT_METADATA_SQL + f" WHERE ft.full_text_id IN ({', '.join(['%s'] * len(chunk))})",
+                               tuple(chunk))
+                rows.update((row[0], row) for row in cursor.fetchall())
+        return rows
+
+    def _existing_vectors(self, full_text_ids):
+        """{集合名: [已有的行]}，用于只更新元数据"""
+        existing = {}
+        for name in COLLECTIONS.values():
+            existing[name] = []
+            for chunk in _chunks(full_text_ids, self.id_chunk_size):
+                existing[name] += self.target.query(name, _in_expr(chunk), ["fulltext_id", "sentence", "embedding"])
+        return existing
+
+    def apply(self, ops):
+        """执行一批合并后的操作，返回各类操作的全文数"""
+        rows = self.fetch_rows([fid for fid, op in ops.items() if op != DELETE])
+        metas = [fid for fid, op in ops.items() if op == META and fid in rows]
+        existing = self._existing_vectors(metas) if metas else {}
+        copied = {fid for rows_ in existing.values() for fid in (row["fulltext_id"] for row in rows_)}
+        # 从未入库的全文（或已被删除的向量）无法复制，改为重新编码
+        reencode = sorted(fid for fid, op in ops.items() if fid in rows and (op == UPSERT or fid not in copied))
+
+        affected = sorted(ops)
+        for name in COLLECTIONS.values():
+            for chunk in _chunks(affected, self.id_chunk_size):
+                self.target.delete(name, _in_expr(chunk))
+
+        for name, old_rows in existing.items():
+            new_rows = []
+            for old in old_rows:
+                metadata = dict(zip(METADATA_NAMES, metadata_values(rows[old["fulltext_id"]])))
+                new_rows.append(dict(metadata, fulltext_id=old["fulltext_id"], sentence=old["sentence"],
+                                     embedding=old["embedding"]))
+            if new_rows:
+                self.target.insert(name, new_rows)
+
+        pipeline = IngestPipeline(self.target, self.encode)
+        pipeline.run(rows[fid] for fid in reencode)  # 结束时 flush
+        return {
+            "reencoded": len(reencode),
+            "metadata_updated": len(copied),
+            "deleted": sum(1 for fid in affected if fid not in rows),
+            "windows": pipeline.stats["inserted"],
+        }
+
+    def run_once(self):
+        """处理完当前全部日志，返回累计统计"""
+        totals = {"log_rows": 0, "reencoded": 0, "metadata_updated": 0, "deleted": 0, "windows": 0}
+        try:
+            while True:
+                log_rows = self.fetch_log()
+                if not log_rows:
+                    break
+                stats = self.apply(collapse_ops(log_rows))
+                self.consume_log(log_rows)  # apply 已 flush，向量写入后才删除日志
+                totals["log_rows"] += len(log_rows)
+                for key, value in stats.items():
+                    totals[key] += value
+        finally:
+            self.conn.commit()  # 结束读快照，下一轮能看到新提交的日志
+        return totals
+
+    def reset(self):
+        """清空变更日志（全量建库之后使用，建库已包含这些变更），返回删除的条数"""
+        with self.conn.cursor() as cursor:
+            deleted = cursor.execute("DELETE FROM fulltext_vector_log")
+        self.conn.commit()
+        return deleted
+
+
+def main(argv=None):
+    from utils.database import connect_db
+    from utils.milvus_client import milvus_config
+    from utils.vector_ingest import MilvusTarget, build_encoder, ingest_config
+
+    parser = argparse.ArgumentParser(description="按变更日志增量同步 yongle_* 句向量集合")
+    parser.add_argument("--watch", type=int, default=None, metavar="SECONDS", help="持续运行，每隔指定秒数同步一次")
+    parser.add_argument("--reset", action="store_true", help="只清空变更日志，不做同步")
+    args = parser.parse_args(argv)
+
+    config = sync_config()
+    conn = connect_db(pooled=False)
+    if args.reset:
+        sync = VectorSync(conn, None, None)
+        print(f"[INFO] 已清空 {sync.reset()} 条变更日志")
+        return
+
+    milvus = milvus_config()
+    target = MilvusTarget(milvus['HOST'], milvus['PORT'], milvus['ALIAS'])
+    target.prepare(COLLECTIONS.values(), load=True)
+    sync = VectorSync(conn, target, build_encoder(ingest_config()['MODEL_BATCH_SIZE']),
+                      batch_size=config['BATCH_SIZE'], id_chunk_size=config['ID_CHUNK_SIZE'])
+    while True:
+        started = time.monotonic()
+        totals = sync.run_once()
+        if totals["log_rows"] or args.watch is None:
+            print(f"[INFO] 同步 {totals['log_rows']} 条日志：重新编码 {totals['reencoded']} 段全文"
+                  f"（{totals['windows']} 个片段），更新元数据 {totals['metadata_updated']} 段，"
+                  f"删除 {totals['deleted']} 段，耗时 {time.monotonic() - started:.1f} 秒")
+        if args.watch is None:
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'leishu_server.settings')
+    django.setup()
+    main()
@@ -0,0 +1,49 @@
+-- 句向量增量同步的变更日志：full_text_1 的增删改、documents 过滤字段的修改由触发器记入本表，
+-- python -m utils.vector_sync 按 log_id 顺序读取并同步到 yongle_* 集合（不重建索引），处理完的日志随即删除
+-- 触发器覆盖所有写入路径（ResourceView.process_fulltext_data、execute_sql、手工修改）
+
+USE `leishu_yongle`;
+
+CREATE TABLE IF NOT EXISTS `fulltext_vector_log` (
+  `log_id` bigint unsigned NOT NULL AUTO_INCREMENT,
+  `full_text_id` int unsigned NOT NULL,
+  `op` enum('upsert','delete','meta') NOT NULL COMMENT 'upsert: 重新编码；delete: 删除向量；meta: 只更新元数据标量字段',
+  `created_at` datetime DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`log_id`),
+  KEY `idx_full_text` (`full_text_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+DROP TRIGGER IF EXISTS `trg_full_text_vector_insert`;
+DROP TRIGGER IF EXISTS `trg_full_text_vector_update`;
+DROP TRIGGER IF EXISTS `trg_full_text_vector_delete`;
+DROP TRIGGER IF EXISTS `trg_documents_vector_update`;
+
+DELIMITER ;;
+
+CREATE TRIGGER `trg_full_text_vector_insert` AFTER INSERT ON `full_text_1` FOR EACH ROW
+  INSERT INTO `fulltext_vector_log` (`full_text_id`, `op`) VALUES (NEW.full_text_id, 'upsert');;
+
+-- 只有正文或所属文献变化才需要重新编码（关联关系、页码等更新不影响向量）
+CREATE TRIGGER `trg_full_text_vector_update` AFTER UPDATE ON `full_text_1` FOR EACH ROW
+BEGIN
+  IF NOT (NEW.full_text <=> OLD.full_text) OR NOT (NEW.doc_id <=> OLD.doc_id) THEN
+    INSERT INTO `fulltext_vector_log` (`full_text_id`, `op`) VALUES (NEW.full_text_id, 'upsert');
+  END IF;
+END;;
+
+CREATE TRIGGER `trg_full_text_vector_delete` AFTER DELETE ON `full_text_1` FOR EACH ROW
+  INSERT INTO `fulltext_vector_log` (`full_text_id`, `op`) VALUES (OLD.full_text_id, 'delete');;
+
+-- 文献的过滤字段变化时，该文献全部全文的向量只需更新元数据（不重新编码）
+CREATE TRIGGER `trg_documents_vector_update` AFTER UPDATE ON `documents` FOR EACH ROW
+BEGIN
+  IF NOT (NEW.category_type <=> OLD.category_type)
+     OR NOT (NEW.doc_specific_category <=> OLD.doc_specific_category)
+     OR NOT (NEW.doc_style <=> OLD.doc_style)
+     OR NOT (NEW.compilation_time <=> OLD.compilation_time) THEN
+    INSERT INTO `fulltext_vector_log` (`full_text_id`, `op`)
+    SELECT full_text_id, 'meta' FROM `full_text_1` WHERE doc_id = NEW.doc_id;
+  END IF;
+END;;
+
+DELIMITER ;